@@ -0,0 +1,140 @@
+import hashlib
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import connection
+from rest_framework import status
+from rest_framework.response import Response
+
+DEFAULTS = {
+    'ENABLED': True,
+    'ALIAS': 'default',
+    'TIMEOUT': 300,
+    'LOCK_TIMEOUT': 10,
+    'LOCK_WAIT': 2,
+}
+LOCK_POLL_INTERVAL = 0.05
+STATS_KEY = 'wms:response-cache:stats:{}'
+
+
+def cache_settings():
+    """Return the response cache settings merged over the defaults"""
+    return {**DEFAULTS, **getattr(settings, 'WMS_RESPONSE_CACHE', {})}
+
+
+def get_cache():
+    """Return the cache backend storing responses"""
+    return caches[cache_settings()['ALIAS']]
+
+
+def record(outcome):
+    """Count a cache hit or miss"""
+    cache = get_cache()
+    key = STATS_KEY.format(outcome)
+    cache.add(key, 0, timeout=None)
+    try:
+        cache.incr(key)
+    except ValueError:
+        # Evicted between add and incr, the next request counts again
+        pass
+
+
+def cache_stats():
+    """Return the hit and miss counters of the response cache"""
+    cache = get_cache()
+    return {
+        outcome: cache.get(STATS_KEY.format(outcome), 0)
+        for outcome in ('hit', 'miss')
+    }
+
+
+def reset_cache_stats():
+    """Set the hit and miss counters of the response cache back to zero"""
+    get_cache().delete_many(
+        [STATS_KEY.format(outcome) for outcome in ('hit', 'miss')]
+    )
+
+
+class ResponseCacheMixin:
+    """Cache the data of list and detail responses
+
+    Keys hold the user, the action, the normalized query parameters and
+    the versions of the resources the response is built from, so every
+    write bumping a version makes the stale entries unreachable and they
+    expire on their own. Concurrent misses for one key wait for a single
+    request to compute it instead of all hitting the database.
+
+    Needs ``get_versions()`` from ``ConditionalGetMixin``, which reads the
+    versions before the main query: a response is never cached under a
+    version newer than its data.
+    """
+
+    def get_cache_key(self):
+        """Return the cache key of the current request"""
+        request = self.request
+        parts = [
+            request.accepted_renderer.format,
+            *sorted(f'{name}={value}' for name, value in self.kwargs.items()),
+            *sorted(f'{name}={value}'
+                    for name, values in request.query_params.lists()
+                    for value in values),
+            *sorted(f'{key}@{version}'
+                    for key, (version, _) in self.get_versions().items()),
+        ]
+        digest = hashlib.sha1('\n'.join(parts).encode()).hexdigest()
+
+        return (f'wms:response:{self.basename}:{self.action}:'
+                f'{request.user.id}:{digest}')
+
+    def cached(self, handler, request, *args, **kwargs):
+        """Return the cached response data or compute and store it"""
+        config = cache_settings()
+        # Inside a transaction the response may show uncommitted writes
+        # whose versions are only bumped on commit.
+        if not config['ENABLED'] or connection.in_atomic_block:
+            return handler(request, *args, **kwargs)
+
+        cache = get_cache()
+        key = self.get_cache_key()
+        lock = f'{key}:lock'
+        locked = False
+        data = cache.get(key)
+        if data is None:
+            locked = cache.add(lock, 1, config['LOCK_TIMEOUT'])
+            if not locked:
+                data = self._wait_for(cache, key, config['LOCK_WAIT'])
+        if data is not None:
+            record('hit')
+            response = Response(data)
+            response['X-Cache'] = 'HIT'
+            return response
+
+        record('miss')
+        try:
+            response = handler(request, *args, **kwargs)
+            if response.status_code == status.HTTP_200_OK:
+                cache.set(key, response.data, config['TIMEOUT'])
+        finally:
+            if locked:
+                cache.delete(lock)
+        response['X-Cache'] = 'MISS'
+
+        return response
+
+    def _wait_for(self, cache, key, timeout):
+        """Poll for the entry another request is computing"""
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            time.sleep(LOCK_POLL_INTERVAL)
+            data = cache.get(key)
+            if data is not None:
+                return data
+
+        return None
+
+    def list(self, request, *args, **kwargs):
+        return self.cached(super().list, request, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.cached(super().retrieve, request, *args, **kwargs)
@@ -0,0 +1,93 @@
+import hashlib
+
+from django.utils.http import http_date, parse_etags, parse_http_date_safe
+from rest_framework import status
+from rest_framework.response import Response
+
+from core.versions import get_versions
+
+
+class ConditionalGetMixin:
+    """Answer repeated list and detail reads with 304 Not Modified
+
+    The ETag is derived from the versions of every resource the response
+    is built from, listed in ``version_keys``; ``{user}`` is replaced by
+    the requesting user's id. Checking a conditional request costs one
+    indexed query and never runs the main query or the serializer.
+    """
+    version_keys = ()
+
+    def get_versions(self):
+        """Return the versions of the resources of this response"""
+        if not hasattr(self, '_versions'):
+            keys = [key.format(user=self.request.user.id)
+                    for key in self.version_keys]
+            self._versions = get_versions(keys)
+
+        return self._versions
+
+    def get_etag(self):
+        """Return a strong ETag for the current request"""
+        request = self.request
+        parts = [
+            str(request.user.id),
+            request.path,
+            request.accepted_renderer.format,
+            *sorted(f'{name}={value}'
+                    for name, values in request.query_params.lists()
+                    for value in values),
+            *sorted(f'{key}@{version}'
+                    for key, (version, _) in self.get_versions().items()),
+        ]
+        digest = hashlib.sha1('\n'.join(parts).encode()).hexdigest()
+
+        return f'"{digest}"'
+
+    def get_last_modified(self):
+        """Return the latest change to the resources as a timestamp"""
+        modified = [
+            modified for _, modified in self.get_versions().values()
+            if modified is not None
+        ]
+        if not modified:
+            return None
+
+        return int(max(modified).timestamp())
+
+    def is_not_modified(self, etag, last_modified):
+        """Return True if the client already holds the current response"""
+        if_none_match = self.request.META.get('HTTP_IF_NONE_MATCH')
+        if if_none_match:
+            # If-None-Match uses the weak comparison
+            etags = [tag[2:] if tag.startswith('W/') else tag
+                     for tag in parse_etags(if_none_match)]
+            return '*' in etags or etag in etags
+
+        if_modified_since = parse_http_date_safe(
+            self.request.META.get('HTTP_IF_MODIFIED_SINCE', '')
+        )
+        return (if_modified_since is not None and
+                last_modified is not None and
+                last_modified <= if_modified_since)
+
+    def conditional(self, handler, request, *args, **kwargs):
+        """Run handler unless the client copy is still current"""
+        etag = self.get_etag()
+        last_modified = self.get_last_modified()
+        if self.is_not_modified(etag, last_modified):
+            response = Response(status=status.HTTP_304_NOT_MODIFIED)
+        else:
+            response = handler(request, *args, **kwargs)
+        if response.status_code in (status.HTTP_200_OK,
+                                    status.HTTP_304_NOT_MODIFIED):
+            response['ETag'] = etag
+            if last_modified is not None:
+                response['Last-Modified'] = http_date(last_modified)
+
+        return response
+
+    def list(self, request, *args, **kwargs):
+        return self.conditional(super().list, request, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.conditional(super().retrieve, request, *args, **kwargs)
@@ -0,0 +1,153 @@
+import functools
+import hashlib
+import json
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.files.uploadedfile import UploadedFile
+from django.db import connection, transaction
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.response import Response
+
+from core.models import IdempotencyKey
+
+DEFAULTS = {
+    'ENABLED': True,
+    # Seconds a key replays its response before it may be reused
+    'TTL': 86400,
+}
+HEADER = 'Idempotency-Key'
+MAX_KEY_LENGTH = IdempotencyKey._meta.get_field('key').max_length
+
+
+def idempotency_settings():
+    """Return the idempotency settings merged over the defaults"""
+    return {**DEFAULTS, **getattr(settings, 'WMS_IDEMPOTENCY', {})}
+
+
+def _canonical(value):
+    """Return a JSON-ready stand-in of a value json cannot encode
+
+    Uploaded files stand for the digest of their contents, so two files
+    sharing a name are told apart.
+    """
+    if isinstance(value, UploadedFile):
+        digest = hashlib.sha256()
+        for chunk in value.chunks():
+            digest.update(chunk)
+        value.seek(0)
+        return f'{value.name}:{digest.hexdigest()}'
+
+    return str(value)
+
+
+def fingerprint(request):
+    """Return a digest of the method, path and body of a request"""
+    data = request.data
+    if hasattr(data, 'lists'):
+        data = dict(data.lists())
+    body = json.dumps(data, sort_keys=True, default=_canonical)
+    parts = [request.method, request.path, body]
+
+    return hashlib.sha256('\n'.join(parts).encode()).hexdigest()
+
+
+def claim(user_id, key, digest, ttl):
+    """Insert the key for this request, or take it over once expired
+
+    Waits for a concurrent request holding the same key to finish.
+    Returns the id of the claimed key, None when the key is live.
+    """
+    table = IdempotencyKey._meta.db_table
+    now = timezone.now()
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'''
+            INSERT INTO {table} AS k
+                (user_id, key, fingerprint, created_at, expires_at)
+            VALUES (%s, %s, %s, %s, %s)
+            ON CONFLICT (user_id, key) DO UPDATE
+            SET fingerprint = EXCLUDED.fingerprint,
+                created_at = EXCLUDED.created_at,
+                expires_at = EXCLUDED.expires_at,
+                status_code = NULL, response = NULL
+            WHERE k.expires_at <= EXCLUDED.created_at
+            RETURNING k.id
+            ''',
+            [user_id, key, digest, now, now + timedelta(seconds=ttl)]
+        )
+        row = cursor.fetchone()
+
+    return row[0] if row else None
+
+
+def idempotent(handler, request, *args, **kwargs):
+    """Run handler once per Idempotency-Key of the requesting user
+
+    The key is claimed in the transaction running the write, so a
+    concurrent request with the same key waits on its row and then
+    replays the stored response instead of running the write again.
+    Only successful responses are stored: a failed write rolls back its
+    key and may be retried. Reusing a key for a different request is
+    rejected with 422. Requests without the header run as usual.
+    """
+    config = idempotency_settings()
+    key = request.headers.get(HEADER)
+    if not config['ENABLED'] or key is None:
+        return handler(request, *args, **kwargs)
+    if not key or len(key) > MAX_KEY_LENGTH:
+        return Response(
+            {'detail': f'{HEADER} must be 1 to {MAX_KEY_LENGTH} '
+                       f'characters long.'},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+
+    digest = fingerprint(request)
+    with transaction.atomic():
+        claimed = claim(request.user.id, key, digest, config['TTL'])
+        if claimed is None:
+            return replay(request.user, key, digest)
+
+        response = handler(request, *args, **kwargs)
+        if status.is_success(response.status_code):
+            IdempotencyKey.objects.filter(pk=claimed).update(
+                status_code=response.status_code,
+                response=response.data
+            )
+        else:
+            transaction.set_rollback(True)
+
+    return response
+
+
+def replay(user, key, digest):
+    """Return the stored response of a key claimed before"""
+    stored = IdempotencyKey.objects.get(user=user, key=key)
+    if stored.fingerprint != digest:
+        return Response(
+            {'detail': f'{HEADER} was already used for a different '
+                       f'request.'},
+            status=status.HTTP_422_UNPROCESSABLE_ENTITY
+        )
+    response = Response(stored.response, status=stored.status_code)
+    response['Idempotent-Replayed'] = 'true'
+
+    return response
+
+
+def idempotent_action(method):
+    """Make a write action replayable with an Idempotency-Key"""
+    @functools.wraps(method)
+    def wrapper(self, request, *args, **kwargs):
+        return idempotent(functools.partial(method, self), request,
+                          *args, **kwargs)
+
+    return wrapper
+
+
+class IdempotencyMixin:
+    """Make creating objects replayable with an Idempotency-Key"""
+
+    def create(self, request, *args, **kwargs):
+        return idempotent(super().create, request, *args, **kwargs)
@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand
+
+from WMS.cache import cache_stats, reset_cache_stats
+
+
+class Command(BaseCommand):
+    """Django Command to print the hit and miss counts of the cache"""
+    help = ('Print the hits and misses of the WMS response cache since '
+            'the counters were last reset')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--reset',
+            action='store_true',
+            help='Set the counters back to zero after printing them'
+        )
+
+    def handle(self, *args, **options):
+        stats = cache_stats()
+        reads = stats['hit'] + stats['miss']
+        ratio = stats['hit'] / reads if reads else 0
+        self.stdout.write(
+            f'hits: {stats["hit"]}, misses: {stats["miss"]}, '
+            f'hit ratio: {ratio:.1%}'
+        )
+        if options['reset']:
+            reset_cache_stats()
@@ -0,0 +1,169 @@
+import base64
+from collections import OrderedDict
+from urllib import parse
+
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+
+class KeysetPagination(BasePagination):
+    """Opaque cursor pagination over an indexed, unique ordering
+
+    Pages are selected with ``WHERE key > last_seen`` rather than
+    ``OFFSET`` and no ``COUNT(*)`` is issued, so a page costs the same no
+    matter how deep it is and rows inserted concurrently never shift the
+    page boundaries. Clients opt in per request by sending ``page_size``
+    or ``cursor``; otherwise the full list is returned as before.
+    """
+    cursor_query_param = 'cursor'
+    page_size_query_param = 'page_size'
+    page_size = 100
+    max_page_size = 1000
+    invalid_cursor_message = 'Invalid cursor'
+
+    # Fields the queryset is already filtered to a single value of. They
+    # lead the ORDER BY so the composite ``(user_id, id)`` index is used.
+    partition = ('user',)
+    ordering = ('id',)
+
+    def is_requested(self, request):
+        """Return True if the client asked for a paginated response"""
+        params = request.query_params
+        return (self.cursor_query_param in params or
+                self.page_size_query_param in params)
+
+    def get_page_size(self, request):
+        """Return the requested page size, capped at max_page_size"""
+        try:
+            size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        if size <= 0:
+            return self.page_size
+
+        return min(size, self.max_page_size)
+
+    def get_ordering(self, view):
+        """Return the view's keyset ordering, if it provides one"""
+        get_keyset_ordering = getattr(view, 'get_keyset_ordering', None)
+        if get_keyset_ordering is not None:
+            return get_keyset_ordering() or self.ordering
+
+        return self.ordering
+
+    def paginate_queryset(self, queryset, request, view=None):
+        if not self.is_requested(request):
+            return None
+
+        self.base_url = request.build_absolute_uri()
+        self.page_size = self.get_page_size(request)
+        self.ordering = self.get_ordering(view)
+        position, self.reverse = self.decode_cursor(request)
+
+        ordering = self.ordering
+        if self.reverse:
+            ordering = tuple(_invert(field) for field in ordering)
+        queryset = queryset.order_by(*self.partition, *ordering)
+        if position is not None:
+            try:
+                queryset = queryset.filter(_keyset_filter(ordering, position))
+            except (ValueError, ValidationError):
+                # A tampered value the key field cannot hold
+                raise NotFound(self.invalid_cursor_message)
+
+        results = list(queryset[:self.page_size + 1])
+        has_more = len(results) > self.page_size
+        self.page = results[:self.page_size]
+        if self.reverse:
+            self.page.reverse()
+            self.has_next = position is not None
+            self.has_previous = has_more
+        else:
+            self.has_next = has_more
+            self.has_previous = position is not None
+
+        return self.page
+
+    def get_paginated_response(self, data):
+        return Response(OrderedDict([
+            ('next', self.get_next_link()),
+            ('previous', self.get_previous_link()),
+            ('results', data),
+        ]))
+
+    def get_next_link(self):
+        if not self.has_next or not self.page:
+            return None
+        return self.encode_cursor(self._get_position(self.page[-1]), False)
+
+    def get_previous_link(self):
+        if not self.has_previous or not self.page:
+            return None
+        return self.encode_cursor(self._get_position(self.page[0]), True)
+
+    def decode_cursor(self, request):
+        """Return the ``(position, reverse)`` pair held by the cursor"""
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None, False
+        try:
+            querystring = base64.urlsafe_b64decode(encoded.encode('ascii'))
+            tokens = parse.parse_qs(querystring.decode('utf-8'),
+                                    keep_blank_values=True)
+            position = tokens['p']
+            reverse = bool(int(tokens.get('r', ['0'])[0]))
+        except (KeyError, ValueError, UnicodeError):
+            raise NotFound(self.invalid_cursor_message)
+        if len(position) != len(self.ordering):
+            raise NotFound(self.invalid_cursor_message)
+
+        return position, reverse
+
+    def encode_cursor(self, position, reverse):
+        """Return the URL of the page starting after ``position``"""
+        tokens = {'p': position}
+        if reverse:
+            tokens['r'] = '1'
+        querystring = parse.urlencode(tokens, doseq=True)
+        encoded = base64.urlsafe_b64encode(querystring.encode('utf-8'))
+
+        return replace_query_param(self.base_url, self.cursor_query_param,
+                                   encoded.decode('ascii'))
+
+    def _get_position(self, item):
+        """Return the ordering key values of a page item as strings"""
+        fields = [field.lstrip('-') for field in self.ordering]
+        if isinstance(item, dict):
+            return [str(item[field]) for field in fields]
+
+        return [str(getattr(item, field)) for field in fields]
+
+
+class NameKeysetPagination(KeysetPagination):
+    """Keyset pagination for tags and categories, keyed on unique name"""
+    partition = ()
+    ordering = ('-name',)
+
+
+def _invert(field):
+    """Flip the direction of an ordering field"""
+    return field[1:] if field.startswith('-') else '-' + field
+
+
+def _keyset_filter(ordering, position):
+    """Build the row comparison ``(a, b) > (x, y)`` as nested ORs"""
+    query = Q()
+    for index, field in enumerate(ordering):
+        name = field.lstrip('-')
+        lookup = 'lt' if field.startswith('-') else 'gt'
+        equal = {
+            previous.lstrip('-'): value
+            for previous, value in zip(ordering[:index], position)
+        }
+        query |= Q(**equal, **{f'{name}__{lookup}': position[index]})
+
+    return query
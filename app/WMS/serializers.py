@@ -1,5 +1,18 @@
+import csv
+import io
+from collections import Counter
+
+from django.db import transaction
 from rest_framework import serializers
-from core.models import Tag, Category, Product, DeliveryOrder, Stock
+from core.models import (
+    Tag, Category, Product, DeliveryOrder, Stock, StockMovement,
+    StockAlert, StockReservation, Wave
+)
+from core.orders import TRANSITIONS, refresh_product_totals
+
+BULK_BATCH_SIZE = 1000
+PICK_LIST_MAX_ORDERS = 5000
+TRANSITION_MAX_ORDERS = 10000
 
 
 class TagSerializer(serializers.ModelSerializer):
@@ -20,6 +33,22 @@ class CategorySerializer(serializers.ModelSerializer):
         read_only_fields = ('id',)
 
 
+class TagCountSerializer(TagSerializer):
+    """Serializer for tag objects with their product count"""
+    product_count = serializers.IntegerField(read_only=True)
+
+    class Meta(TagSerializer.Meta):
+        fields = TagSerializer.Meta.fields + ('product_count',)
+
+
+class CategoryCountSerializer(CategorySerializer):
+    """Serializer for category objects with their product count"""
+    product_count = serializers.IntegerField(read_only=True)
+
+    class Meta(CategorySerializer.Meta):
+        fields = CategorySerializer.Meta.fields + ('product_count',)
+
+
 class ProductSerializer(serializers.ModelSerializer):
     """Serializer for Product objects"""
     categories = serializers.PrimaryKeyRelatedField(
@@ -34,7 +63,7 @@ class ProductSerializer(serializers.ModelSerializer):
     class Meta:
         model = Product
         fields = ('id', 'title', 'categories', 'tags', 'weight',
-                  'price', 'link')
+                  'price', 'link', 'reorder_point')
         read_only_fields = ('id',)
 
 
@@ -44,6 +73,134 @@ class ProductDetailSerializer(ProductSerializer):
     tags = TagSerializer(many=True, read_only=True)
 
 
+class ProductBulkListSerializer(serializers.ListSerializer):
+    """Validate and upsert many products with set-based queries"""
+    related_fields = (('categories', Category), ('tags', Tag))
+    scalar_fields = ('weight', 'price', 'link')
+
+    def to_internal_value(self, data):
+        """Run the cross item checks once for the whole payload"""
+        items = super().to_internal_value(data)
+        errors = [{} for _ in items]
+
+        titles = Counter(item['title'] for item in items)
+        taken = set(Product.objects.filter(
+            title__in=list(titles)
+        ).exclude(
+            user=self.context['request'].user
+        ).values_list('title', flat=True))
+        for item, item_errors in zip(items, errors):
+            if titles[item['title']] > 1:
+                item_errors['title'] = ['Duplicate title in payload.']
+            elif item['title'] in taken:
+                item_errors['title'] = [
+                    'product with this title already exists.'
+                ]
+
+        for field, model in self.related_fields:
+            requested = {pk for item in items for pk in item.get(field, ())}
+            found = set(model.objects.filter(
+                id__in=requested
+            ).values_list('id', flat=True))
+            for item, item_errors in zip(items, errors):
+                missing = [pk for pk in item.get(field, ()) if pk not in found]
+                if missing:
+                    item_errors[field] = [
+                        f'Invalid pk "{pk}" - object does not exist.'
+                        for pk in missing
+                    ]
+
+        if any(errors):
+            raise serializers.ValidationError(errors)
+
+        return items
+
+    def upsert(self, user):
+        """Create or update the validated products, matched by title"""
+        items = self.validated_data
+        with transaction.atomic():
+            existing = Product.objects.select_for_update().filter(
+                user=user
+            ).in_bulk(
+                [item['title'] for item in items],
+                field_name='title'
+            )
+            products, to_create, to_update = [], [], []
+            for item in items:
+                product = existing.get(item['title'])
+                if product is None:
+                    product = Product(user=user, title=item['title'])
+                    to_create.append(product)
+                else:
+                    to_update.append(product)
+                for field in self.scalar_fields:
+                    if field in item:
+                        setattr(product, field, item[field])
+                products.append(product)
+
+            Product.objects.bulk_create(to_create, batch_size=BULK_BATCH_SIZE)
+            Product.objects.bulk_update(to_update, self.scalar_fields,
+                                        batch_size=BULK_BATCH_SIZE)
+            # bulk_update sends no post_save to carry prices and weights
+            # into the orders holding them
+            if to_update:
+                refresh_product_totals([product.id for product in to_update])
+            for field, _ in self.related_fields:
+                self._replace_related(field, products, items)
+
+        created = {product.id for product in to_create}
+        return [
+            {
+                'id': product.id,
+                'title': product.title,
+                'status': 'created' if product.id in created else 'updated',
+            }
+            for product in products
+        ]
+
+    def _replace_related(self, field, products, items):
+        """Rewrite the through table rows of the products that sent field"""
+        model_field = Product._meta.get_field(field)
+        through = model_field.remote_field.through
+        source = model_field.m2m_field_name() + '_id'
+        target = model_field.m2m_reverse_field_name() + '_id'
+
+        touched = [
+            product.id for product, item in zip(products, items)
+            if field in item
+        ]
+        through.objects.filter(**{f'{source}__in': touched}).delete()
+        through.objects.bulk_create(
+            [
+                through(**{source: product.id, target: pk})
+                for product, item in zip(products, items)
+                for pk in set(item.get(field, ()))
+            ],
+            batch_size=BULK_BATCH_SIZE
+        )
+
+
+class ProductBulkSerializer(serializers.ModelSerializer):
+    """Serializer for one item of a bulk product upsert"""
+    categories = serializers.ListField(
+        child=serializers.IntegerField(),
+        required=False
+    )
+    tags = serializers.ListField(
+        child=serializers.IntegerField(),
+        required=False
+    )
+
+    class Meta:
+        model = Product
+        fields = ('id', 'title', 'categories', 'tags', 'weight',
+                  'price', 'link')
+        read_only_fields = ('id',)
+        # Uniqueness is checked once for the whole payload
+        extra_kwargs = {'title': {'validators': []}}
+        list_serializer_class = ProductBulkListSerializer
+
+
 class ProductImageSerializer(serializers.ModelSerializer):
     """Serializer for uploading image to product"""
 
@@ -63,28 +220,361 @@ class DeliveryOrderSerializer(serializers.ModelSerializer):
     class Meta:
         model = DeliveryOrder
         fields = ('id', 'deliveryNumber', 'sentFrom', 'sentTo', 'fullAddress',
-                  'contactPerson', 'price', 'products')
-        read_only_fields = ('id',)
+                  'contactPerson', 'price', 'products', 'total_price',
+                  'total_weight', 'status', 'created_at', 'updated_at')
+        read_only_fields = ('id', 'total_price', 'total_weight', 'status',
+                            'created_at', 'updated_at')
+        # Numbered by the server when left out
+        extra_kwargs = {'deliveryNumber': {'required': False}}
 
 
 class DeliveryOrderDetailSerializer(DeliveryOrderSerializer):
     """Serialize a DeliveryOrder detail"""
-    products = ProductSerializer(many=True, read_only=True)
+    products = ProductDetailSerializer(many=True, read_only=True)
+
+
+class ReservationRequestListSerializer(serializers.ListSerializer):
+    """Serialize quantities of the user's products"""
+
+    def to_internal_value(self, data):
+        """Check the products once for the whole payload"""
+        items = super().to_internal_value(data)
+        found = set(Product.objects.filter(
+            user=self.context['request'].user,
+            id__in={item['product'] for item in items}
+        ).values_list('id', flat=True))
+        errors = [
+            {'product': [
+                f'Invalid pk "{item["product"]}" - object does not exist.'
+            ]} if item['product'] not in found else {}
+            for item in items
+        ]
+        if any(errors):
+            raise serializers.ValidationError(errors)
+
+        return items
+
+    def quantities(self):
+        """Return the validated quantities summed by product id"""
+        quantities = Counter()
+        for item in self.validated_data:
+            quantities[item['product']] += item['quantity']
+
+        return dict(quantities)
+
+
+class ReservationRequestSerializer(serializers.Serializer):
+    """Serialize a quantity of a product to reserve"""
+    product = serializers.IntegerField()
+    quantity = serializers.IntegerField(min_value=1)
+
+    class Meta:
+        list_serializer_class = ReservationRequestListSerializer
+
+
+class DeliveryOrderLineSerializer(ReservationRequestSerializer):
+    """Serialize a quantity of a product on a delivery order"""
+
+
+class PickListSerializer(serializers.Serializer):
+    """Serialize the delivery orders to pick in one walk"""
+    delivery_orders = serializers.ListField(
+        child=serializers.IntegerField(),
+        allow_empty=False,
+        max_length=PICK_LIST_MAX_ORDERS
+    )
+
+    def validate_delivery_orders(self, value):
+        """Check every delivery order belongs to the user"""
+        found = set(DeliveryOrder.objects.filter(
+            user=self.context['request'].user,
+            id__in=value
+        ).values_list('id', flat=True))
+        missing = sorted(set(value) - found)
+        if missing:
+            raise serializers.ValidationError(
+                f'Invalid pk "{missing[0]}" - object does not exist.'
+            )
+
+        return value
+
+
+class DeliveryOrderTransitionSerializer(PickListSerializer):
+    """Serialize a status change of many delivery orders"""
+    delivery_orders = serializers.ListField(
+        child=serializers.IntegerField(),
+        allow_empty=False,
+        max_length=TRANSITION_MAX_ORDERS
+    )
+    status = serializers.ChoiceField(choices=list(TRANSITIONS))
+
+
+class StockReservationSerializer(serializers.ModelSerializer):
+    """Serialize stock held for a delivery order"""
+    StockNo = serializers.CharField(source='stock.StockNo', read_only=True)
+
+    class Meta:
+        model = StockReservation
+        fields = ('id', 'stock', 'StockNo', 'product', 'quantity',
+                  'created_at')
+        read_only_fields = fields
+
+
+class WaveSerializer(serializers.ModelSerializer):
+    """Serialize a wave of delivery orders"""
+    orders = serializers.PrimaryKeyRelatedField(many=True, read_only=True)
+
+    class Meta:
+        model = Wave
+        fields = ('id', 'sentTo', 'lines', 'weight', 'created_at', 'orders')
+        read_only_fields = fields
+
+
+class WavePlanSerializer(serializers.Serializer):
+    """Serialize the limits of a wave planning run"""
+    max_lines = serializers.IntegerField(min_value=1, required=False)
+    max_weight = serializers.DecimalField(max_digits=25, decimal_places=3,
+                                          min_value=0, required=False)
+    max_orders = serializers.IntegerField(min_value=1, required=False)
+    destinations = serializers.ListField(
+        child=serializers.CharField(max_length=255),
+        required=False
+    )
+
+
+class StockAlertSerializer(serializers.ModelSerializer):
+    """Serialize a low-stock alert"""
+    title = serializers.CharField(source='product.title', read_only=True)
+
+    class Meta:
+        model = StockAlert
+        fields = ('id', 'product', 'title', 'reorder_point', 'on_hand',
+                  'created_at', 'resolved_at')
+        read_only_fields = fields
 
 
 class StockSerializer(serializers.ModelSerializer):
     """Serializer for DeliveryOrder objects"""
     products = serializers.PrimaryKeyRelatedField(
         many=True,
-        queryset=Product.objects.all()
+        queryset=Product.objects.all(),
+        required=False
     )
 
     class Meta:
         model = Stock
-        fields = ('id', 'StockNo', 'Quantity', 'Location', 'products')
-        read_only_fields = ('id',)
+        fields = ('id', 'StockNo', 'Quantity', 'reserved', 'Location',
+                  'product', 'products')
+        read_only_fields = ('id', 'reserved')
+        # Numbered by the server when left out
+        extra_kwargs = {'Quantity': {'min_value': 0},
+                        'StockNo': {'required': False}}
+
+    def validate(self, attrs):
+        """Write product and the products it replaces in step"""
+        if 'product' in attrs and not attrs.get('products'):
+            # Form posts send an empty products list when it is left out
+            product = attrs['product']
+            attrs['products'] = [product] if product else []
+        elif 'products' not in attrs:
+            if not self.partial:
+                raise serializers.ValidationError({'products': [
+                    self.fields['products'].error_messages['required']
+                ]})
+        elif 'product' not in attrs:
+            # The same choice the database makes for links set directly
+            products = attrs['products']
+            current = self.instance.product if self.instance else None
+            attrs['product'] = current if current in products else min(
+                products, key=lambda product: product.pk, default=None
+            )
+        elif attrs['product'] and attrs['product'] not in attrs['products']:
+            raise serializers.ValidationError(
+                {'product': ['Must be one of the products.']}
+            )
+
+        return attrs
 
 
 class StockDetailSerializer(StockSerializer):
-    """Serialize a DeliveryOrder detail"""
-    products = ProductSerializer(many=True, read_only=True)
+    """Serialize a Stock detail"""
+    products = ProductDetailSerializer(many=True, read_only=True)
+
+
+class StockQuantitySerializer(serializers.Serializer):
+    """Serialize the amount of a stock increment or decrement"""
+    quantity = serializers.IntegerField(min_value=1)
+
+
+class StockAdjustmentListSerializer(serializers.ListSerializer):
+    """Serialize a batch of stock adjustments"""
+    related_fields = (('product', Product),
+                      ('delivery_order', DeliveryOrder))
+
+    def to_internal_value(self, data):
+        """Check the referenced objects once for the whole payload"""
+        items = super().to_internal_value(data)
+        errors = [{} for _ in items]
+        user = self.context['request'].user
+
+        for field, model in self.related_fields:
+            found = set(model.objects.filter(
+                user=user,
+                id__in={item[field] for item in items if field in item}
+            ).values_list('id', flat=True))
+            for item, item_errors in zip(items, errors):
+                if field in item and item[field] not in found:
+                    item_errors[field] = [
+                        f'Invalid pk "{item[field]}" - object does not exist.'
+                    ]
+
+        if any(errors):
+            raise serializers.ValidationError(errors)
+
+        return items
+
+    def movements(self):
+        """Return the validated adjustments as ledger movements"""
+        return [
+            {
+                'StockNo': item['StockNo'],
+                'quantity': item['delta'],
+                'kind': item['kind'],
+                'product_id': item.get('product'),
+                'delivery_order_id': item.get('delivery_order'),
+                'reference': item['reference'],
+            }
+            for item in self.validated_data
+        ]
+
+
+class StockAdjustmentSerializer(serializers.Serializer):
+    """Serialize one adjustment of a stock adjustment batch"""
+    kinds = (StockMovement.Kind.RECEIPT, StockMovement.Kind.PICK,
+             StockMovement.Kind.ADJUSTMENT)
+
+    StockNo = serializers.CharField(max_length=255)
+    delta = serializers.IntegerField()
+    kind = serializers.ChoiceField(
+        choices=[(kind.value, kind.label) for kind in kinds],
+        default=StockMovement.Kind.ADJUSTMENT
+    )
+    product = serializers.IntegerField(required=False)
+    delivery_order = serializers.IntegerField(required=False)
+    reference = serializers.CharField(max_length=255, required=False,
+                                      default='', allow_blank=True)
+
+    class Meta:
+        list_serializer_class = StockAdjustmentListSerializer
+
+    def validate_delta(self, value):
+        """Reject adjustments that change nothing"""
+        if value == 0:
+            raise serializers.ValidationError('Must not be zero.')
+
+        return value
+
+    def validate(self, attrs):
+        """Check receipts add to and picks take from the stock"""
+        if attrs['kind'] == StockMovement.Kind.RECEIPT and attrs['delta'] < 0:
+            raise serializers.ValidationError(
+                {'delta': ['A receipt must be positive.']}
+            )
+        if attrs['kind'] == StockMovement.Kind.PICK and attrs['delta'] > 0:
+            raise serializers.ValidationError(
+                {'delta': ['A pick must be negative.']}
+            )
+
+        return attrs
+
+
+class StockTransferSerializer(serializers.Serializer):
+    """Serialize a transfer of quantity between two stocks"""
+    source = serializers.CharField(max_length=255)
+    destination = serializers.CharField(max_length=255)
+    quantity = serializers.IntegerField(min_value=1)
+    reference = serializers.CharField(max_length=255, required=False,
+                                      default='', allow_blank=True)
+
+    def validate(self, attrs):
+        """Check the stock is moved between two different stocks"""
+        if attrs['source'] == attrs['destination']:
+            raise serializers.ValidationError(
+                {'destination': ['Must differ from the source.']}
+            )
+
+        return attrs
+
+
+class CycleCountListSerializer(serializers.ListSerializer):
+    """Serialize the lines of a cycle count"""
+
+    def to_internal_value(self, data):
+        """Reject stock numbers counted twice in one count"""
+        items = super().to_internal_value(data)
+        stock_nos = Counter(item['StockNo'] for item in items)
+        errors = [
+            {'StockNo': ['Duplicate StockNo in payload.']}
+            if stock_nos[item['StockNo']] > 1 else {}
+            for item in items
+        ]
+        if any(errors):
+            raise serializers.ValidationError(errors)
+
+        return items
+
+
+class CycleCountSerializer(serializers.Serializer):
+    """Serialize the counted quantity of one stock"""
+    StockNo = serializers.CharField(max_length=255)
+    counted = serializers.IntegerField(min_value=0)
+
+    class Meta:
+        list_serializer_class = CycleCountListSerializer
+
+
+class ReconcileSerializer(serializers.Serializer):
+    """Serialize a cycle count, as JSON lines or an uploaded CSV file"""
+    counts = CycleCountSerializer(many=True, required=False,
+                                  allow_empty=False)
+    file = serializers.FileField(required=False, write_only=True,
+                                 help_text='CSV with StockNo and counted '
+                                           'columns')
+    reference = serializers.CharField(max_length=255, required=False,
+                                      default='', allow_blank=True)
+
+    def validate(self, attrs):
+        """Read the counts from the file when one is uploaded"""
+        upload = attrs.pop('file', None)
+        if upload is not None:
+            rows = list(csv.DictReader(
+                io.TextIOWrapper(upload, encoding='utf-8-sig')
+            ))
+            counts = CycleCountSerializer(data=rows, many=True,
+                                          allow_empty=False)
+            if not counts.is_valid():
+                raise serializers.ValidationError({'file': counts.errors})
+            attrs['counts'] = counts.validated_data
+        elif 'counts' not in attrs:
+            raise serializers.ValidationError(
+                {'counts': ['This field is required.']}
+            )
+
+        return attrs
+
+    def quantities(self):
+        """Return the validated counts as ``{StockNo: counted}``"""
+        return {
+            item['StockNo']: item['counted']
+            for item in self.validated_data['counts']
+        }
+
+
+class StockMovementSerializer(serializers.ModelSerializer):
+    """Serializer for stock ledger entries"""
+
+    class Meta:
+        model = StockMovement
+        fields = ('id', 'stock', 'stock_no', 'product', 'delivery_order',
+                  'kind', 'quantity', 'balance', 'reference', 'created_at')
+        read_only_fields = fields
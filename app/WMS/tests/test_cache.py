@@ -0,0 +1,175 @@
+from io import StringIO
+from unittest.mock import patch
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.management import call_command
+from django.urls import reverse
+from django.test import TransactionTestCase, override_settings
+
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from core.models import Tag, Product, Stock
+from WMS.cache import cache_stats
+
+PRODUCT_URL = reverse('WMS:product-list')
+TAG_URL = reverse('WMS:tag-list')
+
+
+class ResponseCacheTests(TransactionTestCase):
+    """Test the response cache of the WMS endpoints
+
+    Responses are only cached outside transactions, so these tests run
+    without the wrapping transaction of a regular TestCase.
+    """
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            'cache@domain.com',
+            'testpass'
+        )
+        self.client.force_authenticate(self.user)
+        self.product = Product.objects.create(
+            user=self.user,
+            title='Pallet',
+            weight=20.00,
+            price=8.00
+        )
+
+    def test_second_read_is_a_hit(self):
+        """Test a repeated read is served from cache after one query"""
+        first = self.client.get(PRODUCT_URL)
+
+        with self.assertNumQueries(1):
+            second = self.client.get(PRODUCT_URL)
+
+        self.assertEqual(first['X-Cache'], 'MISS')
+        self.assertEqual(second['X-Cache'], 'HIT')
+        self.assertEqual(second.data, first.data)
+        self.assertEqual(cache_stats(), {'hit': 1, 'miss': 1})
+
+    def test_stats_command(self):
+        """Test the counters are printed and optionally reset"""
+        self.client.get(PRODUCT_URL)
+        self.client.get(PRODUCT_URL)
+        self.client.get(PRODUCT_URL)
+        out = StringIO()
+
+        call_command('response_cache_stats', reset=True, stdout=out)
+
+        self.assertEqual(out.getvalue(),
+                         'hits: 2, misses: 1, hit ratio: 66.7%\n')
+        self.assertEqual(cache_stats(), {'hit': 0, 'miss': 0})
+
+    def test_query_params_are_normalized(self):
+        """Test the order of query parameters does not matter"""
+        self.client.get(f'{PRODUCT_URL}?search=pallet&page_size=5')
+
+        res = self.client.get(f'{PRODUCT_URL}?page_size=5&search=pallet')
+
+        self.assertEqual(res['X-Cache'], 'HIT')
+
+    def test_detail_is_cached_per_object(self):
+        """Test detail entries are keyed by the object looked up"""
+        other = Product.objects.create(user=self.user, title='Crate',
+                                       weight=1, price=1)
+        self.client.get(reverse('WMS:product-detail',
+                                args=[self.product.id]))
+
+        res = self.client.get(reverse('WMS:product-detail', args=[other.id]))
+
+        self.assertEqual(res['X-Cache'], 'MISS')
+        self.assertEqual(res.data['title'], 'Crate')
+
+    def test_users_do_not_share_entries(self):
+        """Test a cached list is never served to another user"""
+        self.client.get(PRODUCT_URL)
+        other = get_user_model().objects.create_user(
+            'other@domain.com',
+            'testpass'
+        )
+        self.client.force_authenticate(other)
+
+        res = self.client.get(PRODUCT_URL)
+
+        self.assertEqual(res['X-Cache'], 'MISS')
+        self.assertEqual(res.data, [])
+
+    def test_write_invalidates(self):
+        """Test saving a product serves fresh data on the next read"""
+        self.client.get(PRODUCT_URL)
+
+        self.product.title = 'Euro pallet'
+        self.product.save()
+        res = self.client.get(PRODUCT_URL)
+
+        self.assertEqual(res['X-Cache'], 'MISS')
+        self.assertEqual(res.data[0]['title'], 'Euro pallet')
+
+    def test_m2m_change_invalidates_tag_counts(self):
+        """Test tagging a product refreshes the cached tag counts"""
+        tag = Tag.objects.create(user=self.user, name='Heavy')
+        url = f'{TAG_URL}?with_counts=1'
+        self.assertEqual(self.client.get(url).data[0]['product_count'], 0)
+
+        tag.product_set.add(self.product)
+        res = self.client.get(url)
+
+        self.assertEqual(res['X-Cache'], 'MISS')
+        self.assertEqual(res.data[0]['product_count'], 1)
+
+    def test_stock_summary_follows_stock_writes(self):
+        """Test the cached stock summary is refreshed by adjustments"""
+        stock = Stock.objects.create(user=self.user, StockNo='STK-1',
+                                     Quantity=4, Location='A')
+        url = reverse('WMS:stock-summary')
+        self.client.get(url)
+        self.assertEqual(self.client.get(url)['X-Cache'], 'HIT')
+
+        self.client.post(reverse('WMS:stock-increment', args=[stock.id]),
+                         {'quantity': 2})
+        res = self.client.get(url)
+
+        self.assertEqual(res['X-Cache'], 'MISS')
+        self.assertEqual(res.data[0]['Quantity'], 6)
+
+    def test_waits_for_concurrent_miss(self):
+        """Test a miss waits for the request already computing the key"""
+        computed = [{'title': 'computed elsewhere'}]
+
+        def compute_meanwhile(seconds):
+            cache.set('wms:test', computed)
+
+        with patch('WMS.cache.ResponseCacheMixin.get_cache_key',
+                   return_value='wms:test'), \
+                patch('WMS.cache.time.sleep', side_effect=compute_meanwhile):
+            cache.add('wms:test:lock', 1)
+            res = self.client.get(PRODUCT_URL)
+
+        self.assertEqual(res['X-Cache'], 'HIT')
+        self.assertEqual(res.data, computed)
+
+    @override_settings(WMS_RESPONSE_CACHE={'LOCK_WAIT': 0})
+    def test_computes_when_lock_holder_is_slow(self):
+        """Test a miss computes the response once the wait runs out"""
+        with patch('WMS.cache.ResponseCacheMixin.get_cache_key',
+                   return_value='wms:test'):
+            cache.add('wms:test:lock', 1)
+            res = self.client.get(PRODUCT_URL)
+
+        self.assertEqual(res['X-Cache'], 'MISS')
+        self.assertEqual(res.data[0]['title'], 'Pallet')
+        self.assertTrue(cache.get('wms:test:lock'))
+
+    @override_settings(WMS_RESPONSE_CACHE={'ENABLED': False})
+    def test_disabled(self):
+        """Test the cache can be switched off"""
+        self.client.get(PRODUCT_URL)
+
+        res = self.client.get(PRODUCT_URL)
+
+        self.assertNotIn('X-Cache', res)
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
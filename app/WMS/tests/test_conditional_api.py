@@ -0,0 +1,237 @@
+from django.contrib.auth import get_user_model
+from django.urls import reverse
+from django.test import TransactionTestCase
+
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from core.models import (
+    Tag, Product, DeliveryOrder, ResourceVersion, Stock, Wave
+)
+
+PRODUCT_URL = reverse('WMS:product-list')
+TAG_URL = reverse('WMS:tag-list')
+
+
+class ConditionalGetTests(TransactionTestCase):
+    """Test ETag and Last-Modified handling of the WMS resources
+
+    Versions are bumped once a transaction commits, so these tests run
+    outside the wrapping transaction of a regular TestCase.
+    """
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            'etag@domain.com',
+            'testpass'
+        )
+        self.client.force_authenticate(self.user)
+        self.product = Product.objects.create(
+            user=self.user,
+            title='Scanner',
+            weight=1.00,
+            price=12.00
+        )
+
+    def get(self, url, **headers):
+        """Return the response of a GET on url"""
+        return self.client.get(url, **headers)
+
+    def assertNotModified(self, url, etag):
+        """Assert the response at url still matches etag"""
+        res = self.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(res.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(res['ETag'], etag)
+
+    def assertModified(self, url, etag):
+        """Assert the response at url no longer matches etag"""
+        res = self.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertNotEqual(res['ETag'], etag)
+
+    def test_list_sends_validators(self):
+        """Test list responses carry a strong ETag and Last-Modified"""
+        res = self.get(PRODUCT_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertRegex(res['ETag'], r'^"[0-9a-f]{40}"$')
+        self.assertIn('Last-Modified', res)
+
+    def test_not_modified_skips_the_query(self):
+        """Test a matching If-None-Match costs only the version lookup"""
+        etag = self.get(PRODUCT_URL)['ETag']
+
+        with self.assertNumQueries(1):
+            res = self.get(PRODUCT_URL, HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(res.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertFalse(res.content)
+
+    def test_weak_and_wildcard_match(self):
+        """Test If-None-Match is compared weakly and accepts *"""
+        etag = self.get(PRODUCT_URL)['ETag']
+
+        for if_none_match in (f'"stale", W/{etag}', '*'):
+            res = self.get(PRODUCT_URL, HTTP_IF_NONE_MATCH=if_none_match)
+            self.assertEqual(res.status_code,
+                             status.HTTP_304_NOT_MODIFIED)
+
+    def test_etag_depends_on_query(self):
+        """Test filtered lists do not share the ETag of the full list"""
+        etag = self.get(PRODUCT_URL)['ETag']
+
+        self.assertModified(f'{PRODUCT_URL}?search=scanner', etag)
+
+    def test_etag_is_per_user(self):
+        """Test another user never matches the ETag of this user"""
+        etag = self.get(PRODUCT_URL)['ETag']
+        other = get_user_model().objects.create_user(
+            'other@domain.com',
+            'testpass'
+        )
+        self.client.force_authenticate(other)
+
+        self.assertModified(PRODUCT_URL, etag)
+
+    def test_save_changes_etag(self):
+        """Test updating a product invalidates list and detail ETags"""
+        detail = reverse('WMS:product-detail', args=[self.product.id])
+        list_etag = self.get(PRODUCT_URL)['ETag']
+        detail_etag = self.get(detail)['ETag']
+
+        self.product.price = 15.00
+        self.product.save()
+
+        self.assertModified(PRODUCT_URL, list_etag)
+        self.assertModified(detail, detail_etag)
+
+    def test_other_user_write_keeps_etag(self):
+        """Test products of another user leave this user's ETag alone"""
+        etag = self.get(PRODUCT_URL)['ETag']
+        other = get_user_model().objects.create_user(
+            'other@domain.com',
+            'testpass'
+        )
+        Product.objects.create(user=other, title='Other', weight=1,
+                               price=1)
+
+        self.assertNotModified(PRODUCT_URL, etag)
+
+    def test_user_writes_bump_no_shared_version(self):
+        """Test writes to per-user resources leave no global key"""
+        Stock.objects.create(user=self.user, StockNo='STK-1', Quantity=1)
+        self.product.title = 'Label scanner'
+        self.product.save()
+
+        keys = set(ResourceVersion.objects.values_list('key', flat=True))
+        self.assertIn(f'stock:{self.user.id}', keys)
+        self.assertFalse(keys & {'product', 'stock', 'deliveryorder',
+                                 'stockalert'})
+
+    def test_other_user_tagging_changes_assigned_tags(self):
+        """Test tagging another user's product changes assigned tags"""
+        tag = Tag.objects.create(user=self.user, name='Fragile')
+        etag = self.client.get(TAG_URL, {'assigned_only': 1})['ETag']
+        other = get_user_model().objects.create_user(
+            'other@domain.com',
+            'testpass'
+        )
+        product = Product.objects.create(user=other, title='Other',
+                                         weight=1, price=1)
+
+        product.tags.add(tag)
+
+        res = self.client.get(TAG_URL, {'assigned_only': 1},
+                              HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual([item['name'] for item in res.data], ['Fragile'])
+
+    def test_m2m_change_changes_etag(self):
+        """Test tagging a product from either side changes the ETag"""
+        tag = Tag.objects.create(user=self.user, name='Fragile')
+        etag = self.get(PRODUCT_URL)['ETag']
+
+        self.product.tags.add(tag)
+        self.assertModified(PRODUCT_URL, etag)
+
+        etag = self.get(PRODUCT_URL)['ETag']
+        tag.product_set.clear()
+        self.assertModified(PRODUCT_URL, etag)
+
+    def test_product_delete_changes_dependent_etags(self):
+        """Test deleting a product invalidates orders and stock"""
+        order = DeliveryOrder.objects.create(
+            user=self.user,
+            deliveryNumber='TRN-001',
+            sentFrom='Batam',
+            sentTo='Palembang',
+            price=10
+        )
+        order.products.add(self.product)
+        stock = Stock.objects.create(user=self.user, StockNo='STK-001',
+                                     Quantity=1)
+        stock.products.add(self.product)
+        order_url = reverse('WMS:deliveryorder-list')
+        stock_url = reverse('WMS:stock-list')
+        order_etag = self.get(order_url)['ETag']
+        stock_etag = self.get(stock_url)['ETag']
+
+        self.product.delete()
+
+        self.assertModified(order_url, order_etag)
+        self.assertModified(stock_url, stock_etag)
+
+    def test_order_delete_changes_wave_etag(self):
+        """Test deleting an order invalidates the waves listing it"""
+        wave = Wave.objects.create(user=self.user, sentTo='Palembang',
+                                   lines=1, weight=1)
+        order = DeliveryOrder.objects.create(
+            user=self.user,
+            deliveryNumber='TRN-001',
+            sentFrom='Batam',
+            sentTo='Palembang',
+            price=10,
+            wave=wave
+        )
+        wave_url = reverse('WMS:wave-detail', args=[wave.id])
+        etag = self.get(wave_url)['ETag']
+
+        res = self.client.delete(
+            reverse('WMS:deliveryorder-detail', args=[order.id])
+        )
+
+        self.assertEqual(res.status_code, status.HTTP_204_NO_CONTENT)
+        self.assertModified(wave_url, etag)
+
+    def test_tag_counts_follow_products(self):
+        """Test tag lists are invalidated by product changes"""
+        etag = self.get(f'{TAG_URL}?with_counts=1')['ETag']
+
+        Product.objects.create(user=self.user, title='Label', weight=1,
+                               price=1)
+
+        self.assertModified(f'{TAG_URL}?with_counts=1', etag)
+
+    def test_bulk_upsert_changes_etag(self):
+        """Test the bulk endpoint, which sends no signals, bumps too"""
+        etag = self.get(PRODUCT_URL)['ETag']
+
+        res = self.client.post(
+            reverse('WMS:product-bulk-upsert'),
+            [{'title': 'Scanner', 'weight': 2, 'price': 13}],
+            format='json'
+        )
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertModified(PRODUCT_URL, etag)
+
+    def test_if_modified_since(self):
+        """Test If-Modified-Since is honoured when no ETag is sent"""
+        last_modified = self.get(PRODUCT_URL)['Last-Modified']
+
+        res = self.get(PRODUCT_URL, HTTP_IF_MODIFIED_SINCE=last_modified)
+        self.assertEqual(res.status_code, status.HTTP_304_NOT_MODIFIED)
+
+        res = self.get(PRODUCT_URL,
+                       HTTP_IF_MODIFIED_SINCE='Mon, 01 Jan 2018 00:00:00 GMT')
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
@@ -1,13 +1,23 @@
+import threading
+from unittest.mock import patch
+
 from django.contrib.auth import get_user_model
+from django.db import connection
+from django.db.models import F, Sum
 from django.urls import reverse
-from django.test import TestCase
+from django.test import TestCase, TransactionTestCase
 
 from rest_framework import status
 from rest_framework.test import APIClient
 
-from core.models import DeliveryOrder, Product
+from core import reservations
+from core.models import (
+    DeliveryOrder, Product, Stock, StockReservation, Tag
+)
 
 DELIVERYORDER_URL = reverse('WMS:deliveryorder-list')
+PICK_LIST_URL = reverse('WMS:deliveryorder-pick-list')
+TRANSITION_URL = reverse('WMS:deliveryorder-transition')
 
 
 def sample_deliveryorder(user, **params):
@@ -37,11 +47,40 @@ def sample_product(user, **params):
     return Product.objects.create(user=user, **defaults)
 
 
+def sample_stock(user, product, **params):
+    """Create and return a sample stock holding product"""
+    defaults = {
+        'StockNo': 'STK-001',
+        'Quantity': 10,
+        'Location': 'A-01',
+    }
+    defaults.update(params)
+    stock = Stock.objects.create(user=user, **defaults)
+    stock.products.add(product)
+
+    return stock
+
+
 def detail_url(deliveryorder_id):
     """Return Delivery Order Detail URL"""
     return reverse('WMS:deliveryorder-detail', args=[deliveryorder_id])
 
 
+def reserve_url(deliveryorder_id):
+    """Return the reserve URL of a delivery order"""
+    return reverse('WMS:deliveryorder-reserve', args=[deliveryorder_id])
+
+
+def release_url(deliveryorder_id):
+    """Return the release URL of a delivery order"""
+    return reverse('WMS:deliveryorder-release', args=[deliveryorder_id])
+
+
+def lines_url(deliveryorder_id):
+    """Return the lines URL of a delivery order"""
+    return reverse('WMS:deliveryorder-lines', args=[deliveryorder_id])
+
+
 class DeliveryOrderApiTest(TestCase):
     """Test unauthenticated DeliveryOrder API Access"""
 
@@ -81,3 +120,578 @@ class PrivateDeliveryOrderApiTest(TestCase):
         deliveryOrder = DeliveryOrder.objects.get(id=res.data['id'])
         for key in payload.keys():
             self.assertEqual(payload[key], getattr(deliveryOrder, key))
+
+    def test_create_numbers_deliveryorder(self):
+        """Test an order posted without a number is given one"""
+        res = self.client.post(DELIVERYORDER_URL, {
+            'sentFrom': 'Makassar', 'sentTo': 'Jayabaya', 'price': 1
+        })
+
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+        self.assertRegex(res.data['deliveryNumber'], r'^DO-\d{8}$')
+
+    def test_create_number_taken_concurrently(self):
+        """Test a number taken before the insert is a bad request"""
+        sample_deliveryorder(user=self.user, deliveryNumber='DO-00000001')
+
+        with patch('WMS.views.allocate', return_value=['DO-00000001']):
+            res = self.client.post(DELIVERYORDER_URL, {
+                'sentFrom': 'Makassar', 'sentTo': 'Jayabaya', 'price': 1
+            })
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('deliveryNumber', res.data)
+
+    def test_filter_deliveryorders_by_products(self):
+        """Test returning delivery orders with specific products"""
+        product1 = sample_product(user=self.user, title='Product1')
+        product2 = sample_product(user=self.user, title='Product2')
+        order1 = sample_deliveryorder(user=self.user, deliveryNumber='TRN-1')
+        order2 = sample_deliveryorder(user=self.user, deliveryNumber='TRN-2')
+        order1.products.add(product1)
+        order2.products.add(product2)
+
+        res = self.client.get(DELIVERYORDER_URL, {'products': product1.id})
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual([item['id'] for item in res.data], [order1.id])
+
+    def test_detail_nests_products(self):
+        """Test the detail renders products with tags and categories"""
+        product = sample_product(user=self.user)
+        product.tags.add(Tag.objects.create(user=self.user, name='Fragile'))
+        order = sample_deliveryorder(user=self.user)
+        order.products.add(product)
+
+        res = self.client.get(detail_url(order.id))
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data['products'][0]['title'], product.title)
+        self.assertEqual(res.data['products'][0]['tags'][0]['name'],
+                         'Fragile')
+
+    def test_list_expand_products(self):
+        """Test the list nests products only when expanded"""
+        order = sample_deliveryorder(user=self.user)
+        product = sample_product(user=self.user)
+        order.products.add(product)
+
+        flat = self.client.get(DELIVERYORDER_URL)
+        expanded = self.client.get(DELIVERYORDER_URL, {'expand': 'products'})
+        invalid = self.client.get(DELIVERYORDER_URL, {'expand': 'wave'})
+
+        self.assertEqual(flat.data[0]['products'], [product.id])
+        self.assertEqual(expanded.data[0]['products'][0]['id'], product.id)
+        self.assertEqual(invalid.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class DeliveryOrderTotalsTests(TestCase):
+    """Test delivery order totals computed from their lines"""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            'totals@domain.com',
+            'testpass'
+        )
+        self.client.force_authenticate(self.user)
+        self.bolt = sample_product(self.user, title='Bolt', price=2,
+                                   weight='0.5')
+        self.nut = sample_product(self.user, title='Nut', price=1,
+                                  weight='0.25')
+
+    def test_totals_follow_products(self):
+        """Test adding products and repricing them updates the totals"""
+        order = sample_deliveryorder(self.user)
+        order.products.add(self.bolt, self.nut)
+
+        res = self.client.get(detail_url(order.id))
+
+        self.assertEqual(
+            (res.data['total_price'], res.data['total_weight']),
+            ('3.000', '0.750')
+        )
+        self.bolt.price = 5
+        self.bolt.save()
+        order.refresh_from_db()
+        self.assertEqual(order.total_price, 6)
+
+    def test_set_lines(self):
+        """Test replacing the lines sets quantities and totals"""
+        order = sample_deliveryorder(self.user)
+        order.products.add(self.nut)
+
+        res = self.client.put(lines_url(order.id), [
+            {'product': self.bolt.id, 'quantity': 3},
+            {'product': self.bolt.id, 'quantity': 1},
+        ], format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data, {
+            'total_price': '8.000',
+            'total_weight': '2.000',
+            'lines': [{'product': self.bolt.id, 'quantity': 4}],
+        })
+        self.assertEqual(list(order.products.all()), [self.bolt])
+
+    def test_set_lines_unknown_product(self):
+        """Test lines for another user's product are rejected"""
+        other = get_user_model().objects.create_user(
+            'other@domain.com',
+            'testpass'
+        )
+        product = sample_product(other, title='Foreign')
+        order = sample_deliveryorder(self.user)
+
+        res = self.client.put(lines_url(order.id), [
+            {'product': product.id, 'quantity': 1},
+        ], format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_filter_and_sort_by_totals(self):
+        """Test orders are filtered and sorted on their totals"""
+        for number, quantity in (('TRN-1', 1), ('TRN-2', 5), ('TRN-3', 3)):
+            order = sample_deliveryorder(self.user, deliveryNumber=number)
+            self.client.put(lines_url(order.id), [
+                {'product': self.bolt.id, 'quantity': quantity},
+            ], format='json')
+
+        res = self.client.get(DELIVERYORDER_URL, {
+            'min_total_price': 4,
+            'ordering': '-total_weight',
+        })
+
+        self.assertEqual([item['deliveryNumber'] for item in res.data],
+                         ['TRN-2', 'TRN-3'])
+        res = self.client.get(DELIVERYORDER_URL, {
+            'ordering': 'total_price', 'page_size': 2
+        })
+        self.assertEqual(
+            [item['deliveryNumber'] for item in res.data['results']],
+            ['TRN-1', 'TRN-3']
+        )
+        res = self.client.get(res.data['next'])
+        self.assertEqual(
+            [item['deliveryNumber'] for item in res.data['results']],
+            ['TRN-2']
+        )
+
+    def test_invalid_total_filters(self):
+        """Test unknown orderings and non-numeric bounds are rejected"""
+        for params in ({'ordering': 'price'}, {'max_total_weight': 'x'}):
+            res = self.client.get(DELIVERYORDER_URL, params)
+
+            self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class DeliveryOrderStatusTests(TestCase):
+    """Test the delivery order lifecycle"""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            'status@domain.com',
+            'testpass'
+        )
+        self.client.force_authenticate(self.user)
+        self.orders = [
+            sample_deliveryorder(self.user, deliveryNumber=f'TRN-{i}')
+            for i in range(3)
+        ]
+        self.ids = [order.id for order in self.orders]
+
+    def move(self, order_ids, target):
+        """Post a transition and return the response"""
+        return self.client.post(TRANSITION_URL, {
+            'delivery_orders': order_ids, 'status': target
+        }, format='json')
+
+    def statuses(self):
+        """Return the current status of each sample order"""
+        return list(DeliveryOrder.objects.filter(
+            pk__in=self.ids
+        ).order_by('pk').values_list('status', flat=True))
+
+    def test_new_order_is_draft(self):
+        """Test orders start as drafts with timestamps"""
+        res = self.client.get(detail_url(self.orders[0].id))
+
+        self.assertEqual(res.data['status'], 'draft')
+        self.assertIsNotNone(res.data['created_at'])
+        self.assertIsNotNone(res.data['updated_at'])
+
+    def reserve(self, order_id, product, quantity):
+        """Reserve quantity of product for an order"""
+        return self.client.post(reserve_url(order_id),
+                                [{'product': product.id,
+                                  'quantity': quantity}],
+                                format='json')
+
+    def test_transition(self):
+        """Test many orders move together"""
+        res = self.move(self.ids, 'cancelled')
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data, {'status': 'cancelled', 'moved': 3})
+        self.assertEqual(self.statuses(), ['cancelled'] * 3)
+
+    def test_transition_is_all_or_nothing(self):
+        """Test one order in the wrong status blocks the whole batch"""
+        self.move(self.ids[:1], 'cancelled')
+
+        res = self.move(self.ids, 'cancelled')
+
+        self.assertEqual(res.status_code, status.HTTP_409_CONFLICT)
+        self.assertEqual(res.data['invalid'],
+                         [{'id': self.ids[0], 'status': 'cancelled'}])
+        self.assertEqual(self.statuses(), ['cancelled', 'draft', 'draft'])
+
+    def test_allocated_only_by_reserving(self):
+        """Test orders cannot be allocated without holding stock"""
+        res = self.move(self.ids, 'allocated')
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(self.statuses(), ['draft'] * 3)
+
+    def test_ship_picks_reserved_stock(self):
+        """Test shipping takes the reserved stock out of the ledger"""
+        product = sample_product(self.user)
+        stock = sample_stock(self.user, product)
+        self.reserve(self.ids[0], product, 4)
+        self.move(self.ids[:1], 'picked')
+
+        res = self.move(self.ids[:1], 'shipped')
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        stock.refresh_from_db()
+        self.assertEqual((stock.Quantity, stock.reserved), (6, 0))
+        self.assertFalse(StockReservation.objects.exists())
+        pick = stock.movements.get(kind='pick')
+        self.assertEqual((pick.quantity, pick.delivery_order_id),
+                         (-4, self.ids[0]))
+
+    def test_transition_validation(self):
+        """Test unknown statuses and other users' orders are rejected"""
+        other = get_user_model().objects.create_user(
+            'other@domain.com',
+            'testpass'
+        )
+        foreign = sample_deliveryorder(other, deliveryNumber='TRN-X')
+
+        self.assertEqual(self.move(self.ids, 'draft').status_code,
+                         status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(self.move([foreign.id], 'cancelled').status_code,
+                         status.HTTP_400_BAD_REQUEST)
+
+    def test_transition_query_count(self):
+        """Test the statement count does not grow with the batch
+
+        Checking ownership, the update, looking for reservations to
+        release and bumping the version, with their savepoints.
+        """
+        more = DeliveryOrder.objects.bulk_create([
+            DeliveryOrder(user=self.user, deliveryNumber=f'TRN-B{i}',
+                          sentFrom='Batam', sentTo='Medan', price=1)
+            for i in range(200)
+        ])
+
+        with self.assertNumQueries(7) as small:
+            self.move(self.ids, 'cancelled')
+        with self.assertNumQueries(len(small)):
+            self.move([order.id for order in more], 'cancelled')
+
+    def test_cancel_releases_reservations(self):
+        """Test cancelling gives the reserved stock back"""
+        product = sample_product(self.user)
+        stock = sample_stock(self.user, product)
+        self.reserve(self.ids[0], product, 4)
+        self.reserve(self.ids[1], product, 3)
+        self.move(self.ids[1:2], 'picked')
+        self.assertEqual(self.statuses()[:2], ['allocated', 'picked'])
+
+        self.move(self.ids[:2], 'cancelled')
+
+        stock.refresh_from_db()
+        self.assertEqual((stock.Quantity, stock.reserved), (10, 0))
+        res = self.client.post(reserve_url(self.ids[0]),
+                               [{'product': product.id, 'quantity': 1}],
+                               format='json')
+        self.assertEqual(res.status_code, status.HTTP_409_CONFLICT)
+
+    def test_filter_by_status(self):
+        """Test listing orders in some statuses or still open"""
+        self.move(self.ids[:1], 'cancelled')
+        DeliveryOrder.objects.filter(pk=self.ids[1]).update(
+            status='allocated'
+        )
+
+        res = self.client.get(DELIVERYORDER_URL, {'status': 'allocated'})
+        self.assertEqual([item['id'] for item in res.data], self.ids[1:2])
+        res = self.client.get(DELIVERYORDER_URL, {'open': 1})
+        self.assertEqual([item['id'] for item in res.data], self.ids[1:])
+        res = self.client.get(DELIVERYORDER_URL, {'status': 'lost'})
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class DeliveryOrderReservationTests(TestCase):
+    """Test reserving stock for delivery orders"""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            'reserve@domain.com',
+            'testpass'
+        )
+        self.client.force_authenticate(self.user)
+        self.product = sample_product(self.user)
+        self.order = sample_deliveryorder(self.user)
+
+    def test_reserve_spreads_over_stocks(self):
+        """Test a reservation takes the fullest stocks first"""
+        small = sample_stock(self.user, self.product, StockNo='STK-1',
+                             Quantity=4)
+        large = sample_stock(self.user, self.product, StockNo='STK-2',
+                             Quantity=6)
+
+        res = self.client.post(
+            reserve_url(self.order.id),
+            [{'product': self.product.id, 'quantity': 8}],
+            format='json'
+        )
+
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(
+            [(row['StockNo'], row['quantity']) for row in res.data],
+            [('STK-2', 6), ('STK-1', 2)]
+        )
+        small.refresh_from_db()
+        large.refresh_from_db()
+        self.assertEqual((small.reserved, large.reserved), (2, 6))
+        self.assertEqual((small.version, large.version), (1, 1))
+
+    def test_reserve_insufficient_stock(self):
+        """Test nothing is reserved when the stock cannot cover the order"""
+        sample_stock(self.user, self.product, Quantity=5)
+        other = sample_deliveryorder(self.user, deliveryNumber='TRN-002')
+        self.client.post(reserve_url(other.id),
+                         [{'product': self.product.id, 'quantity': 3}],
+                         format='json')
+
+        res = self.client.post(
+            reserve_url(self.order.id),
+            [{'product': self.product.id, 'quantity': 3}],
+            format='json'
+        )
+
+        self.assertEqual(res.status_code, status.HTTP_409_CONFLICT)
+        self.assertEqual(res.data['available'], {self.product.id: 2})
+        self.assertFalse(self.order.reservations.exists())
+
+    def test_reserve_unknown_product(self):
+        """Test reserving another user's product is rejected"""
+        other_user = get_user_model().objects.create_user(
+            'other@domain.com',
+            'testpass'
+        )
+        product = sample_product(other_user, title='other product')
+
+        res = self.client.post(reserve_url(self.order.id),
+                               [{'product': product.id, 'quantity': 1}],
+                               format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('product', res.data[0])
+
+    def test_reserve_gives_up_on_conflict(self):
+        """Test a reservation reports stock that never stops changing"""
+        sample_stock(self.user, self.product)
+
+        with patch('core.reservations._apply',
+                   side_effect=reservations._StaleStock), \
+                patch('core.reservations._backoff') as backoff:
+            res = self.client.post(
+                reserve_url(self.order.id),
+                [{'product': self.product.id, 'quantity': 1}],
+                format='json'
+            )
+
+        self.assertEqual(res.status_code,
+                         status.HTTP_503_SERVICE_UNAVAILABLE)
+        self.assertEqual(res['Retry-After'], '1')
+        self.assertEqual(backoff.call_count, reservations.MAX_ATTEMPTS)
+
+    def test_release(self):
+        """Test releasing gives the reserved stock back, back to draft"""
+        stock = sample_stock(self.user, self.product)
+        self.client.post(reserve_url(self.order.id),
+                         [{'product': self.product.id, 'quantity': 4}],
+                         format='json')
+
+        res = self.client.post(release_url(self.order.id))
+
+        self.assertEqual(res.data, {'released': 4})
+        stock.refresh_from_db()
+        self.assertEqual(stock.reserved, 0)
+        self.assertFalse(self.order.reservations.exists())
+        self.order.refresh_from_db()
+        self.assertEqual(self.order.status, 'draft')
+
+    def test_delete_releases(self):
+        """Test deleting a delivery order releases its stock"""
+        stock = sample_stock(self.user, self.product)
+        self.client.post(reserve_url(self.order.id),
+                         [{'product': self.product.id, 'quantity': 4}],
+                         format='json')
+
+        self.client.delete(detail_url(self.order.id))
+
+        stock.refresh_from_db()
+        self.assertEqual(stock.reserved, 0)
+
+    def test_reserved_stock_cannot_be_taken(self):
+        """Test other writers only take what is not reserved"""
+        stock = sample_stock(self.user, self.product)
+        self.client.post(reserve_url(self.order.id),
+                         [{'product': self.product.id, 'quantity': 7}],
+                         format='json')
+
+        res = self.client.post(
+            reverse('WMS:stock-decrement', args=[stock.id]),
+            {'quantity': 4}
+        )
+
+        self.assertEqual(res.status_code, status.HTTP_409_CONFLICT)
+        self.assertEqual(res.data['available'], {stock.StockNo: 3})
+
+    def test_pick_consumes_reservation(self):
+        """Test picking for the order uses up its reservation"""
+        stock = sample_stock(self.user, self.product)
+        self.client.post(reserve_url(self.order.id),
+                         [{'product': self.product.id, 'quantity': 7}],
+                         format='json')
+
+        res = self.client.post(reverse('WMS:stock-adjust'), [{
+            'StockNo': stock.StockNo,
+            'delta': -5,
+            'kind': 'pick',
+            'delivery_order': self.order.id,
+        }], format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        stock.refresh_from_db()
+        self.assertEqual((stock.Quantity, stock.reserved), (5, 2))
+        self.assertEqual(
+            self.order.reservations.get().quantity, 2
+        )
+
+
+class DeliveryOrderPickListTests(TestCase):
+    """Test batch pick lists over delivery orders"""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            'picklist@domain.com',
+            'testpass'
+        )
+        self.client.force_authenticate(self.user)
+
+    def test_pick_list(self):
+        """Test picks are walked in location order with sort-back slots"""
+        bolt = sample_product(self.user, title='Bolt')
+        nut = sample_product(self.user, title='Nut')
+        sample_stock(self.user, bolt, StockNo='STK-B', Location='C-03')
+        sample_stock(self.user, nut, StockNo='STK-N', Location='A-07')
+        first = sample_deliveryorder(self.user, deliveryNumber='TRN-1')
+        first.products.add(bolt, nut)
+        second = sample_deliveryorder(self.user, deliveryNumber='TRN-2')
+        second.products.add(nut)
+
+        res = self.client.post(PICK_LIST_URL,
+                               {'delivery_orders': [second.id, first.id]},
+                               format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            [(row['slot'], row['deliveryNumber'])
+             for row in res.data['orders']],
+            [(1, 'TRN-2'), (2, 'TRN-1')]
+        )
+        self.assertEqual(
+            [(pick['sequence'], pick['Location'], pick['quantity'])
+             for pick in res.data['picks']],
+            [(1, 'A-07', 2), (2, 'C-03', 1)]
+        )
+        self.assertEqual(
+            [row['slot'] for row in res.data['picks'][0]['sort']],
+            [1, 2]
+        )
+
+    def test_pick_list_other_users_order(self):
+        """Test orders of another user are rejected"""
+        other_user = get_user_model().objects.create_user(
+            'other@domain.com',
+            'testpass'
+        )
+        order = sample_deliveryorder(other_user)
+
+        res = self.client.post(PICK_LIST_URL,
+                               {'delivery_orders': [order.id]},
+                               format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('delivery_orders', res.data)
+
+
+class DeliveryOrderReservationConcurrencyTests(TransactionTestCase):
+    """Test parallel reservations never oversell"""
+
+    def test_parallel_reservations(self):
+        """Test 50 writers reserve exactly what the stock holds"""
+        user = get_user_model().objects.create_user(
+            'rush@domain.com',
+            'testpass'
+        )
+        product = sample_product(user)
+        for i in range(5):
+            sample_stock(user, product, StockNo=f'STK-{i}', Quantity=20)
+        orders = [
+            sample_deliveryorder(user, deliveryNumber=f'TRN-{i}')
+            for i in range(50)
+        ]
+        statuses = []
+
+        def reserve(order):
+            client = APIClient()
+            client.force_authenticate(user)
+            try:
+                res = client.post(reserve_url(order.id),
+                                  [{'product': product.id, 'quantity': 3}],
+                                  format='json')
+                statuses.append(res.status_code)
+            finally:
+                connection.close()
+
+        writers = [threading.Thread(target=reserve, args=[order])
+                   for order in orders]
+        for writer in writers:
+            writer.start()
+        for writer in writers:
+            writer.join()
+
+        reserved = Stock.objects.aggregate(total=Sum('reserved'))['total']
+        held = StockReservation.objects.aggregate(
+            total=Sum('quantity')
+        )['total']
+        successes = statuses.count(status.HTTP_201_CREATED)
+        self.assertEqual(len(statuses), 50)
+        self.assertEqual(reserved, held)
+        self.assertEqual(reserved, successes * 3)
+        self.assertLessEqual(reserved, 100)
+        self.assertFalse(
+            Stock.objects.filter(reserved__gt=F('Quantity')).exists()
+        )
+        # 100 units cover 33 orders of 3, the rest are refused as short
+        self.assertEqual(successes, 33)
+        self.assertEqual(statuses.count(status.HTTP_409_CONFLICT), 17)
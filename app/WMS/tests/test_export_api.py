@@ -0,0 +1,110 @@
+import csv
+import io
+import json
+
+from django.contrib.auth import get_user_model
+from django.urls import reverse
+from django.test import TestCase
+
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from core.models import Tag, Product, DeliveryOrder, Stock
+
+PRODUCT_EXPORT_URL = reverse('WMS:product-export')
+DELIVERYORDER_EXPORT_URL = reverse('WMS:deliveryorder-export')
+STOCK_EXPORT_URL = reverse('WMS:stock-export')
+
+
+def sample_product(user, **params):
+    """Create and return a sample product"""
+    defaults = {
+        'title': 'sample product',
+        'weight': 5.00,
+        'price': 7.000
+    }
+    defaults.update(params)
+
+    return Product.objects.create(user=user, **defaults)
+
+
+def read_body(res):
+    """Consume a streaming response and return its text"""
+    return b''.join(res.streaming_content).decode('utf-8')
+
+
+class ExportApiTests(TestCase):
+    """Test streaming exports of WMS resources"""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            'export@domain.com',
+            'testpass'
+        )
+        self.client.force_authenticate(self.user)
+        self.tag1 = Tag.objects.create(user=self.user, name='new')
+        self.tag2 = Tag.objects.create(user=self.user, name='old')
+        self.product = sample_product(user=self.user, title='Book')
+        self.product.tags.add(self.tag1, self.tag2)
+        sample_product(user=self.user, title='Pen')
+
+    def test_export_products_csv(self):
+        """Test exporting products as CSV with aggregated tag ids"""
+        res = self.client.get(PRODUCT_EXPORT_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res['Content-Type'], 'text/csv')
+        rows = list(csv.DictReader(io.StringIO(read_body(res))))
+        self.assertEqual([row['title'] for row in rows], ['Book', 'Pen'])
+        self.assertEqual(rows[0]['tags'], f'{self.tag1.id};{self.tag2.id}')
+        self.assertEqual(rows[0]['price'], '7.000')
+        self.assertEqual(rows[1]['tags'], '')
+
+    def test_export_products_ndjson_keeps_all_tags_when_filtered(self):
+        """Test a tag filter narrows the rows but not their tag ids"""
+        res = self.client.get(PRODUCT_EXPORT_URL, {
+            'export_format': 'ndjson',
+            'tags': self.tag1.id,
+        })
+
+        self.assertEqual(res['Content-Type'], 'application/x-ndjson')
+        rows = [json.loads(line) for line in read_body(res).splitlines()]
+        self.assertEqual(len(rows), 1)
+        self.assertEqual(rows[0]['id'], self.product.id)
+        self.assertEqual(rows[0]['tags'], [self.tag1.id, self.tag2.id])
+
+    def test_export_invalid_format(self):
+        """Test an unknown export format is rejected"""
+        res = self.client.get(PRODUCT_EXPORT_URL, {'export_format': 'xml'})
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_export_deliveryorders_and_stocks(self):
+        """Test exporting delivery orders and stocks with product ids"""
+        order = DeliveryOrder.objects.create(
+            user=self.user,
+            deliveryNumber='TRN-001',
+            sentFrom='Batam',
+            sentTo='Palembang',
+            price=72.000
+        )
+        order.products.add(self.product)
+        stock = Stock.objects.create(
+            user=self.user,
+            StockNo='STK-001',
+            Quantity=4,
+            Location='A-01'
+        )
+        stock.products.add(self.product)
+
+        orders = read_body(self.client.get(
+            DELIVERYORDER_EXPORT_URL, {'export_format': 'ndjson'}
+        ))
+        stocks = read_body(self.client.get(
+            STOCK_EXPORT_URL, {'export_format': 'ndjson'}
+        ))
+
+        self.assertEqual(json.loads(orders)['products'], [self.product.id])
+        self.assertEqual(json.loads(stocks)['Quantity'], 4)
+        self.assertEqual(json.loads(stocks)['products'], [self.product.id])
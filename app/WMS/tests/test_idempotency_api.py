@@ -0,0 +1,195 @@
+import threading
+from datetime import timedelta
+
+from django.contrib.auth import get_user_model
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import connection
+from django.urls import reverse
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.utils import timezone
+
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from core.models import DeliveryOrder, IdempotencyKey, Product, Stock
+
+PRODUCT_URL = reverse('WMS:product-list')
+STOCK_RECONCILE_URL = reverse('WMS:stock-reconcile')
+DELIVERYORDER_URL = reverse('WMS:deliveryorder-list')
+
+
+def increment_url(stock_id):
+    """Return the increment URL of a stock"""
+    return reverse('WMS:stock-increment', args=[stock_id])
+
+
+class IdempotencyTests(TestCase):
+    """Test writes retried with an Idempotency-Key header"""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            'retry@domain.com',
+            'testpass'
+        )
+        self.client.force_authenticate(self.user)
+        self.payload = {'title': 'Pallet', 'weight': 20, 'price': 8,
+                        'tags': [], 'categories': []}
+        # Numbered by the server, so posting it twice creates two orders
+        self.order = {'sentFrom': 'Batam', 'sentTo': 'Medan', 'price': 1,
+                      'products': []}
+
+    def post(self, url, payload, key='key-1'):
+        """Post payload with an Idempotency-Key"""
+        return self.client.post(url, payload, format='json',
+                                HTTP_IDEMPOTENCY_KEY=key)
+
+    def test_retry_replays_create(self):
+        """Test a retried create returns the first response only once"""
+        first = self.post(PRODUCT_URL, self.payload)
+        retry = self.post(PRODUCT_URL, self.payload)
+
+        self.assertEqual(first.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(retry.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(retry.data, first.data)
+        self.assertEqual(retry['Idempotent-Replayed'], 'true')
+        self.assertEqual(Product.objects.count(), 1)
+
+    def test_without_key_runs_every_time(self):
+        """Test requests without the header are not deduplicated"""
+        for _ in range(2):
+            self.client.post(DELIVERYORDER_URL, self.order, format='json')
+
+        self.assertEqual(DeliveryOrder.objects.count(), 2)
+
+    def test_key_reused_for_other_request(self):
+        """Test a key sent with a different body is rejected"""
+        self.post(PRODUCT_URL, self.payload)
+        res = self.post(PRODUCT_URL, {**self.payload, 'title': 'Crate'})
+
+        self.assertEqual(res.status_code,
+                         status.HTTP_422_UNPROCESSABLE_ENTITY)
+        self.assertEqual(Product.objects.count(), 1)
+
+    def test_failed_request_not_stored(self):
+        """Test a rejected write leaves its key free for a fixed retry"""
+        failed = self.post(PRODUCT_URL, {'title': 'Pallet'})
+        fixed = self.post(PRODUCT_URL, self.payload)
+
+        self.assertEqual(failed.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(fixed.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(IdempotencyKey.objects.get().status_code, 201)
+
+    def test_keys_are_per_user(self):
+        """Test another user may use the same key"""
+        self.post(DELIVERYORDER_URL, self.order)
+        other = get_user_model().objects.create_user(
+            'other@domain.com',
+            'testpass'
+        )
+        self.client.force_authenticate(other)
+        res = self.post(DELIVERYORDER_URL, self.order)
+
+        self.assertNotIn('Idempotent-Replayed', res)
+        self.assertEqual(
+            DeliveryOrder.objects.filter(user=other).count(), 1
+        )
+
+    def test_expired_key_runs_again(self):
+        """Test a key past its TTL is taken over by the next request"""
+        self.post(PRODUCT_URL, self.payload)
+        IdempotencyKey.objects.update(expires_at=timezone.now())
+
+        res = self.post(PRODUCT_URL, {**self.payload, 'title': 'Crate'})
+
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(Product.objects.count(), 2)
+        self.assertEqual(IdempotencyKey.objects.count(), 1)
+
+    @override_settings(WMS_IDEMPOTENCY={'TTL': 60})
+    def test_ttl_from_settings(self):
+        """Test keys expire after the configured TTL"""
+        self.post(PRODUCT_URL, self.payload)
+        key = IdempotencyKey.objects.get()
+
+        self.assertEqual(key.expires_at - key.created_at,
+                         timedelta(seconds=60))
+
+    def test_invalid_key(self):
+        """Test an empty or overlong key is refused"""
+        for key in ('', 'k' * 256):
+            res = self.post(PRODUCT_URL, self.payload, key=key)
+
+            self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertFalse(Product.objects.exists())
+
+    def test_retry_replays_action(self):
+        """Test a retried stock increment is applied once"""
+        stock = Stock.objects.create(user=self.user, StockNo='STK-1',
+                                     Quantity=10)
+
+        self.post(increment_url(stock.id), {'quantity': 5})
+        retry = self.post(increment_url(stock.id), {'quantity': 5})
+
+        self.assertEqual(retry.data, {'StockNo': 'STK-1', 'Quantity': 15})
+        stock.refresh_from_db()
+        self.assertEqual(stock.Quantity, 15)
+
+    def test_key_reused_for_other_file(self):
+        """Test a different upload with the same file name is rejected"""
+        Stock.objects.create(user=self.user, StockNo='STK-1', Quantity=10)
+
+        def count(content):
+            upload = SimpleUploadedFile('counts.csv', content,
+                                        content_type='text/csv')
+            return self.client.post(STOCK_RECONCILE_URL, {'file': upload},
+                                    format='multipart',
+                                    HTTP_IDEMPOTENCY_KEY='count-1')
+
+        first = count(b'StockNo,counted\nSTK-1,12\n')
+        retry = count(b'StockNo,counted\nSTK-1,12\n')
+        other = count(b'StockNo,counted\nSTK-1,3\n')
+
+        self.assertEqual(first.status_code, status.HTTP_200_OK)
+        self.assertEqual(retry['Idempotent-Replayed'], 'true')
+        self.assertEqual(other.status_code,
+                         status.HTTP_422_UNPROCESSABLE_ENTITY)
+        self.assertEqual(Stock.objects.get().Quantity, 12)
+
+
+class IdempotencyConcurrencyTests(TransactionTestCase):
+    """Test concurrent requests sharing an Idempotency-Key"""
+
+    def test_parallel_duplicates(self):
+        """Test 10 parallel duplicates increment the stock once"""
+        user = get_user_model().objects.create_user(
+            'rush@domain.com',
+            'testpass'
+        )
+        stock = Stock.objects.create(user=user, StockNo='STK-1', Quantity=0)
+        responses = []
+
+        def increment():
+            client = APIClient()
+            client.force_authenticate(user)
+            try:
+                responses.append(client.post(
+                    increment_url(stock.id), {'quantity': 1},
+                    format='json', HTTP_IDEMPOTENCY_KEY='rush'
+                ))
+            finally:
+                connection.close()
+
+        writers = [threading.Thread(target=increment) for _ in range(10)]
+        for writer in writers:
+            writer.start()
+        for writer in writers:
+            writer.join()
+
+        stock.refresh_from_db()
+        self.assertEqual(stock.Quantity, 1)
+        self.assertEqual([res.status_code for res in responses],
+                         [status.HTTP_200_OK] * 10)
+        self.assertEqual(
+            sum('Idempotent-Replayed' in res for res in responses), 9
+        )
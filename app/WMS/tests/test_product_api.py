@@ -1,19 +1,24 @@
+import base64
 import tempfile
 import os
 
 from PIL import Image
 
 from django.contrib.auth import get_user_model
+from django.db import connection
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
 
 from rest_framework import status
 from rest_framework.test import APIClient
 
-from core.models import Product, Tag, Category
+from core.models import Category, DeliveryOrder, Product, Tag
 from WMS.serializers import ProductSerializer
 
 PRODUCT_URL = reverse('WMS:product-list')
+PRODUCT_BULK_URL = reverse('WMS:product-bulk-upsert')
+PRODUCT_FACETS_URL = reverse('WMS:product-facets')
 
 
 def image_upload_url(product_id):
@@ -160,6 +165,254 @@ class PrivateProductApiTest(TestCase):
         tags = product.tags.all()
         self.assertEqual(len(tags), 0)
 
+    def test_list_products_keyset_paginated(self):
+        """Test walking the product list with cursor pagination"""
+        products = [
+            sample_product(user=self.user, title=f'product {i}')
+            for i in range(5)
+        ]
+
+        res = self.client.get(PRODUCT_URL, {'page_size': 2})
+        seen = []
+        pages = 0
+        while True:
+            self.assertEqual(res.status_code, status.HTTP_200_OK)
+            seen.extend(item['id'] for item in res.data['results'])
+            pages += 1
+            if not res.data['next']:
+                break
+            res = self.client.get(res.data['next'])
+
+        self.assertEqual(pages, 3)
+        self.assertEqual(seen, [product.id for product in products])
+        res = self.client.get(res.data['previous'])
+        self.assertEqual(
+            [item['id'] for item in res.data['results']],
+            [products[2].id, products[3].id]
+        )
+
+    def test_paginated_list_avoids_offset_and_count(self):
+        """Test cursor pages are selected without OFFSET or COUNT(*)"""
+        for i in range(3):
+            sample_product(user=self.user, title=f'product {i}')
+        first = self.client.get(PRODUCT_URL, {'page_size': 1})
+
+        with CaptureQueriesContext(connection) as queries:
+            res = self.client.get(first.data['next'])
+
+        self.assertEqual(len(res.data['results']), 1)
+        for query in queries.captured_queries:
+            self.assertNotIn('OFFSET', query['sql'])
+            self.assertNotIn('COUNT(', query['sql'])
+
+    def test_invalid_cursor(self):
+        """Test that a tampered cursor is rejected"""
+        res = self.client.get(PRODUCT_URL, {'cursor': 'not-a-cursor'})
+
+        self.assertEqual(res.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_cursor_with_invalid_key(self):
+        """Test a cursor holding a value the key cannot take is rejected"""
+        for url, position in ((PRODUCT_URL, b'p=abc'),
+                              (reverse('WMS:stockalert-list'),
+                               b'p=abc&p=1')):
+            cursor = base64.urlsafe_b64encode(position).decode()
+
+            res = self.client.get(url, {'cursor': cursor})
+
+            self.assertEqual(res.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_bulk_create_products(self):
+        """Test creating many products in one request"""
+        tag = sample_tag(user=self.user)
+        category = sample_category(user=self.user)
+        payload = [
+            {
+                'title': f'bulk {i}',
+                'weight': 1,
+                'price': 2,
+                'tags': [tag.id],
+                'categories': [category.id],
+            }
+            for i in range(3)
+        ]
+        res = self.client.post(PRODUCT_BULK_URL, payload, format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual([item['status'] for item in res.data],
+                         ['created'] * 3)
+        products = Product.objects.filter(user=self.user)
+        self.assertEqual(products.count(), 3)
+        for product in products:
+            self.assertEqual(list(product.tags.all()), [tag])
+            self.assertEqual(list(product.categories.all()), [category])
+
+    def test_bulk_upsert_updates_existing_by_title(self):
+        """Test bulk upsert updates products matched by title"""
+        product = sample_product(user=self.user, title='existing')
+        product.tags.add(sample_tag(user=self.user))
+        new_tag = sample_tag(user=self.user, name='old')
+        payload = [
+            {'title': 'existing', 'weight': 9, 'price': 8,
+             'tags': [new_tag.id]},
+            {'title': 'fresh', 'weight': 1, 'price': 1},
+        ]
+        res = self.client.post(PRODUCT_BULK_URL, payload, format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data[0]['id'], product.id)
+        self.assertEqual(res.data[0]['status'], 'updated')
+        self.assertEqual(res.data[1]['status'], 'created')
+        product.refresh_from_db()
+        self.assertEqual(product.weight, 9)
+        self.assertEqual(list(product.tags.all()), [new_tag])
+
+    def test_bulk_upsert_updates_order_totals(self):
+        """Test bulk upsert carries new prices into the orders"""
+        product = sample_product(user=self.user, title='existing')
+        order = DeliveryOrder.objects.create(
+            user=self.user,
+            deliveryNumber='TRN-001',
+            sentFrom='Batam',
+            sentTo='Palembang',
+            price=10
+        )
+        order.products.add(product)
+
+        res = self.client.post(PRODUCT_BULK_URL, [
+            {'title': 'existing', 'weight': 3, 'price': 7},
+        ], format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        order.refresh_from_db()
+        self.assertEqual((order.total_price, order.total_weight), (7, 3))
+
+    def test_bulk_upsert_invalid_writes_nothing(self):
+        """Test bulk upsert reports per item errors and rolls back"""
+        payload = [
+            {'title': 'ok', 'weight': 1, 'price': 1},
+            {'title': 'ok', 'weight': 1, 'price': 1},
+            {'title': 'bad tag', 'weight': 1, 'price': 1, 'tags': [999]},
+        ]
+        res = self.client.post(PRODUCT_BULK_URL, payload, format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('title', res.data[0])
+        self.assertIn('tags', res.data[2])
+        self.assertFalse(Product.objects.exists())
+
+    def test_bulk_upsert_query_count_is_constant(self):
+        """Test bulk upsert cost does not grow per product"""
+        tag = sample_tag(user=self.user)
+        payload = [
+            {'title': f'bulk {i}', 'weight': 1, 'price': 1, 'tags': [tag.id]}
+            for i in range(50)
+        ]
+        with CaptureQueriesContext(connection) as queries:
+            res = self.client.post(PRODUCT_BULK_URL, payload, format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertLess(len(queries), 15)
+
+    def test_search_products_by_word_prefix(self):
+        """Test searching products by the start of a word"""
+        book = sample_product(user=self.user, title='Buku Matematika')
+        sample_product(user=self.user, title='Pensil Warna')
+
+        res = self.client.get(PRODUCT_URL, {'search': 'matem'})
+
+        self.assertEqual([item['id'] for item in res.data], [book.id])
+
+    def test_search_products_tolerates_typos(self):
+        """Test searching products with a misspelt title"""
+        notebook = sample_product(user=self.user, title='Notebook')
+        sample_product(user=self.user, title='Pensil')
+
+        res = self.client.get(PRODUCT_URL, {'search': 'notebok'})
+
+        self.assertEqual([item['id'] for item in res.data], [notebook.id])
+
+    def test_search_products_ranked_and_filtered(self):
+        """Test search ranks closer matches first and honours filters"""
+        tag = sample_tag(user=self.user)
+        close = sample_product(user=self.user, title='Pen')
+        far = sample_product(user=self.user, title='Pen case leather')
+        untagged = sample_product(user=self.user, title='Pen holder')
+        close.tags.add(tag)
+        far.tags.add(tag)
+
+        res = self.client.get(PRODUCT_URL, {'search': 'pen', 'tags': tag.id})
+
+        ids = [item['id'] for item in res.data]
+        self.assertEqual(ids, [close.id, far.id])
+        self.assertNotIn(untagged.id, ids)
+
+    def test_search_products_paginated_by_rank(self):
+        """Test cursor pages over search results keep the ranking"""
+        expected = [
+            sample_product(user=self.user, title=title).id
+            for title in ('Pen', 'Pen case', 'Pen case leather')
+        ]
+
+        res = self.client.get(PRODUCT_URL, {'search': 'pen', 'page_size': 2})
+        ids = [item['id'] for item in res.data['results']]
+        res = self.client.get(res.data['next'])
+        ids += [item['id'] for item in res.data['results']]
+
+        self.assertEqual(ids, expected)
+
+    def test_search_pages_visit_every_result_once(self):
+        """Test following next over a search returns each product once"""
+        products = [
+            sample_product(user=self.user, title=title).id
+            for title in ('Widget', 'Blue widget', 'Widget stand',
+                          'Small widget box', 'Widgets', 'Old widget kit')
+        ]
+
+        res = self.client.get(PRODUCT_URL, {'search': 'widget',
+                                            'page_size': 1})
+        seen = []
+        while True:
+            seen.extend(item['id'] for item in res.data['results'])
+            if not res.data['next'] or len(seen) > len(products):
+                break
+            res = self.client.get(res.data['next'])
+
+        self.assertEqual(sorted(seen), sorted(products))
+
+    def test_search_without_words_pages_nothing(self):
+        """Test a search of punctuation alone is an empty page"""
+        sample_product(user=self.user, title='Widget')
+
+        res = self.client.get(PRODUCT_URL, {'search': '--', 'page_size': 10})
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data['results'], [])
+
+    def test_product_facets(self):
+        """Test counting matching products per tag and category"""
+        tag1 = sample_tag(user=self.user, name='new')
+        tag2 = sample_tag(user=self.user, name='old')
+        category = sample_category(user=self.user)
+        product1 = sample_product(user=self.user, title='Book one')
+        product2 = sample_product(user=self.user, title='Book two')
+        product3 = sample_product(user=self.user, title='Pen')
+        product1.tags.add(tag1, tag2)
+        product2.tags.add(tag1)
+        product3.tags.add(tag2)
+        product1.categories.add(category)
+
+        res = self.client.get(PRODUCT_FACETS_URL, {'search': 'book'})
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data['tags'], [
+            {'id': tag1.id, 'name': 'new', 'count': 2},
+            {'id': tag2.id, 'name': 'old', 'count': 1},
+        ])
+        self.assertEqual(res.data['categories'], [
+            {'id': category.id, 'name': 'Book', 'count': 1},
+        ])
+
 
 class ProductImageUploadTests(TestCase):
 
@@ -0,0 +1,145 @@
+from django.contrib.auth import get_user_model
+from django.urls import reverse
+from django.test import TestCase
+
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from core.models import Tag, Category, Product, DeliveryOrder, Stock
+
+
+def sample_catalog(user, count=5, prefix='product'):
+    """Create products that each carry two tags and two categories"""
+    products = []
+    for i in range(count):
+        product = Product.objects.create(
+            user=user,
+            title=f'{prefix} {i}',
+            weight=5.00,
+            price=7.000
+        )
+        product.tags.add(
+            Tag.objects.create(user=user, name=f'{prefix} tag {i}a'),
+            Tag.objects.create(user=user, name=f'{prefix} tag {i}b'),
+        )
+        product.categories.add(
+            Category.objects.create(user=user,
+                                    name=f'{prefix} category {i}a'),
+            Category.objects.create(user=user,
+                                    name=f'{prefix} category {i}b'),
+        )
+        products.append(product)
+
+    return products
+
+
+class QueryBudgetTests(TestCase):
+    """Test list and detail endpoints issue a fixed number of queries
+
+    Every conditional read starts with one lookup of resource versions.
+    """
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            'budget@domain.com',
+            'testpass'
+        )
+        self.client.force_authenticate(self.user)
+        self.products = sample_catalog(self.user)
+        for i in range(5):
+            order = DeliveryOrder.objects.create(
+                user=self.user,
+                deliveryNumber=f'TRN-{i}',
+                sentFrom='Batam',
+                sentTo='Palembang',
+                price=72.000
+            )
+            order.products.set(self.products)
+            stock = Stock.objects.create(
+                user=self.user,
+                StockNo=f'STK-{i}',
+                Quantity=10,
+                Location='A-01'
+            )
+            stock.products.set(self.products)
+        self.order = order
+        self.stock = stock
+
+    def assertQueryBudget(self, budget, url, params=None):
+        """Assert a GET on url stays within the query budget"""
+        with self.assertNumQueries(budget):
+            res = self.client.get(url, params)
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+
+    def test_product_list_budget(self):
+        """Test listing products reads tag and category ids inline"""
+        self.assertQueryBudget(2, reverse('WMS:product-list'))
+
+    def test_product_paginated_list_budget(self):
+        """Test a product page costs the same as the full list"""
+        self.assertQueryBudget(2, reverse('WMS:product-list'),
+                               {'page_size': 2})
+
+    def test_product_detail_budget(self):
+        """Test the nested product detail prefetches its relations"""
+        url = reverse('WMS:product-detail', args=[self.products[0].id])
+        self.assertQueryBudget(4, url)
+
+    def test_deliveryorder_list_budget(self):
+        """Test listing delivery orders reads product ids inline"""
+        self.assertQueryBudget(2, reverse('WMS:deliveryorder-list'))
+
+    def test_deliveryorder_detail_budget(self):
+        """Test delivery order detail nests products in one prefetch tree
+
+        The order, its products, their categories and their tags are one
+        query each however many products the order holds.
+        """
+        url = reverse('WMS:deliveryorder-detail', args=[self.order.id])
+        self.assertQueryBudget(5, url)
+        self.order.products.add(*sample_catalog(self.user, 20, 'more'))
+        self.assertQueryBudget(5, url)
+
+    def test_deliveryorder_expanded_list_budget(self):
+        """Test expanding products on the list costs the same per page"""
+        self.assertQueryBudget(5, reverse('WMS:deliveryorder-list'),
+                               {'expand': 'products'})
+        self.assertQueryBudget(5, reverse('WMS:deliveryorder-list'),
+                               {'expand': 'products', 'page_size': 2})
+
+    def test_stock_list_budget(self):
+        """Test listing stocks reads product ids inline"""
+        self.assertQueryBudget(2, reverse('WMS:stock-list'))
+
+    def test_stock_detail_budget(self):
+        """Test stock detail nests products in one prefetch tree"""
+        url = reverse('WMS:stock-detail', args=[self.stock.id])
+        self.assertQueryBudget(5, url)
+        self.stock.products.add(*sample_catalog(self.user, 20, 'more'))
+        self.assertQueryBudget(5, url)
+
+    def test_stock_expanded_list_budget(self):
+        """Test expanding products on the stock list is constant too"""
+        self.assertQueryBudget(5, reverse('WMS:stock-list'),
+                               {'expand': 'products'})
+
+    def test_tag_list_budget(self):
+        """Test listing tags is a single query"""
+        self.assertQueryBudget(2, reverse('WMS:tag-list'),
+                               {'assigned_only': 1})
+
+    def test_tag_list_with_counts_budget(self):
+        """Test tag product counts come from the same single query"""
+        self.assertQueryBudget(2, reverse('WMS:tag-list'),
+                               {'assigned_only': 1, 'with_counts': 1})
+
+    def test_product_facets_budget(self):
+        """Test product facets cost one query per facet"""
+        self.assertQueryBudget(2, reverse('WMS:product-facets'),
+                               {'tags': self.products[0].tags.first().id})
+
+    def test_category_list_budget(self):
+        """Test listing categories is a single query"""
+        self.assertQueryBudget(2, reverse('WMS:category-list'),
+                               {'assigned_only': 1})
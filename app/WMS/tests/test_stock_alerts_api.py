@@ -0,0 +1,122 @@
+from django.contrib.auth import get_user_model
+from django.urls import reverse
+from django.test import TestCase
+
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from core.models import Product, Stock, StockAlert
+
+STOCK_ALERT_URL = reverse('WMS:stockalert-list')
+
+
+class PublicStockAlertApiTests(TestCase):
+    """Test unauthenticated stock alert API access"""
+
+    def setUp(self):
+        self.client = APIClient()
+
+    def test_auth_required(self):
+        """Test that authentication is required"""
+        res = self.client.get(STOCK_ALERT_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
+
+
+class PrivateStockAlertApiTests(TestCase):
+    """Test the low-stock alert feed"""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            'alerts@domain.com',
+            'testpass'
+        )
+        self.client.force_authenticate(self.user)
+        self.product = Product.objects.create(user=self.user, title='Pen',
+                                              weight=1, price=1)
+        self.stock = Stock.objects.create(user=self.user, StockNo='STK-1',
+                                          Quantity=6)
+        self.stock.products.add(self.product)
+
+    def test_setting_reorder_point_opens_alert(self):
+        """Test raising a reorder point over the stock alerts at once"""
+        res = self.client.patch(
+            reverse('WMS:product-detail', args=[self.product.id]),
+            {'reorder_point': 10}
+        )
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        feed = self.client.get(STOCK_ALERT_URL).data
+        self.assertEqual(
+            [(alert['title'], alert['on_hand'], alert['reorder_point'])
+             for alert in feed],
+            [('Pen', 6, 10)]
+        )
+
+    def test_decrement_opens_and_increment_resolves(self):
+        """Test stock writes keep the feed current, latest first"""
+        Product.objects.filter(pk=self.product.pk).update(reorder_point=5)
+
+        self.client.post(reverse('WMS:stock-decrement', args=[self.stock.id]),
+                         {'quantity': 2})
+        self.client.post(reverse('WMS:stock-increment', args=[self.stock.id]),
+                         {'quantity': 3})
+        self.client.post(reverse('WMS:stock-decrement', args=[self.stock.id]),
+                         {'quantity': 4})
+
+        feed = self.client.get(STOCK_ALERT_URL).data
+        self.assertEqual([alert['on_hand'] for alert in feed], [3, 4])
+        self.assertIsNone(feed[0]['resolved_at'])
+        self.assertIsNotNone(feed[1]['resolved_at'])
+        open_feed = self.client.get(STOCK_ALERT_URL, {'open': 1}).data
+        self.assertEqual([alert['id'] for alert in open_feed],
+                         [feed[0]['id']])
+
+    def test_delete_opens_alert(self):
+        """Test deleting stock alerts on the product it held"""
+        Product.objects.filter(pk=self.product.pk).update(reorder_point=8)
+        held = Stock.objects.create(user=self.user, StockNo='STK-2',
+                                    Quantity=4, product=self.product)
+
+        res = self.client.delete(reverse('WMS:stock-detail', args=[held.id]))
+
+        self.assertEqual(res.status_code, status.HTTP_204_NO_CONTENT)
+        feed = self.client.get(STOCK_ALERT_URL).data
+        self.assertEqual([alert['on_hand'] for alert in feed], [6])
+
+    def test_moving_stock_evaluates_both_products(self):
+        """Test moving stock to another product alerts on the one left"""
+        Product.objects.filter(pk=self.product.pk).update(reorder_point=5)
+        ink = Product.objects.create(user=self.user, title='Ink', weight=1,
+                                     price=1, reorder_point=8)
+        StockAlert.objects.create(user=self.user, product=ink,
+                                  reorder_point=8, on_hand=0)
+
+        res = self.client.patch(
+            reverse('WMS:stock-detail', args=[self.stock.id]),
+            {'products': [ink.id], 'Quantity': 9},
+            format='json'
+        )
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        open_feed = self.client.get(STOCK_ALERT_URL, {'open': 1}).data
+        self.assertEqual(
+            [(alert['title'], alert['on_hand']) for alert in open_feed],
+            [('Pen', 0)]
+        )
+
+    def test_feed_limited_to_user(self):
+        """Test alerts of other users are not listed"""
+        other = get_user_model().objects.create_user(
+            'other@domain.com',
+            'testpass'
+        )
+        product = Product.objects.create(user=other, title='Ink',
+                                         weight=1, price=1)
+        StockAlert.objects.create(user=other, product=product,
+                                  reorder_point=1, on_hand=0)
+
+        res = self.client.get(STOCK_ALERT_URL)
+
+        self.assertEqual(res.data, [])
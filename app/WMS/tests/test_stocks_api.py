@@ -0,0 +1,735 @@
+import os
+import threading
+import time
+import unittest
+
+from django.contrib.auth import get_user_model
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import IntegrityError, connection, transaction
+from django.urls import reverse
+from django.test import TestCase, TransactionTestCase
+from django.utils import timezone
+
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from core.models import DeliveryOrder, Product, Stock, StockMovement
+
+STOCK_URL = reverse('WMS:stock-list')
+STOCK_ADJUST_URL = reverse('WMS:stock-adjust')
+STOCK_TRANSFER_URL = reverse('WMS:stock-transfer')
+STOCK_AS_OF_URL = reverse('WMS:stock-as-of')
+STOCK_SUMMARY_URL = reverse('WMS:stock-summary')
+STOCK_RECONCILE_URL = reverse('WMS:stock-reconcile')
+
+
+def increment_url(stock_id):
+    """Return the increment URL of a stock"""
+    return reverse('WMS:stock-increment', args=[stock_id])
+
+
+def decrement_url(stock_id):
+    """Return the decrement URL of a stock"""
+    return reverse('WMS:stock-decrement', args=[stock_id])
+
+
+def movements_url(stock_id):
+    """Return the ledger URL of a stock"""
+    return reverse('WMS:stock-movements', args=[stock_id])
+
+
+def sample_stock(user, **params):
+    """Create and return a sample stock"""
+    defaults = {
+        'StockNo': 'STK-001',
+        'Quantity': 10,
+        'Location': 'A-01',
+    }
+    defaults.update(params)
+
+    return Stock.objects.create(user=user, **defaults)
+
+
+class StockAdjustmentTests(TestCase):
+    """Test the stock increment, decrement and adjust endpoints"""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            'stock@domain.com',
+            'testpass'
+        )
+        self.client.force_authenticate(self.user)
+        self.stock = sample_stock(self.user)
+
+    def test_increment(self):
+        """Test incrementing returns and stores the new quantity"""
+        res = self.client.post(increment_url(self.stock.id), {'quantity': 5})
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data, {'StockNo': 'STK-001', 'Quantity': 15})
+        self.stock.refresh_from_db()
+        self.assertEqual(self.stock.Quantity, 15)
+
+    def test_decrement(self):
+        """Test decrementing takes from the quantity"""
+        res = self.client.post(decrement_url(self.stock.id), {'quantity': 4})
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data['Quantity'], 6)
+
+    def test_decrement_below_zero_conflicts(self):
+        """Test a decrement larger than the stock is refused"""
+        res = self.client.post(decrement_url(self.stock.id),
+                               {'quantity': 11})
+
+        self.assertEqual(res.status_code, status.HTTP_409_CONFLICT)
+        self.assertEqual(res.data['available'], {'STK-001': 10})
+        self.stock.refresh_from_db()
+        self.assertEqual(self.stock.Quantity, 10)
+
+    def test_quantity_must_be_positive(self):
+        """Test increments and decrements need a positive quantity"""
+        res = self.client.post(increment_url(self.stock.id), {'quantity': 0})
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_other_users_stock_not_found(self):
+        """Test another user's stock cannot be adjusted"""
+        other = get_user_model().objects.create_user(
+            'other@domain.com',
+            'testpass'
+        )
+        stock = sample_stock(other, StockNo='STK-OTHER')
+
+        res = self.client.post(increment_url(stock.id), {'quantity': 1})
+
+        self.assertEqual(res.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_adjust_batch(self):
+        """Test a batch is one ledger insert and one balance update"""
+        sample_stock(self.user, StockNo='STK-002', Quantity=3)
+
+        # Savepoints, lock, insert, update and the low-stock evaluation
+        with self.assertNumQueries(6):
+            res = self.client.post(STOCK_ADJUST_URL, [
+                {'StockNo': 'STK-002', 'delta': 2},
+                {'StockNo': 'STK-001', 'delta': -7},
+                {'StockNo': 'STK-002', 'delta': -1},
+            ], format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data, [
+            {'StockNo': 'STK-002', 'Quantity': 4},
+            {'StockNo': 'STK-001', 'Quantity': 3},
+        ])
+        self.assertEqual(
+            dict(Stock.objects.values_list('StockNo', 'Quantity')),
+            {'STK-001': 3, 'STK-002': 4}
+        )
+
+    def test_adjust_is_all_or_nothing(self):
+        """Test one short stock leaves the whole batch unapplied"""
+        sample_stock(self.user, StockNo='STK-002', Quantity=3)
+
+        res = self.client.post(STOCK_ADJUST_URL, [
+            {'StockNo': 'STK-001', 'delta': 5},
+            {'StockNo': 'STK-002', 'delta': -4},
+        ], format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_409_CONFLICT)
+        self.assertEqual(res.data['available'], {'STK-002': 3})
+        self.assertEqual(
+            dict(Stock.objects.values_list('StockNo', 'Quantity')),
+            {'STK-001': 10, 'STK-002': 3}
+        )
+
+    def test_adjust_unknown_stock(self):
+        """Test unknown stock numbers are reported"""
+        res = self.client.post(STOCK_ADJUST_URL, [
+            {'StockNo': 'STK-404', 'delta': 1},
+        ], format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('STK-404', res.data['StockNo'][0])
+
+    def test_adjust_rejects_zero_delta(self):
+        """Test a zero delta is a validation error of its item"""
+        res = self.client.post(STOCK_ADJUST_URL, [
+            {'StockNo': 'STK-001', 'delta': 1},
+            {'StockNo': 'STK-001', 'delta': 0},
+        ], format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(res.data[0], {})
+        self.assertIn('delta', res.data[1])
+
+    def test_update_below_zero_is_invalid(self):
+        """Test a full update cannot store a negative quantity"""
+        res = self.client.patch(
+            reverse('WMS:stock-detail', args=[self.stock.id]),
+            {'Quantity': -1}
+        )
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_database_rejects_negative_quantity(self):
+        """Test the CHECK constraint guards every other writer"""
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            Stock.objects.filter(pk=self.stock.pk).update(Quantity=-1)
+
+
+class StockLedgerTests(TestCase):
+    """Test every quantity change is recorded in the movement ledger"""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            'ledger@domain.com',
+            'testpass'
+        )
+        self.client.force_authenticate(self.user)
+
+    def create_stock(self, **params):
+        """Create a stock through the API and return it"""
+        payload = {'StockNo': 'STK-001', 'Quantity': 10, 'products': []}
+        payload.update(params)
+        res = self.client.post(STOCK_URL, payload)
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+
+        return Stock.objects.get(id=res.data['id'])
+
+    def assertLedgerMatches(self, stock):
+        """Assert the ledger sums to the stored quantity"""
+        stock.refresh_from_db()
+        movements = list(stock.movements.order_by('created_at', 'id'))
+        self.assertEqual(sum(m.quantity for m in movements), stock.Quantity)
+        self.assertEqual(movements[-1].balance, stock.Quantity)
+
+    def test_create_opens_balance(self):
+        """Test creating a stock records its opening quantity"""
+        stock = self.create_stock()
+
+        movement = stock.movements.get()
+        self.assertEqual(movement.kind, StockMovement.Kind.OPENING)
+        self.assertEqual(movement.quantity, 10)
+
+    def test_update_books_difference(self):
+        """Test changing the quantity by update records an adjustment"""
+        stock = self.create_stock()
+
+        res = self.client.patch(
+            reverse('WMS:stock-detail', args=[stock.id]),
+            {'Quantity': 4, 'Location': 'B-02'}
+        )
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data['Quantity'], 4)
+        self.assertEqual(stock.movements.latest('id').quantity, -6)
+        self.assertLedgerMatches(stock)
+
+    def test_adjust_records_details(self):
+        """Test picks carry the product and delivery order they serve"""
+        stock = self.create_stock()
+        product = Product.objects.create(user=self.user, title='Box',
+                                         weight=1, price=1)
+        order = DeliveryOrder.objects.create(
+            user=self.user,
+            deliveryNumber='TRN-001',
+            sentFrom='Batam',
+            sentTo='Palembang',
+            price=10
+        )
+
+        res = self.client.post(STOCK_ADJUST_URL, [
+            {'StockNo': 'STK-001', 'delta': -3, 'kind': 'pick',
+             'product': product.id, 'delivery_order': order.id,
+             'reference': 'wave 7'},
+            {'StockNo': 'STK-001', 'delta': 5, 'kind': 'receipt'},
+        ], format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        pick, receipt = stock.movements.filter(
+            kind__in=('pick', 'receipt')
+        ).order_by('id')
+        self.assertEqual((pick.product, pick.delivery_order),
+                         (product, order))
+        self.assertEqual((pick.balance, receipt.balance), (7, 12))
+        self.assertLedgerMatches(stock)
+
+    def test_adjust_checks_kind_sign_and_references(self):
+        """Test receipts must add and references must exist"""
+        self.create_stock()
+
+        res = self.client.post(STOCK_ADJUST_URL, [
+            {'StockNo': 'STK-001', 'delta': -1, 'kind': 'receipt'},
+        ], format='json')
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('delta', res.data[0])
+
+        res = self.client.post(STOCK_ADJUST_URL, [
+            {'StockNo': 'STK-001', 'delta': 1},
+            {'StockNo': 'STK-001', 'delta': -1, 'product': 0},
+        ], format='json')
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(res.data[0], {})
+        self.assertIn('product', res.data[1])
+
+    def test_transfer(self):
+        """Test a transfer moves quantity as a linked pair"""
+        source = self.create_stock()
+        destination = self.create_stock(StockNo='STK-002', Quantity=0)
+
+        res = self.client.post(STOCK_TRANSFER_URL, {
+            'source': 'STK-001',
+            'destination': 'STK-002',
+            'quantity': 4,
+        })
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data, [
+            {'StockNo': 'STK-001', 'Quantity': 6},
+            {'StockNo': 'STK-002', 'Quantity': 4},
+        ])
+        self.assertLedgerMatches(source)
+        self.assertLedgerMatches(destination)
+
+    def test_transfer_beyond_source_conflicts(self):
+        """Test a transfer cannot empty the source below zero"""
+        self.create_stock(Quantity=1)
+        self.create_stock(StockNo='STK-002', Quantity=0)
+
+        res = self.client.post(STOCK_TRANSFER_URL, {
+            'source': 'STK-001',
+            'destination': 'STK-002',
+            'quantity': 2,
+        })
+
+        self.assertEqual(res.status_code, status.HTTP_409_CONFLICT)
+        self.assertEqual(StockMovement.objects.count(), 1)
+
+    def test_movements_history(self):
+        """Test the history lists a stock's movements newest first"""
+        stock = self.create_stock()
+        self.client.post(decrement_url(stock.id), {'quantity': 2})
+        self.client.post(increment_url(stock.id), {'quantity': 5})
+
+        res = self.client.get(movements_url(stock.id), {'page_size': 2})
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            [(m['quantity'], m['balance']) for m in res.data['results']],
+            [(5, 13), (-2, 8)]
+        )
+        res = self.client.get(res.data['next'])
+        self.assertEqual(
+            [m['kind'] for m in res.data['results']],
+            [StockMovement.Kind.OPENING]
+        )
+
+    def test_renumber_moves_balance(self):
+        """Test a renamed stock replays under its new number"""
+        stock = self.create_stock(StockNo='STK-1')
+        before = timezone.now()
+
+        res = self.client.patch(
+            reverse('WMS:stock-detail', args=[stock.id]),
+            {'StockNo': 'STK-9'}
+        )
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.client.post(decrement_url(stock.id), {'quantity': 3})
+
+        res = self.client.get(STOCK_AS_OF_URL,
+                              {'at': timezone.now().isoformat()})
+        self.assertEqual(res.data, [
+            {'id': stock.id, 'StockNo': 'STK-9', 'Quantity': 7},
+        ])
+        res = self.client.get(STOCK_AS_OF_URL, {'at': before.isoformat()})
+        self.assertEqual(res.data, [
+            {'id': None, 'StockNo': 'STK-1', 'Quantity': 10},
+        ])
+        self.assertLedgerMatches(stock)
+
+    def test_delete_keeps_ledger(self):
+        """Test deleting a stock closes its balance and keeps its history"""
+        stock = self.create_stock()
+        before = timezone.now()
+
+        res = self.client.delete(reverse('WMS:stock-detail',
+                                         args=[stock.id]))
+
+        self.assertEqual(res.status_code, status.HTTP_204_NO_CONTENT)
+        self.assertEqual(
+            list(StockMovement.objects.order_by('id').values_list(
+                'stock', 'stock_no', 'kind', 'quantity', 'balance'
+            )),
+            [(None, 'STK-001', StockMovement.Kind.OPENING, 10, 10),
+             (None, 'STK-001', StockMovement.Kind.CLOSING, -10, 0)]
+        )
+        res = self.client.get(STOCK_AS_OF_URL, {'at': before.isoformat()})
+        self.assertEqual(res.data, [
+            {'id': None, 'StockNo': 'STK-001', 'Quantity': 10},
+        ])
+        res = self.client.get(STOCK_AS_OF_URL,
+                              {'at': timezone.now().isoformat()})
+        self.assertEqual(res.data, [])
+
+
+class StockAsOfTests(TestCase):
+    """Test reading stock quantities at a past moment"""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            'asof@domain.com',
+            'testpass'
+        )
+        self.client.force_authenticate(self.user)
+
+    def test_as_of(self):
+        """Test quantities are replayed up to the requested moment"""
+        stock = sample_stock(self.user, Quantity=0)
+        for day, quantity in ((1, 10), (3, -4), (5, 2)):
+            StockMovement.objects.create(
+                user=self.user,
+                stock=stock,
+                stock_no=stock.StockNo,
+                kind=StockMovement.Kind.ADJUSTMENT,
+                quantity=quantity,
+                balance=0,
+                created_at=f'2021-05-0{day}T12:00:00Z'
+            )
+
+        res = self.client.get(STOCK_AS_OF_URL, {'at': '2021-05-04'})
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data, [
+            {'id': stock.id, 'StockNo': 'STK-001', 'Quantity': 6},
+        ])
+
+    def test_as_of_requires_moment(self):
+        """Test a missing or invalid moment is a bad request"""
+        for params in ({}, {'at': 'yesterday'}):
+            res = self.client.get(STOCK_AS_OF_URL, params)
+            self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class StockSummaryTests(TestCase):
+    """Test the on-hand totals by location and product"""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            'summary@domain.com',
+            'testpass'
+        )
+        self.client.force_authenticate(self.user)
+        self.pen, self.ink = (
+            Product.objects.create(user=self.user, title=title, weight=1,
+                                   price=1)
+            for title in ('Pen', 'Ink')
+        )
+        sample_stock(self.user, StockNo='STK-1', Quantity=5,
+                     Location='A').products.set([self.pen])
+        sample_stock(self.user, StockNo='STK-2', Quantity=3,
+                     Location='A').products.set([self.pen, self.ink])
+        sample_stock(self.user, StockNo='STK-3', Quantity=7,
+                     Location='B').products.set([self.ink])
+        other = get_user_model().objects.create_user(
+            'other@domain.com',
+            'testpass'
+        )
+        sample_stock(other, StockNo='STK-X', Quantity=100, Location='A')
+
+    def summary(self, **params):
+        """Return the summary data for params"""
+        res = self.client.get(STOCK_SUMMARY_URL, params)
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+
+        return res.data
+
+    def test_by_location(self):
+        """Test totals per location of the user's stock only"""
+        self.assertEqual(self.summary(), [
+            {'Location': 'A', 'Quantity': 8, 'stocks': 2},
+            {'Location': 'B', 'Quantity': 7, 'stocks': 1},
+        ])
+
+    def test_by_product(self):
+        """Test a stock counts toward its product only"""
+        self.assertEqual(self.summary(group_by='product'), [
+            {'product': self.pen.id, 'title': 'Pen', 'Quantity': 8,
+             'stocks': 2},
+            {'product': self.ink.id, 'title': 'Ink', 'Quantity': 7,
+             'stocks': 1},
+        ])
+
+    def test_by_location_and_product(self):
+        """Test grouping by both keys, filtered to one location"""
+        self.assertEqual(
+            self.summary(group_by='location,product', locations='A'),
+            [
+                {'Location': 'A', 'product': self.pen.id, 'title': 'Pen',
+                 'Quantity': 8, 'stocks': 2},
+            ]
+        )
+
+    def test_product_filter_counts_stock_once(self):
+        """Test a stock holding both filtered products is summed once"""
+        self.assertEqual(
+            self.summary(products=f'{self.pen.id},{self.ink.id}'),
+            [
+                {'Location': 'A', 'Quantity': 8, 'stocks': 2},
+                {'Location': 'B', 'Quantity': 7, 'stocks': 1},
+            ]
+        )
+
+    def test_invalid_group(self):
+        """Test unknown groupings are rejected"""
+        res = self.client.get(STOCK_SUMMARY_URL, {'group_by': 'colour'})
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_summary_budget(self):
+        """Test the summary is a version lookup and one grouped query"""
+        with self.assertNumQueries(2):
+            self.summary(group_by='location,product')
+
+
+class StockProductTests(TestCase):
+    """Test writing and filtering stock by its product"""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            'holder@domain.com',
+            'testpass'
+        )
+        self.client.force_authenticate(self.user)
+        self.pen, self.ink = (
+            Product.objects.create(user=self.user, title=title, weight=1,
+                                   price=1)
+            for title in ('Pen', 'Ink')
+        )
+
+    def test_create_with_product(self):
+        """Test the products list follows the product written"""
+        res = self.client.post(STOCK_URL, {'StockNo': 'STK-1',
+                                           'Quantity': 1,
+                                           'product': self.ink.id})
+
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(res.data['products'], [self.ink.id])
+        stock = Stock.objects.get(StockNo='STK-1')
+        self.assertEqual(stock.product, self.ink)
+
+    def test_create_numbers_stock(self):
+        """Test stock posted without a number is given one"""
+        res = self.client.post(STOCK_URL, {'Quantity': 1,
+                                           'product': self.ink.id})
+
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+        self.assertRegex(res.data['StockNo'], r'^STK-\d{8}$')
+
+    def test_create_with_products(self):
+        """Test the product is picked from the products written"""
+        res = self.client.post(STOCK_URL, {
+            'StockNo': 'STK-1', 'Quantity': 1,
+            'products': [self.ink.id, self.pen.id]
+        })
+
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(res.data['product'], self.pen.id)
+
+    def test_product_must_be_linked(self):
+        """Test a product outside the products written is rejected"""
+        res = self.client.post(STOCK_URL, {
+            'StockNo': 'STK-1', 'Quantity': 1,
+            'product': self.ink.id, 'products': [self.pen.id]
+        })
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('product', res.data)
+
+    def test_filter_by_product(self):
+        """Test stock is filtered on the product it holds"""
+        sample_stock(self.user, StockNo='STK-1').products.set([self.pen])
+        sample_stock(self.user, StockNo='STK-2').products.set([self.ink])
+
+        res = self.client.get(STOCK_URL, {'products': self.ink.id})
+
+        self.assertEqual(
+            [stock['StockNo'] for stock in res.data], ['STK-2']
+        )
+
+
+class StockReconcileTests(TestCase):
+    """Test reconciling stock against cycle counts"""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            'counter@domain.com',
+            'testpass'
+        )
+        self.client.force_authenticate(self.user)
+        self.first = sample_stock(self.user, StockNo='STK-1', Quantity=10)
+        self.second = sample_stock(self.user, StockNo='STK-2', Quantity=4)
+
+    def test_reconcile(self):
+        """Test counts set the quantities and variances are booked"""
+        res = self.client.post(STOCK_RECONCILE_URL, {
+            'reference': 'CC-1',
+            'counts': [{'StockNo': 'STK-1', 'counted': 8},
+                       {'StockNo': 'STK-2', 'counted': 4}],
+        }, format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data, {
+            'lines': 2,
+            'net': -2,
+            'variances': [{'StockNo': 'STK-1', 'expected': 10,
+                           'counted': 8, 'variance': -2}],
+        })
+        self.first.refresh_from_db()
+        self.assertEqual(self.first.Quantity, 8)
+        movement = self.first.movements.get()
+        self.assertEqual(
+            (movement.kind, movement.quantity, movement.balance,
+             movement.reference),
+            (StockMovement.Kind.COUNT, -2, 8, 'CC-1')
+        )
+        self.assertFalse(self.second.movements.exists())
+
+    def test_reconcile_csv_file(self):
+        """Test a count file can be uploaded as CSV"""
+        upload = SimpleUploadedFile(
+            'count.csv',
+            b'StockNo,counted\nSTK-1,12\nSTK-2,0\n',
+            content_type='text/csv'
+        )
+
+        res = self.client.post(STOCK_RECONCILE_URL, {'file': upload},
+                               format='multipart')
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data['net'], -2)
+        self.assertEqual(
+            sorted(Stock.objects.values_list('StockNo', 'Quantity')),
+            [('STK-1', 12), ('STK-2', 0)]
+        )
+
+    def test_reconcile_unknown_stock(self):
+        """Test nothing changes when a counted stock does not exist"""
+        res = self.client.post(STOCK_RECONCILE_URL, {'counts': [
+            {'StockNo': 'STK-1', 'counted': 1},
+            {'StockNo': 'STK-9', 'counted': 1},
+        ]}, format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('STK-9', res.data['StockNo'][0])
+        self.first.refresh_from_db()
+        self.assertEqual(self.first.Quantity, 10)
+
+    def test_reconcile_duplicate_stock(self):
+        """Test a stock counted twice is rejected"""
+        res = self.client.post(STOCK_RECONCILE_URL, {'counts': [
+            {'StockNo': 'STK-1', 'counted': 1},
+            {'StockNo': 'STK-1', 'counted': 2},
+        ]}, format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('StockNo', res.data['counts'][1])
+
+    def test_reconcile_below_reserved(self):
+        """Test counting less than is reserved is a conflict"""
+        Stock.objects.filter(pk=self.first.pk).update(reserved=6)
+
+        res = self.client.post(STOCK_RECONCILE_URL, {'counts': [
+            {'StockNo': 'STK-1', 'counted': 5},
+        ]}, format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_409_CONFLICT)
+        self.assertEqual(res.data['reserved'], {'STK-1': 6})
+
+    def test_reconcile_requires_counts(self):
+        """Test a count without lines or file is rejected"""
+        res = self.client.post(STOCK_RECONCILE_URL, {'reference': 'CC-1'},
+                               format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('counts', res.data)
+
+
+@unittest.skipUnless(os.environ.get('WMS_BENCHMARK'),
+                     'set WMS_BENCHMARK=1 to run benchmarks')
+class StockReconcileBenchmark(TestCase):
+    """Time reconciling a 50,000 line cycle count"""
+
+    def test_fifty_thousand_lines(self):
+        """Test a 50k line count file is reconciled in seconds"""
+        user = get_user_model().objects.create_user(
+            'bench@domain.com',
+            'testpass'
+        )
+        Stock.objects.bulk_create([
+            Stock(user=user, StockNo=f'STK-{i}', Quantity=100)
+            for i in range(50000)
+        ], batch_size=5000)
+        upload = SimpleUploadedFile(
+            'count.csv',
+            ('StockNo,counted\n' + ''.join(
+                f'STK-{i},{100 + i % 7 - 3}\n' for i in range(50000)
+            )).encode(),
+            content_type='text/csv'
+        )
+        client = APIClient()
+        client.force_authenticate(user)
+
+        started = time.perf_counter()
+        res = client.post(STOCK_RECONCILE_URL, {'file': upload},
+                          format='multipart')
+        elapsed = time.perf_counter() - started
+
+        print(f'\nreconciled {res.data["lines"]} lines with '
+              f'{len(res.data["variances"])} variances in {elapsed:.2f}s')
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(StockMovement.objects.count(),
+                         len(res.data['variances']))
+        self.assertLess(elapsed, 10)
+
+
+class StockAdjustmentConcurrencyTests(TransactionTestCase):
+    """Test concurrent pickers never lose an update"""
+
+    def test_concurrent_decrements(self):
+        """Test parallel decrements all apply and stop at zero"""
+        user = get_user_model().objects.create_user(
+            'picker@domain.com',
+            'testpass'
+        )
+        stock = sample_stock(user, Quantity=30)
+        statuses = []
+
+        def pick():
+            client = APIClient()
+            client.force_authenticate(user)
+            try:
+                for _ in range(5):
+                    res = client.post(decrement_url(stock.id),
+                                      {'quantity': 1})
+                    statuses.append(res.status_code)
+            finally:
+                connection.close()
+
+        pickers = [threading.Thread(target=pick) for _ in range(8)]
+        for picker in pickers:
+            picker.start()
+        for picker in pickers:
+            picker.join()
+
+        stock.refresh_from_db()
+        self.assertEqual(stock.Quantity, 0)
+        self.assertEqual(stock.movements.count(), 30)
+        self.assertEqual(statuses.count(status.HTTP_200_OK), 30)
+        self.assertEqual(statuses.count(status.HTTP_409_CONFLICT), 10)
@@ -101,3 +101,38 @@ class PrivateTagsApiTests(TestCase):
         res = self.client.get(TAGS_URL, {'assigned_only': 1})
 
         self.assertEqual(len(res.data), 1)
+
+    def test_retrieve_tags_keyset_paginated(self):
+        """Test paging through tags ordered by name"""
+        Tag.objects.create(user=self.user, name='Book')
+        Tag.objects.create(user=self.user, name='Dictionary')
+        Tag.objects.create(user=self.user, name='Pen')
+
+        res = self.client.get(TAGS_URL, {'page_size': 2})
+        names = [tag['name'] for tag in res.data['results']]
+        res = self.client.get(res.data['next'])
+        names += [tag['name'] for tag in res.data['results']]
+
+        self.assertEqual(names, ['Pen', 'Dictionary', 'Book'])
+        self.assertIsNone(res.data['next'])
+
+    def test_retrieve_tags_with_counts(self):
+        """Test listing tags with the number of products using each"""
+        tag1 = Tag.objects.create(user=self.user, name='new')
+        Tag.objects.create(user=self.user, name='old')
+        for title in ('buku1', 'buku2'):
+            product = Product.objects.create(
+                title=title,
+                weight=10,
+                price=5.00,
+                user=self.user
+            )
+            product.tags.add(tag1)
+
+        res = self.client.get(TAGS_URL, {'with_counts': 1})
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            [(tag['name'], tag['product_count']) for tag in res.data],
+            [('old', 0), ('new', 2)]
+        )
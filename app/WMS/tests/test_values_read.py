@@ -0,0 +1,178 @@
+import os
+import time
+import unittest
+
+from django.contrib.auth import get_user_model
+from django.db.models import Prefetch
+from django.urls import reverse
+from django.test import TestCase
+
+from rest_framework.test import APIClient
+
+from core.models import Tag, Category, Product, DeliveryOrder, Stock
+from WMS import serializers
+from WMS.values import ValuesSerializer
+
+
+def sample_catalog(user, count, prefix='product'):
+    """Bulk create products carrying two tags and two categories each"""
+    tags = Tag.objects.bulk_create([
+        Tag(user=user, name=f'{prefix} tag {i}') for i in range(2)
+    ])
+    categories = Category.objects.bulk_create([
+        Category(user=user, name=f'{prefix} category {i}') for i in range(2)
+    ])
+    products = Product.objects.bulk_create([
+        Product(user=user, title=f'{prefix} {i}', weight=i, price=i / 8)
+        for i in range(count)
+    ])
+    Product.tags.through.objects.bulk_create([
+        Product.tags.through(product_id=product.id, tag_id=tag.id)
+        for product in products for tag in tags
+    ])
+    Product.categories.through.objects.bulk_create([
+        Product.categories.through(product_id=product.id,
+                                   category_id=category.id)
+        for product in products for category in categories
+    ])
+
+    return products
+
+
+def sorted_ids(data):
+    """Sort the id lists of serialized objects, which have no order"""
+    for item in data:
+        for name, value in item.items():
+            if isinstance(value, list):
+                value.sort()
+
+    return data
+
+
+class ValuesReadParityTests(TestCase):
+    """Test the values read path matches the model serializers"""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            'values@domain.com',
+            'testpass'
+        )
+        self.client.force_authenticate(self.user)
+        self.products = sample_catalog(self.user, 3)
+        self.order = DeliveryOrder.objects.create(
+            user=self.user,
+            deliveryNumber='TRN-001',
+            sentFrom='Batam',
+            sentTo='Palembang',
+            price=72.5
+        )
+        self.order.products.set(self.products)
+        self.stock = Stock.objects.create(
+            user=self.user,
+            StockNo='STK-001',
+            Quantity=3,
+            Location='A-01'
+        )
+        self.stock.products.set(self.products[:2])
+
+    def assertParity(self, url, serializer_class, objects):
+        """Assert the endpoint renders objects like serializer_class"""
+        res = self.client.get(url)
+        expected = sorted_ids(serializer_class(objects, many=True).data)
+        self.assertEqual(res.data, expected)
+        self.assertEqual(
+            [list(item) for item in res.data],
+            [list(item) for item in expected]
+        )
+
+    def test_product_list_parity(self):
+        """Test product list output matches ProductSerializer"""
+        self.assertParity(
+            reverse('WMS:product-list'),
+            serializers.ProductSerializer,
+            Product.objects.filter(user=self.user)
+        )
+
+    def test_deliveryorder_list_parity(self):
+        """Test delivery order list output matches its serializer"""
+        self.assertParity(
+            reverse('WMS:deliveryorder-list'),
+            serializers.DeliveryOrderSerializer,
+            [self.order]
+        )
+
+    def test_stock_list_parity(self):
+        """Test stock list output matches StockSerializer"""
+        self.assertParity(
+            reverse('WMS:stock-list'),
+            serializers.StockSerializer,
+            [self.stock]
+        )
+
+    def test_stock_detail_parity(self):
+        """Test stock detail output matches StockDetailSerializer"""
+        res = self.client.get(reverse('WMS:stock-detail',
+                                      args=[self.stock.id]))
+
+        self.assertEqual(
+            res.data,
+            serializers.StockDetailSerializer(
+                Stock.objects.prefetch_related(
+                    Prefetch('products',
+                             queryset=Product.objects.order_by('id'))
+                ).get(pk=self.stock.pk)
+            ).data
+        )
+
+    def test_detail_not_found(self):
+        """Test another user's stock is not found"""
+        other = get_user_model().objects.create_user(
+            'other@domain.com',
+            'testpass'
+        )
+        self.client.force_authenticate(other)
+
+        res = self.client.get(reverse('WMS:stock-detail',
+                                      args=[self.stock.id]))
+
+        self.assertEqual(res.status_code, 404)
+
+
+@unittest.skipUnless(os.environ.get('WMS_BENCHMARK'),
+                     'set WMS_BENCHMARK=1 to run benchmarks')
+class ValuesReadBenchmark(TestCase):
+    """Compare CPU time of both read paths over 1k products"""
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(
+            'bench@domain.com',
+            'testpass'
+        )
+        sample_catalog(self.user, 1000)
+
+    def cpu_seconds(self, render, repeat=5):
+        """Return the best process CPU time of repeated renders"""
+        timings = []
+        for _ in range(repeat):
+            started = time.process_time()
+            render()
+            timings.append(time.process_time() - started)
+
+        return min(timings)
+
+    def test_values_path_is_three_times_cheaper(self):
+        """Test the values path needs at most a third of the CPU"""
+        queryset = Product.objects.filter(user=self.user)
+        values = ValuesSerializer(serializers.ProductSerializer)
+
+        model_path = self.cpu_seconds(lambda: serializers.ProductSerializer(
+            queryset.prefetch_related('categories', 'tags'), many=True
+        ).data)
+        values_path = self.cpu_seconds(
+            lambda: values.to_representation(values.get_queryset(queryset))
+        )
+
+        print(f'\nmodel serializer: {model_path:.4f}s, '
+              f'values: {values_path:.4f}s per 1k rows')
+        self.assertGreaterEqual(model_path / values_path, 3)
@@ -0,0 +1,105 @@
+from django.contrib.auth import get_user_model
+from django.urls import reverse
+from django.test import TestCase
+
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from core.models import DeliveryOrder, Product, Wave
+
+WAVE_URL = reverse('WMS:wave-list')
+WAVE_PLAN_URL = reverse('WMS:wave-plan')
+
+
+def sample_order(user, product, **params):
+    """Create and return a sample delivery order holding product"""
+    defaults = {
+        'deliveryNumber': 'TRN-001',
+        'sentFrom': 'Batam',
+        'sentTo': 'Palembang',
+        'price': 72.000,
+    }
+    defaults.update(params)
+    order = DeliveryOrder.objects.create(user=user, **defaults)
+    order.products.add(product)
+
+    return order
+
+
+class PublicWaveApiTests(TestCase):
+    """Test unauthenticated wave API access"""
+
+    def setUp(self):
+        self.client = APIClient()
+
+    def test_auth_required(self):
+        """Test that authentication is required"""
+        res = self.client.get(WAVE_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
+
+
+class PrivateWaveApiTests(TestCase):
+    """Test planning and releasing waves"""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            'waves@domain.com',
+            'testpass'
+        )
+        self.client.force_authenticate(self.user)
+        self.product = Product.objects.create(user=self.user, title='Crate',
+                                              weight=10, price=1)
+
+    def test_plan(self):
+        """Test planning groups pending orders within the limits"""
+        orders = [
+            sample_order(self.user, self.product, deliveryNumber=f'TRN-{i}')
+            for i in range(3)
+        ]
+
+        res = self.client.post(WAVE_PLAN_URL, {'max_orders': 2},
+                               format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(
+            sorted(len(wave['orders']) for wave in res.data), [1, 2]
+        )
+        self.assertEqual(
+            sorted(order for wave in res.data for order in wave['orders']),
+            [order.id for order in orders]
+        )
+
+    def test_plan_invalid_limits(self):
+        """Test limits must be positive"""
+        res = self.client.post(WAVE_PLAN_URL, {'max_lines': 0},
+                               format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_list_limited_to_user(self):
+        """Test only the user's own waves are listed"""
+        other = get_user_model().objects.create_user(
+            'other@domain.com',
+            'testpass'
+        )
+        Wave.objects.create(user=other, sentTo='Medan', lines=0, weight=0)
+        Wave.objects.create(user=self.user, sentTo='Batam', lines=0,
+                            weight=0)
+
+        res = self.client.get(WAVE_URL)
+
+        self.assertEqual([wave['sentTo'] for wave in res.data], ['Batam'])
+
+    def test_delete_returns_orders_to_planning(self):
+        """Test deleting a wave leaves its orders pending again"""
+        order = sample_order(self.user, self.product)
+        self.client.post(WAVE_PLAN_URL, {}, format='json')
+        wave = Wave.objects.get()
+
+        res = self.client.delete(reverse('WMS:wave-detail', args=[wave.id]))
+
+        self.assertEqual(res.status_code, status.HTTP_204_NO_CONTENT)
+        order.refresh_from_db()
+        self.assertIsNone(order.wave)
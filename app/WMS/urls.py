@@ -9,6 +9,8 @@ router.register('categories', views.CategoryViewSet)
 router.register('products', views.ProductViewSet)
 router.register('deliveryorders', views.DeliveryOrderViewSet)
 router.register('stocks', views.StockViewSet)
+router.register('waves', views.WaveViewSet)
+router.register('stockalerts', views.StockAlertViewSet)
 
 app_name = 'WMS'
 
@@ -0,0 +1,69 @@
+from django.contrib.postgres.fields import ArrayField
+from django.db import models
+from django.db.models import OuterRef, Subquery
+from rest_framework import fields
+
+from WMS.export import serializer_fields
+
+
+class IdArray(Subquery):
+    """Collect the ids returned by a correlated subquery into an array"""
+    template = 'ARRAY(%(subquery)s)'
+    output_field = ArrayField(models.IntegerField())
+
+
+class ValuesSerializer:
+    """Build serializer compatible dicts straight from ``.values()`` rows
+
+    Mirrors a flat model serializer, plain fields plus primary key lists
+    for many-to-many fields, without instantiating model objects or
+    running DRF field machinery for every value. Many-to-many ids are
+    read by correlated subqueries, so the queryset keeps its filters,
+    annotations and ordering untouched.
+    """
+
+    def __init__(self, serializer_class):
+        model = serializer_class.Meta.model
+        self.field_names = serializer_class.Meta.fields
+        self.fields, self.many_fields = serializer_fields(serializer_class)
+        self.decimal_fields = [
+            name for name in self.fields
+            if isinstance(model._meta.get_field(name), models.DecimalField)
+        ]
+        self.datetime_fields = [
+            name for name in self.fields
+            if isinstance(model._meta.get_field(name), models.DateTimeField)
+        ]
+        self.datetime = fields.DateTimeField()
+
+    def get_queryset(self, queryset):
+        """Return queryset as rows holding every serialized field"""
+        related = {}
+        for name in self.many_fields:
+            field = queryset.model._meta.get_field(name)
+            source = field.m2m_field_name()
+            target = field.m2m_reverse_field_name() + '_id'
+            related[name] = IdArray(
+                field.remote_field.through.objects.filter(
+                    **{source: OuterRef('pk')}
+                ).values(target)
+            )
+        # Annotations such as a search rank stay selected so keyset
+        # pagination can read its position from the row.
+        return queryset.prefetch_related(None).values(
+            *self.fields, *queryset.query.annotations
+        ).annotate(**related)
+
+    def to_representation(self, rows):
+        """Return the serialized dict for each row"""
+        data = []
+        for row in rows:
+            for name in self.decimal_fields:
+                row[name] = format(row[name], 'f')
+            for name in self.datetime_fields:
+                row[name] = self.datetime.to_representation(row[name])
+            for name in self.many_fields:
+                row[name].sort()
+            data.append({name: row[name] for name in self.field_names})
+
+        return data
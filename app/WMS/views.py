@@ -1,19 +1,190 @@
+import re
+from decimal import Decimal, InvalidOperation
+
+from django.contrib.postgres.search import (
+    SearchQuery, SearchRank, TrigramSimilarity
+)
+from django.db import IntegrityError, transaction
+from django.db.models import (
+    Count, Exists, F, FloatField, OuterRef, Prefetch, Q, Subquery, Value
+)
+from django.db.models.functions import Cast, Coalesce
 from rest_framework.decorators import action
+from rest_framework.exceptions import ValidationError
 from rest_framework.response import Response
 from rest_framework import viewsets, mixins, status
 from rest_framework.authentication import TokenAuthentication
 from rest_framework.permissions import IsAuthenticated
 
-from core.models import Tag, Category, Product, DeliveryOrder, Stock
+from core.inventory import (
+    SUMMARY_GROUPS, CountBelowReserved, InsufficientStock, UnknownStock,
+    close_stock, open_balance, parse_moment, post_movements, reconcile_counts,
+    renumber_balance, set_quantities, stock_as_of, stock_summary,
+    transfer_movements
+)
+from core.models import (
+    Tag, Category, Product, DeliveryOrder, Stock, StockAlert, StockMovement,
+    Wave
+)
+from core import reservations
+from core.alerts import evaluate_products, evaluate_stocks
+from core import orders
+from core.numbers import allocate
+from core.picking import pick_list
+from core.waves import WavePlanningConflict, plan_waves
+from core.versions import bump_versions
 from WMS import serializers
+from WMS.cache import ResponseCacheMixin
+from WMS.conditional import ConditionalGetMixin
+from WMS.export import EXPORT_FORMATS, export_rows, streaming_export
+from WMS.idempotency import IdempotencyMixin, idempotent_action
+from WMS.pagination import KeysetPagination, NameKeysetPagination
+from WMS.values import ValuesSerializer
+
+
+# Products rendered with their tags and categories, one query per level
+PRODUCT_DETAIL_PREFETCH = Prefetch(
+    'products',
+    queryset=Product.objects.order_by('id').prefetch_related(
+        'categories', 'tags'
+    )
+)
+EXPANDABLE = ('products',)
+
+ORDER_TOTALS_ORDERING = ('total_price', '-total_price', 'total_weight',
+                         '-total_weight')
+
+
+def product_links(relation):
+    """Return the through model of a Product relation and its target field"""
+    field = Product._meta.get_field(relation)
+    return field.remote_field.through, field.m2m_reverse_field_name()
+
+
+def save_numbered(serializer, field, kind, **kwargs):
+    """Save a new object, numbering field from kind when not given one
+
+    A concurrent create may still take the same number first; that is
+    reported like the unique check of a given number, not as an error.
+    """
+    number = serializer.validated_data.get(field) or allocate(kind)[0]
+    try:
+        with transaction.atomic():
+            return serializer.save(**kwargs, **{field: number})
+    except IntegrityError:
+        raise ValidationError({field: [
+            f'{number} was taken by another request, please retry.'
+        ]})
+
+
+class PrefetchRelatedMixin:
+    """Prefetch exactly the relations the active serializer renders"""
+    prefetch_actions = ('list', 'retrieve')
+    prefetch_related_map = {}
+
+    def get_prefetch_related(self):
+        """Return the prefetch lookups for the current action"""
+        if self.action not in self.prefetch_actions:
+            return ()
+
+        return self.prefetch_related_map.get(self.get_serializer_class(), ())
+
+
+class ExpandMixin:
+    """Render nested detail on list when asked with ``expand=products``"""
+    detail_serializer_class = None
+
+    def is_expanded(self):
+        """Return True if the list should nest its products"""
+        expand = self.request.query_params.get('expand')
+        if not expand:
+            return False
+        if expand not in EXPANDABLE:
+            raise ValidationError({'expand': [
+                f'Choose one of: {", ".join(EXPANDABLE)}.'
+            ]})
+
+        return True
 
+    def get_serializer_class(self):
+        """Return the detail serializer for retrieve and expanded lists"""
+        if (self.action == 'retrieve' or
+                self.action == 'list' and self.is_expanded()):
+            return self.detail_serializer_class
+
+        return super().get_serializer_class()
+
+
+class ValuesReadMixin:
+    """Serve lists from ``.values()`` rows when possible
+
+    Only the flat default serializer has a values equivalent; lists
+    rendering any other serializer, such as expanded ones, fall back to
+    the regular path. Details always render the detail serializer.
+    """
+
+    def get_values_serializer(self):
+        """Return the values serializer for the current action, or None"""
+        serializer_class = self.get_serializer_class()
+        if serializer_class is not self.serializer_class:
+            return None
+
+        return ValuesSerializer(serializer_class)
+
+    def list(self, request, *args, **kwargs):
+        values = self.get_values_serializer()
+        if values is None:
+            return super().list(request, *args, **kwargs)
+
+        queryset = values.get_queryset(
+            self.filter_queryset(self.get_queryset())
+        )
+        page = self.paginate_queryset(queryset)
+        if page is not None:
+            return self.get_paginated_response(
+                values.to_representation(page)
+            )
+
+        return Response(values.to_representation(queryset))
+
+
+class ExportMixin:
+    """Stream the filtered objects as CSV or newline-delimited JSON"""
+
+    @action(methods=['GET'], detail=False, url_path='export')
+    def export(self, request):
+        """Export every object matching the list filters"""
+        export_format = request.query_params.get('export_format', 'csv')
+        if export_format not in EXPORT_FORMATS:
+            return Response(
+                {'export_format': [
+                    f'Choose one of: {", ".join(EXPORT_FORMATS)}.'
+                ]},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        serializer_class = self.get_serializer_class()
+        rows = export_rows(
+            self.filter_queryset(self.get_queryset()),
+            serializer_class
+        )
+
+        return streaming_export(
+            rows,
+            serializer_class.Meta.fields,
+            export_format,
+            self.basename
+        )
 
-class BaseProductAttrViewSet(viewsets.GenericViewSet,
+
+class BaseProductAttrViewSet(ConditionalGetMixin, ResponseCacheMixin,
+                             IdempotencyMixin, viewsets.GenericViewSet,
                              mixins.ListModelMixin,
                              mixins.CreateModelMixin):
     """Base View set for user own product attr"""
     authentication_classes = (TokenAuthentication,)
     permission_classes = (IsAuthenticated,)
+    pagination_class = NameKeysetPagination
 
     def get_queryset(self):
         """Return Object for the current authenticated user only"""
@@ -21,12 +192,34 @@ class BaseProductAttrViewSet(viewsets.GenericViewSet,
             int(self.request.query_params.get('assigned_only', 0))
         )
         queryset = self.queryset
+        through, target = product_links(self.product_relation)
+        links = through.objects.filter(**{target: OuterRef('pk')})
         if assigned_only:
-            queryset = queryset.filter(product__isnull=False)
+            queryset = queryset.filter(Exists(links))
+        if self._with_counts():
+            counts = links.filter(
+                product__user=self.request.user
+            ).order_by().values(target).annotate(
+                count=Count('*')
+            ).values('count')
+            queryset = queryset.annotate(
+                product_count=Coalesce(Subquery(counts), 0)
+            )
 
         return queryset.filter(
             # user=self.request.user
-        ).order_by('-name').distinct()
+        ).order_by('-name')
+
+    def _with_counts(self):
+        """Return True if product counts were requested"""
+        return bool(int(self.request.query_params.get('with_counts', 0)))
+
+    def get_serializer_class(self):
+        """Return appropriate serializer class"""
+        if self.action == 'list' and self._with_counts():
+            return self.count_serializer_class
+
+        return self.serializer_class
 
     def perform_create(self, serializer):
         """Create a new object"""
@@ -37,29 +230,78 @@ class TagViewSet(BaseProductAttrViewSet):
     """Manage Tags in the database"""
     queryset = Tag.objects.all()
     serializer_class = serializers.TagSerializer
+    count_serializer_class = serializers.TagCountSerializer
+    product_relation = 'tags'
+    version_keys = ('tag', 'product:{user}')
 
 
 class CategoryViewSet(BaseProductAttrViewSet):
     """Manage Categories in the database"""
     queryset = Category.objects.all()
     serializer_class = serializers.CategorySerializer
+    count_serializer_class = serializers.CategoryCountSerializer
+    product_relation = 'categories'
+    version_keys = ('category', 'product:{user}')
 
 
-class ProductViewSet(viewsets.ModelViewSet):
+class ProductViewSet(ConditionalGetMixin, ResponseCacheMixin,
+                     IdempotencyMixin, PrefetchRelatedMixin, ValuesReadMixin,
+                     ExportMixin, viewsets.ModelViewSet):
     """Manage Product in the database"""
     serializer_class = serializers.ProductSerializer
     queryset = Product.objects.all()
     authentication_classes = (TokenAuthentication,)
     permission_classes = (IsAuthenticated,)
+    pagination_class = KeysetPagination
+    version_keys = ('product:{user}', 'tag', 'category')
+    prefetch_related_map = {
+        serializers.ProductSerializer: ('categories', 'tags'),
+        serializers.ProductDetailSerializer: ('categories', 'tags'),
+    }
 
     def _params_to_ints(self, qs):
         """Convert a list of string ids to a list of integers"""
         return [int(str_id) for str_id in qs.split(',')]
 
+    def _search(self, queryset, term):
+        """Filter to products matching term, most relevant first
+
+        Whole words and prefixes are matched through the full-text index
+        on title and link, and typos through the trigram index on title.
+        """
+        words = re.findall(r'\w+', term)
+        if not words:
+            # Still ranked, as searches are paged by rank
+            return queryset.none().annotate(
+                rank=Value(0.0, output_field=FloatField())
+            )
+        query = SearchQuery(
+            ' & '.join(f'{word}:*' for word in words),
+            config='simple',
+            search_type='raw'
+        )
+
+        return queryset.filter(
+            Q(search_vector=query) | Q(title__trigram_similar=term)
+        ).annotate(
+            # Double precision, so the rank written into a cursor compares
+            # equal to the rank of the row it came from
+            rank=Cast(SearchRank(F('search_vector'), query) +
+                      TrigramSimilarity('title', term), FloatField())
+        ).order_by('-rank', 'id')
+
+    def get_keyset_ordering(self):
+        """Page ranked search results by relevance"""
+        if self.request.query_params.get('search'):
+            return ('-rank', 'id')
+
+        return None
+
     def get_queryset(self):
         """Retrieve the products to the authenticated user"""
         tags = self.request.query_params.get('tags')
         categories = self.request.query_params.get('categories')
+        search = self.request.query_params.get('search')
         queryset = self.queryset
         if tags:
             tag_ids = self._params_to_ints(tags)
@@ -67,8 +309,12 @@ class ProductViewSet(viewsets.ModelViewSet):
         if categories:
             category_ids = self._params_to_ints(categories)
             queryset = queryset.filter(categories__id__in=category_ids)
+        if search:
+            queryset = self._search(queryset, search)
 
-        return queryset.filter(user=self.request.user)
+        return queryset.filter(user=self.request.user).prefetch_related(
+            *self.get_prefetch_related()
+        )
 
     def get_serializer_class(self):
         """Return appropriate serializer class"""
@@ -76,12 +322,22 @@ class ProductViewSet(viewsets.ModelViewSet):
             return serializers.ProductDetailSerializer
         elif self.action == 'upload_image':
             return serializers.ProductImageSerializer
+        elif self.action == 'bulk_upsert':
+            return serializers.ProductBulkSerializer
 
         return self.serializer_class
 
     def perform_create(self, serializer):
         """create a new product"""
-        serializer.save(user=self.request.user)
+        with transaction.atomic():
+            product = serializer.save(user=self.request.user)
+            evaluate_products(product.user_id, [product.pk])
+
+    def perform_update(self, serializer):
+        """Update a product, re-evaluating its low-stock alert"""
+        with transaction.atomic():
+            product = serializer.save()
+            evaluate_products(product.user_id, [product.pk])
 
     @action(methods=['POST'], detail=True, url_path='upload-image')
     def upload_image(self, request, pk=None):
@@ -104,46 +360,393 @@ class ProductViewSet(viewsets.ModelViewSet):
             status=status.HTTP_400_BAD_REQUEST
         )
 
+    @action(methods=['GET'], detail=False, url_path='facets')
+    def facets(self, request):
+        """Count the matching products per tag and per category"""
+        products = self.filter_queryset(self.get_queryset())
+        product_ids = products.order_by().values('pk')
+        facets = {}
+        for relation in ('tags', 'categories'):
+            through, target = product_links(relation)
+            counts = through.objects.filter(
+                product__in=product_ids
+            ).values_list(
+                f'{target}_id', f'{target}__name'
+            ).annotate(
+                count=Count('product_id')
+            ).order_by('-count', f'{target}__name')
+            facets[relation] = [
+                {'id': pk, 'name': name, 'count': count}
+                for pk, name, count in counts
+            ]
+
+        return Response(facets)
+
+    @action(methods=['POST'], detail=False, url_path='bulk')
+    @idempotent_action
+    def bulk_upsert(self, request):
+        """Create or update many products, matched by title"""
+        serializer = self.get_serializer(
+            data=request.data,
+            many=True,
+            allow_empty=False
+        )
+        if not serializer.is_valid():
+            return Response(
+                serializer.errors,
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        try:
+            results = serializer.upsert(user=request.user)
+        except IntegrityError:
+            return Response(
+                {'detail': 'Conflicting concurrent write, please retry.'},
+                status=status.HTTP_409_CONFLICT
+            )
+        # bulk_create and bulk_update send no model signals
+        bump_versions('product', [request.user.id])
+        if any(result['status'] == 'updated' for result in results):
+            bump_versions('deliveryorder', [request.user.id])
 
-class DeliveryOrderViewSet(viewsets.ModelViewSet):
+        return Response(results, status=status.HTTP_200_OK)
+
+
+class DeliveryOrderViewSet(ConditionalGetMixin, ResponseCacheMixin,
+                           IdempotencyMixin, PrefetchRelatedMixin, ExpandMixin,
+                           ValuesReadMixin, ExportMixin,
+                           viewsets.ModelViewSet):
     """Manage DeliveryOrder in the database"""
     serializer_class = serializers.DeliveryOrderSerializer
+    detail_serializer_class = serializers.DeliveryOrderDetailSerializer
     queryset = DeliveryOrder.objects.all()
     authentication_classes = (TokenAuthentication,)
     permission_classes = (IsAuthenticated,)
+    pagination_class = KeysetPagination
+    version_keys = ('deliveryorder:{user}', 'product:{user}',
+                    'tag', 'category')
+    prefetch_related_map = {
+        serializers.DeliveryOrderSerializer: ('products',),
+        serializers.DeliveryOrderDetailSerializer: (PRODUCT_DETAIL_PREFETCH,),
+    }
 
     def _params_to_ints(self, qs):
         """Convert a list of string ids to a list of integers"""
         return [int(str_id) for str_id in qs.split(',')]
 
+    def _params_to_decimal(self, name):
+        """Return a decimal query parameter, None when not given"""
+        value = self.request.query_params.get(name)
+        if not value:
+            return None
+        try:
+            return Decimal(value)
+        except InvalidOperation:
+            raise ValidationError({name: ['A valid number is required.']})
+
+    def get_ordering(self):
+        """Return the requested sort by order totals, if any"""
+        ordering = self.request.query_params.get('ordering')
+        if not ordering:
+            return None
+        if ordering not in ORDER_TOTALS_ORDERING:
+            raise ValidationError({'ordering': [
+                f'Choose one of: {", ".join(ORDER_TOTALS_ORDERING)}.'
+            ]})
+
+        return ordering
+
+    def get_keyset_ordering(self):
+        """Page orders sorted by a total in that order"""
+        ordering = self.get_ordering()
+        if ordering:
+            return (ordering, 'id')
+
+        return None
+
     def get_queryset(self):
         """Retrieve the products to the authenticated user"""
         products = self.request.query_params.get('products')
         queryset = self.queryset
         if products:
             product_ids = self._params_to_ints(products)
-            queryset = queryset.filter(tags__id__in=product_ids)
+            queryset = queryset.filter(products__id__in=product_ids)
+        for total in ('total_price', 'total_weight'):
+            low = self._params_to_decimal(f'min_{total}')
+            if low is not None:
+                queryset = queryset.filter(**{f'{total}__gte': low})
+            high = self._params_to_decimal(f'max_{total}')
+            if high is not None:
+                queryset = queryset.filter(**{f'{total}__lte': high})
+        statuses = self.request.query_params.get('status')
+        if statuses:
+            statuses = statuses.split(',')
+            unknown = set(statuses) - set(DeliveryOrder.Status.values)
+            if unknown:
+                raise ValidationError({'status': [
+                    f'Choose from: {", ".join(DeliveryOrder.Status.values)}.'
+                ]})
+            queryset = queryset.filter(status__in=statuses)
+        if self.request.query_params.get('open'):
+            queryset = queryset.filter(
+                status__in=DeliveryOrder.OPEN_STATUSES
+            )
+        ordering = self.get_ordering()
+        if ordering:
+            queryset = queryset.order_by(ordering, 'id')
 
-        return queryset.filter(user=self.request.user)
+        return queryset.filter(user=self.request.user).prefetch_related(
+            *self.get_prefetch_related()
+        )
 
     def get_serializer_class(self):
         """Return appropriate serializer class"""
-        if self.action == 'retrieve':
-            return serializers.DeliveryOrderSerializer
+        if self.action == 'lines':
+            return serializers.DeliveryOrderLineSerializer
+        elif self.action == 'reserve':
+            return serializers.ReservationRequestSerializer
+        elif self.action == 'pick_list':
+            return serializers.PickListSerializer
+        elif self.action == 'transition':
+            return serializers.DeliveryOrderTransitionSerializer
 
-        return self.serializer_class
+        return super().get_serializer_class()
 
     def perform_create(self, serializer):
-        """create a new DeliveryOrder"""
-        serializer.save(user=self.request.user)
+        """create a new DeliveryOrder, numbering it when not given one"""
+        save_numbered(serializer, 'deliveryNumber', 'deliveryorder',
+                      user=self.request.user)
+
+    def perform_destroy(self, instance):
+        """Delete a DeliveryOrder, giving its reserved stock back"""
+        with transaction.atomic():
+            reservations.release(instance)
+            instance.delete()
+
+    @action(methods=['POST'], detail=False, url_path='pick-list')
+    def pick_list(self, request):
+        """Merge many delivery orders into one pick list in walking order"""
+        serializer = self.get_serializer(data=request.data)
+        if not serializer.is_valid():
+            return Response(
+                serializer.errors,
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        return Response(
+            pick_list(request.user,
+                      serializer.validated_data['delivery_orders']),
+            status=status.HTTP_200_OK
+        )
+
+    @action(methods=['POST'], detail=False, url_path='transition')
+    @idempotent_action
+    def transition(self, request):
+        """Move many delivery orders to a new status at once"""
+        serializer = self.get_serializer(data=request.data)
+        if not serializer.is_valid():
+            return Response(
+                serializer.errors,
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        try:
+            moved = orders.transition(
+                request.user,
+                serializer.validated_data['delivery_orders'],
+                serializer.validated_data['status']
+            )
+        except orders.InvalidTransition as exc:
+            return Response(
+                {'detail': str(exc),
+                 'invalid': [{'id': pk, 'status': current}
+                             for pk, current in exc.invalid]},
+                status=status.HTTP_409_CONFLICT
+            )
+
+        return Response(
+            {'status': serializer.validated_data['status'], 'moved': moved},
+            status=status.HTTP_200_OK
+        )
+
+    @action(methods=['POST'], detail=True, url_path='reserve')
+    @idempotent_action
+    def reserve(self, request, pk=None):
+        """Reserve stock of the given products for a delivery order"""
+        order = self.get_object()
+        if order.status not in (DeliveryOrder.Status.DRAFT,
+                                DeliveryOrder.Status.ALLOCATED):
+            return Response(
+                {'detail': f'Cannot reserve stock for a {order.status} '
+                           f'order.'},
+                status=status.HTTP_409_CONFLICT
+            )
+        serializer = self.get_serializer(
+            data=request.data,
+            many=True,
+            allow_empty=False
+        )
+        if not serializer.is_valid():
+            return Response(
+                serializer.errors,
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        try:
+            reservations.reserve(order, serializer.quantities())
+        except InsufficientStock as exc:
+            return Response(
+                {'detail': 'Insufficient stock.',
+                 'available': exc.available},
+                status=status.HTTP_409_CONFLICT
+            )
+        except reservations.ReservationConflict as exc:
+            return Response(
+                {'detail': str(exc)},
+                status=status.HTTP_503_SERVICE_UNAVAILABLE,
+                headers={'Retry-After': '1'}
+            )
 
+        held = order.reservations.select_related('stock').order_by('pk')
 
-class StockViewSet(viewsets.ModelViewSet):
+        return Response(
+            serializers.StockReservationSerializer(held, many=True).data,
+            status=status.HTTP_201_CREATED
+        )
+
+    @action(methods=['POST'], detail=True, url_path='release')
+    @idempotent_action
+    def release(self, request, pk=None):
+        """Give back all stock reserved for a delivery order"""
+        released = reservations.release(self.get_object())
+
+        return Response({'released': released},
+                        status=status.HTTP_200_OK)
+
+    @action(methods=['GET', 'PUT'], detail=True, url_path='lines')
+    def lines(self, request, pk=None):
+        """Read or replace the product quantities of a delivery order"""
+        order = self.get_object()
+        if request.method == 'PUT':
+            serializer = self.get_serializer(data=request.data, many=True)
+            if not serializer.is_valid():
+                return Response(
+                    serializer.errors,
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+            orders.set_lines(order, serializer.quantities())
+
+        lines = order.lines.order_by('product_id').values(
+            'product', 'quantity'
+        )
+
+        return Response(
+            {'total_price': format(order.total_price, 'f'),
+             'total_weight': format(order.total_weight, 'f'),
+             'lines': self.get_serializer(lines, many=True).data},
+            status=status.HTTP_200_OK
+        )
+
+
+class WaveViewSet(ConditionalGetMixin, ResponseCacheMixin,
+                  PrefetchRelatedMixin, mixins.ListModelMixin,
+                  mixins.RetrieveModelMixin, mixins.DestroyModelMixin,
+                  viewsets.GenericViewSet):
+    """Plan waves of delivery orders and release them to the floor"""
+    serializer_class = serializers.WaveSerializer
+    queryset = Wave.objects.all()
+    authentication_classes = (TokenAuthentication,)
+    permission_classes = (IsAuthenticated,)
+    pagination_class = KeysetPagination
+    version_keys = ('wave:{user}', 'deliveryorder:{user}')
+    prefetch_related_map = {
+        serializers.WaveSerializer: ('orders',),
+    }
+
+    def get_queryset(self):
+        """Retrieve the waves of the authenticated user"""
+        return self.queryset.filter(user=self.request.user).prefetch_related(
+            *self.get_prefetch_related()
+        )
+
+    def get_serializer_class(self):
+        """Return appropriate serializer class"""
+        if self.action == 'plan':
+            return serializers.WavePlanSerializer
+
+        return self.serializer_class
+
+    def perform_destroy(self, instance):
+        """Delete a wave, its orders waiting for the next planning run"""
+        with transaction.atomic():
+            instance.delete()
+            bump_versions('deliveryorder', [instance.user_id])
+
+    @action(methods=['POST'], detail=False, url_path='plan')
+    @idempotent_action
+    def plan(self, request):
+        """Group the pending delivery orders into new waves"""
+        serializer = self.get_serializer(data=request.data)
+        if not serializer.is_valid():
+            return Response(
+                serializer.errors,
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        try:
+            waves = plan_waves(request.user, **serializer.validated_data)
+        except WavePlanningConflict as exc:
+            return Response({'detail': str(exc)},
+                            status=status.HTTP_409_CONFLICT)
+        waves = Wave.objects.filter(
+            pk__in=[wave.pk for wave in waves]
+        ).prefetch_related('orders').order_by('pk')
+
+        return Response(
+            serializers.WaveSerializer(waves, many=True).data,
+            status=status.HTTP_201_CREATED
+        )
+
+
+class StockAlertViewSet(ConditionalGetMixin, ResponseCacheMixin,
+                        mixins.ListModelMixin, viewsets.GenericViewSet):
+    """Feed of low-stock alerts, latest first"""
+    serializer_class = serializers.StockAlertSerializer
+    queryset = StockAlert.objects.all()
+    authentication_classes = (TokenAuthentication,)
+    permission_classes = (IsAuthenticated,)
+    pagination_class = KeysetPagination
+    version_keys = ('stockalert:{user}', 'product:{user}')
+
+    def get_queryset(self):
+        """Retrieve the alerts of the authenticated user"""
+        queryset = self.queryset.filter(user=self.request.user)
+        if bool(int(self.request.query_params.get('open', 0))):
+            queryset = queryset.filter(resolved_at__isnull=True)
+
+        return queryset.select_related('product').order_by('-created_at',
+                                                           '-id')
+
+    def get_keyset_ordering(self):
+        """Page the feed from the latest alert back"""
+        return ('-created_at', '-id')
+
+
+class StockViewSet(ConditionalGetMixin, ResponseCacheMixin,
+                   IdempotencyMixin, PrefetchRelatedMixin, ExpandMixin,
+                   ValuesReadMixin, ExportMixin, viewsets.ModelViewSet):
     """Manage DeliveryOrder in the database"""
     serializer_class = serializers.StockSerializer
+    detail_serializer_class = serializers.StockDetailSerializer
     queryset = Stock.objects.all()
     authentication_classes = (TokenAuthentication,)
     permission_classes = (IsAuthenticated,)
+    pagination_class = KeysetPagination
+    version_keys = ('stock:{user}', 'product:{user}', 'tag', 'category')
+    prefetch_related_map = {
+        serializers.StockSerializer: ('products',),
+        serializers.StockDetailSerializer: (PRODUCT_DETAIL_PREFETCH,),
+    }
 
     def _params_to_ints(self, qs):
         """Convert a list of string ids to a list of integers"""
@@ -155,17 +758,260 @@ class StockViewSet(viewsets.ModelViewSet):
         queryset = self.queryset
         if products:
             product_ids = self._params_to_ints(products)
-            queryset = queryset.filter(tags__id__in=product_ids)
+            queryset = queryset.filter(product_id__in=product_ids)
 
-        return queryset.filter(user=self.request.user)
+        return queryset.filter(user=self.request.user).prefetch_related(
+            *self.get_prefetch_related()
+        )
+
+    def get_keyset_ordering(self):
+        """Page stock history from the latest movement back"""
+        if self.action == 'movements':
+            return ('-created_at', '-id')
+
+        return None
 
     def get_serializer_class(self):
         """Return appropriate serializer class"""
-        if self.action == 'retrieve':
-            return serializers.StockSerializer
-
-        return self.serializer_class
+        if self.action in ('increment', 'decrement'):
+            return serializers.StockQuantitySerializer
+        elif self.action == 'adjust':
+            return serializers.StockAdjustmentSerializer
+        elif self.action == 'transfer':
+            return serializers.StockTransferSerializer
+        elif self.action == 'movements':
+            return serializers.StockMovementSerializer
+        elif self.action == 'reconcile':
+            return serializers.ReconcileSerializer
+
+        return super().get_serializer_class()
 
     def perform_create(self, serializer):
-        """create a new DeliveryOrder"""
-        serializer.save(user=self.request.user)
+        """create a new Stock, numbering it when not given one"""
+        with transaction.atomic():
+            stock = save_numbered(serializer, 'StockNo', 'stock',
+                                  user=self.request.user)
+            open_balance(stock)
+            evaluate_stocks(stock.user_id, [stock.pk])
+
+    def perform_destroy(self, instance):
+        """Delete a stock, closing its balance in the ledger"""
+        with transaction.atomic():
+            close_stock(instance)
+            instance.delete()
+            if instance.product_id is not None:
+                evaluate_products(instance.user_id, [instance.product_id])
+
+    def perform_update(self, serializer):
+        """Update a stock, booking a quantity or number change in the ledger"""
+        with transaction.atomic():
+            # Save over the locked, current row rather than the copy read
+            # before validation, which a concurrent pick may have changed.
+            serializer.instance = Stock.objects.select_for_update().get(
+                pk=serializer.instance.pk
+            )
+            previous = serializer.instance.StockNo
+            previous_product = serializer.instance.product_id
+            quantity = serializer.validated_data.pop('Quantity', None)
+            stock = serializer.save()
+            if stock.StockNo != previous:
+                renumber_balance(stock, previous)
+            if quantity is not None:
+                try:
+                    stock.Quantity = set_quantities(
+                        self.request.user, {stock.StockNo: quantity}
+                    )[stock.StockNo]
+                except InsufficientStock:
+                    raise ValidationError({'Quantity': [
+                        f'Ensure this value is at least {stock.reserved}, '
+                        f'the quantity reserved.'
+                    ]})
+            if stock.product_id != previous_product:
+                # The stock counts toward another product now
+                evaluate_products(stock.user_id, [
+                    pk for pk in (previous_product, stock.product_id)
+                    if pk is not None
+                ])
+
+    def _post(self, movements, many=True):
+        """Post movements and respond with the new quantities"""
+        try:
+            quantities = post_movements(self.request.user, movements)
+        except UnknownStock as exc:
+            return Response(
+                {'StockNo': [f'Unknown stock: {", ".join(exc.stock_nos)}.']},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        except InsufficientStock as exc:
+            return Response(
+                {'detail': 'Insufficient stock.',
+                 'available': exc.available},
+                status=status.HTTP_409_CONFLICT
+            )
+
+        results = [
+            {'StockNo': stock_no, 'Quantity': quantity}
+            for stock_no, quantity in quantities.items()
+        ]
+
+        return Response(results if many else results[0],
+                        status=status.HTTP_200_OK)
+
+    def _adjust_one(self, request, sign):
+        """Add sign times the requested quantity to one stock"""
+        stock = self.get_object()
+        serializer = self.get_serializer(data=request.data)
+        if not serializer.is_valid():
+            return Response(
+                serializer.errors,
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        return self._post([{
+            'StockNo': stock.StockNo,
+            'quantity': sign * serializer.validated_data['quantity'],
+            'kind': StockMovement.Kind.ADJUSTMENT,
+        }], many=False)
+
+    @action(methods=['POST'], detail=True, url_path='increment')
+    @idempotent_action
+    def increment(self, request, pk=None):
+        """Add to the quantity of a stock"""
+        return self._adjust_one(request, 1)
+
+    @action(methods=['POST'], detail=True, url_path='decrement')
+    @idempotent_action
+    def decrement(self, request, pk=None):
+        """Take from the quantity of a stock, never below zero"""
+        return self._adjust_one(request, -1)
+
+    @action(methods=['POST'], detail=False, url_path='adjust')
+    @idempotent_action
+    def adjust(self, request):
+        """Post receipts, picks and adjustments to many stocks at once"""
+        serializer = self.get_serializer(
+            data=request.data,
+            many=True,
+            allow_empty=False
+        )
+        if not serializer.is_valid():
+            return Response(
+                serializer.errors,
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        return self._post(serializer.movements())
+
+    @action(methods=['POST'], detail=False, url_path='transfer')
+    @idempotent_action
+    def transfer(self, request):
+        """Move quantity from one stock to another"""
+        serializer = self.get_serializer(data=request.data)
+        if not serializer.is_valid():
+            return Response(
+                serializer.errors,
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        return self._post(transfer_movements(**serializer.validated_data))
+
+    @action(methods=['POST'], detail=False, url_path='reconcile')
+    @idempotent_action
+    def reconcile(self, request):
+        """Set stock to a cycle count and report the variances"""
+        serializer = self.get_serializer(data=request.data)
+        if not serializer.is_valid():
+            return Response(
+                serializer.errors,
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        try:
+            variances = reconcile_counts(
+                request.user,
+                serializer.quantities(),
+                reference=serializer.validated_data['reference']
+            )
+        except UnknownStock as exc:
+            return Response(
+                {'StockNo': [f'Unknown stock: {", ".join(exc.stock_nos)}.']},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        except CountBelowReserved as exc:
+            return Response(
+                {'detail': 'Counted less than is reserved.',
+                 'reserved': exc.reserved},
+                status=status.HTTP_409_CONFLICT
+            )
+
+        return Response({
+            'lines': len(serializer.validated_data['counts']),
+            'net': sum(counted - expected
+                       for _, expected, counted in variances),
+            'variances': [
+                {'StockNo': stock_no, 'expected': expected,
+                 'counted': counted, 'variance': counted - expected}
+                for stock_no, expected, counted in variances
+            ],
+        }, status=status.HTTP_200_OK)
+
+    @action(methods=['GET'], detail=True, url_path='movements')
+    def movements(self, request, pk=None):
+        """List the ledger of a stock, latest movement first"""
+        queryset = StockMovement.objects.filter(
+            user=request.user,
+            stock_id=self.get_object().pk
+        ).order_by('-created_at', '-id')
+        page = self.paginate_queryset(queryset)
+        if page is not None:
+            return self.get_paginated_response(
+                self.get_serializer(page, many=True).data
+            )
+
+        return Response(self.get_serializer(queryset, many=True).data)
+
+    @action(methods=['GET'], detail=False, url_path='as-of')
+    def as_of(self, request):
+        """List the quantity of every stock held at a past moment"""
+        try:
+            moment = parse_moment(request.query_params.get('at', ''))
+        except ValueError:
+            return Response(
+                {'at': ['Give an ISO 8601 date or datetime.']},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        return Response(stock_as_of(request.user, moment))
+
+    @action(methods=['GET'], detail=False, url_path='summary')
+    def summary(self, request):
+        """Total the on-hand quantity by location and/or product"""
+        return self.conditional(self._cached_summary, request)
+
+    def _cached_summary(self, request):
+        """Serve the summary through the response cache"""
+        return self.cached(self._summary, request)
+
+    def _summary(self, request):
+        """Compute the summary requested by the query parameters"""
+        params = request.query_params
+        group_by = [
+            name for name in params.get('group_by', 'location').split(',')
+            if name
+        ]
+        if not group_by or set(group_by) - set(SUMMARY_GROUPS):
+            return Response(
+                {'group_by': [
+                    f'Choose from: {", ".join(SUMMARY_GROUPS)}.'
+                ]},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        products = params.get('products')
+        locations = params.get('locations')
+
+        return Response(stock_summary(
+            request.user,
+            group_by,
+            locations=locations.split(',') if locations else (),
+            product_ids=self._params_to_ints(products) if products else ()
+        ))
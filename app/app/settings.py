@@ -37,6 +37,7 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'django.contrib.postgres',
     'rest_framework',
     'rest_framework.authtoken',
     'core',
@@ -97,6 +98,52 @@ DATABASES = {
 }
 
 
+# Cache
+# https://docs.djangoproject.com/en/3.1/topics/cache/
+# Any backend works; use a shared one such as Memcached or Redis to share
+# cached WMS responses and hit/miss counters between workers.
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'wms',
+    }
+}
+
+# Response cache of the WMS list and detail endpoints
+WMS_RESPONSE_CACHE = {
+    'ENABLED': True,
+    'ALIAS': 'default',
+    'TIMEOUT': 300,
+    # Seconds a miss may hold the recompute lock, and other requests for
+    # the same key wait for it before computing the response themselves
+    'LOCK_TIMEOUT': 10,
+    'LOCK_WAIT': 2,
+}
+
+# Capacity of a wave of delivery orders, by product lines, total product
+# weight and number of orders
+WMS_WAVES = {
+    'MAX_LINES': 200,
+    'MAX_WEIGHT': 1000,
+    'MAX_ORDERS': 50,
+}
+
+# Format of the delivery and stock numbers assigned by the server when a
+# client leaves them out, filled with the next number of a sequence
+WMS_NUMBERS = {
+    'deliveryorder': 'DO-{:08d}',
+    'stock': 'STK-{:08d}',
+}
+
+# Writes sent with an Idempotency-Key header replay their response to
+# retries for TTL seconds, purge_idempotency_keys deletes them after
+WMS_IDEMPOTENCY = {
+    'ENABLED': True,
+    'TTL': 86400,
+}
+
+
 # Password validation
 # https://docs.djangoproject.com/en/3.1/ref/settings/#auth-password-validators
 
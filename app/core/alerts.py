@@ -0,0 +1,107 @@
+from django.core.exceptions import EmptyResultSet
+from django.db import connection, transaction
+from django.db.models import Exists, OuterRef, Q, Sum
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from core.models import Product, Stock, StockAlert
+from core.versions import bump_versions
+
+# First key of the transaction advisory locks serializing the evaluation
+# of each product, the product id being the second
+EVALUATION_LOCK = 19
+
+
+def _lock_products(products):
+    """Lock the evaluation of products until the transaction ends
+
+    Locks are taken in product id order, so concurrent evaluations queue
+    up instead of deadlocking. Returns the ids of the products locked.
+    """
+    query = products.order_by('pk').values_list('pk').query
+    try:
+        sql, params = query.sql_with_params()
+    except EmptyResultSet:
+        return []
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'SELECT p.id, pg_advisory_xact_lock(%s, p.id) '
+            f'FROM ({sql}) AS p (id)',
+            [EVALUATION_LOCK, *params]
+        )
+        return [pk for pk, _ in cursor.fetchall()]
+
+
+def evaluate_products(user_id, product_ids=None):
+    """Open and resolve the low-stock alerts of the user's products
+
+    Only products with a reorder point or an open alert are looked at, all
+    of them when product_ids is None. The alert of a product whose point
+    was cleared is resolved. Their totals are summed over the stock holding
+    them, through ``Stock.product``, in one query. Each product is locked
+    until the transaction ends first, so of two writers taking stock of
+    the same product the second sums after the first committed, and
+    sees the total drop. Returns the number of alerts opened and
+    resolved.
+    """
+    products = Product.objects.filter(
+        Q(reorder_point__isnull=False) | Q(Exists(StockAlert.objects.filter(
+            product=OuterRef('pk'),
+            resolved_at__isnull=True
+        ))),
+        user_id=user_id
+    )
+    if product_ids is not None:
+        products = products.filter(pk__in=product_ids)
+
+    with transaction.atomic(savepoint=False):
+        locked = _lock_products(products)
+        if not locked:
+            return 0, 0
+        levels = {
+            pk: (reorder_point, on_hand)
+            for pk, reorder_point, on_hand in Product.objects.filter(
+                pk__in=locked
+            ).annotate(
+                on_hand=Coalesce(Sum('stocks__Quantity'), 0)
+            ).values_list('pk', 'reorder_point', 'on_hand')
+        }
+        open_alerts = dict(StockAlert.objects.filter(
+            product_id__in=list(levels),
+            resolved_at__isnull=True
+        ).values_list('product_id', 'pk'))
+        now = timezone.now()
+        opened = [
+            StockAlert(user_id=user_id, product_id=pk,
+                       reorder_point=reorder_point, on_hand=on_hand,
+                       created_at=now)
+            for pk, (reorder_point, on_hand) in levels.items()
+            if reorder_point is not None and on_hand < reorder_point and
+            pk not in open_alerts
+        ]
+        resolved = [
+            alert_id for pk, alert_id in open_alerts.items()
+            if levels[pk][0] is None or levels[pk][1] >= levels[pk][0]
+        ]
+        # A concurrent writer may open the same alert first, the
+        # one-open-alert constraint keeps just one of them
+        StockAlert.objects.bulk_create(opened, ignore_conflicts=True)
+        StockAlert.objects.filter(pk__in=resolved).update(resolved_at=now)
+        if opened or resolved:
+            bump_versions('stockalert', [user_id])
+
+    return len(opened), len(resolved)
+
+
+def evaluate_stocks(user_id, stock_ids):
+    """Re-evaluate the alerts of the products held by changed stock
+
+    stock_ids may be a list or a queryset of stock ids. Called after
+    every write changing Stock.Quantity, in the same transaction.
+    """
+    return evaluate_products(
+        user_id,
+        Stock.objects.filter(
+            pk__in=stock_ids, product__isnull=False
+        ).values('product_id')
+    )
@@ -0,0 +1,349 @@
+import csv
+import io
+import json
+
+from core.alerts import evaluate_products
+from core.inventory import stock_product_sql
+from core.orders import totals_sql
+from core.models import Stock
+from core.numbers import allocate
+
+STAGE_TABLE = 'wms_import_stage'
+LIST_SEPARATOR = ';'
+
+
+class Loader:
+    """Copy a batch of rows into a staging table and merge it set-based
+
+    Subclasses name the staging ``columns`` (all loaded as text) and the
+    ``merge_sql`` statements that move the batch into the real tables.
+    Every statement is run with the importing user's id as ``%(user)s``.
+    Rows leaving the ``numbered`` column empty get a new number of that
+    kind from core.numbers. ``skipped_sql`` statements select the
+    ``(line, reason, whole_row)`` of what the merge left out.
+    """
+    columns = ()
+    merge_sql = ()
+    skipped_sql = ()
+    numbered = None
+
+    def load(self, cursor, rows, first_line, user_id):
+        """Stage and merge rows, first_line numbering the first of them
+
+        Returns the ``(line, reason, whole_row)`` of every row or name
+        left out, in line order.
+        """
+        if self.numbered:
+            column, kind = self.numbered
+            unnumbered = [row for row in rows if not row.get(column)]
+            for row, number in zip(unnumbered,
+                                   allocate(kind, len(unnumbered))):
+                row[column] = number
+        cursor.execute(f'DROP TABLE IF EXISTS {STAGE_TABLE}')
+        cursor.execute(
+            f'CREATE TEMP TABLE {STAGE_TABLE} (line bigint, ' +
+            ', '.join(f'"{column}" text' for column in self.columns) +
+            ') ON COMMIT DROP'
+        )
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        for line, row in enumerate(rows, first_line):
+            writer.writerow(
+                [line] + [_to_text(row.get(column)) for column in self.columns]
+            )
+        buffer.seek(0)
+        cursor.copy_expert(
+            f'COPY {STAGE_TABLE} (line, ' +
+            ', '.join(f'"{column}"' for column in self.columns) +
+            ') FROM STDIN WITH (FORMAT csv)',
+            buffer
+        )
+        for sql in self.merge_sql:
+            cursor.execute(sql, {'user': user_id})
+        skipped = []
+        for sql in self.skipped_sql:
+            cursor.execute(sql, {'user': user_id})
+            skipped += cursor.fetchall()
+
+        return sorted(skipped)
+
+
+def _to_text(value):
+    """Render a parsed value as the text loaded into the staging table"""
+    if value is None:
+        return ''
+    if isinstance(value, list):
+        return LIST_SEPARATOR.join(str(item) for item in value)
+
+    return str(value)
+
+
+def _resolve_names(table, column):
+    """Create the tags/categories named in a staged list column"""
+    return f'''
+        INSERT INTO {table} (name, user_id)
+        SELECT DISTINCT btrim(n.name), %(user)s
+        FROM {STAGE_TABLE} s,
+             unnest(string_to_array(s."{column}", '{LIST_SEPARATOR}')) n(name)
+        WHERE btrim(n.name) <> ''
+        ON CONFLICT (name) DO NOTHING
+    '''
+
+
+def _owned_by_others(table, key):
+    """Select the staged rows whose key another user's row already has
+
+    The upserts keep such rows as they are.
+    """
+    return f'''
+        SELECT s.line, '{key} ' || s."{key}" || ' belongs to another user',
+               true
+        FROM {STAGE_TABLE} s
+        WHERE EXISTS (
+            SELECT 1 FROM {table} t
+            WHERE t."{key}" = s."{key}" AND t.user_id <> %(user)s
+        )
+    '''
+
+
+def _unknown_names(target_table, target_key, column):
+    """Select the names in a staged column matching none of the user's"""
+    return f'''
+        SELECT s.line, 'unknown {column} ' || btrim(n.name), false
+        FROM {STAGE_TABLE} s
+        CROSS JOIN LATERAL
+             unnest(string_to_array(s."{column}", '{LIST_SEPARATOR}')) n(name)
+        WHERE btrim(n.name) <> '' AND NOT EXISTS (
+            SELECT 1 FROM {target_table} t
+            WHERE t."{target_key}" = btrim(n.name) AND t.user_id = %(user)s
+        )
+    '''
+
+
+def _link_names(through, owner_table, owner_column, owner_key,
+                target_table, target_key, target_column, column,
+                defaults=None, owned=False):
+    """Add through table rows for the names listed in a staged column
+
+    Targets that are owned, rather than shared by every user, are only
+    looked up among the importing user's. defaults maps further through
+    table columns to the SQL value given to every new row.
+    """
+    defaults = defaults or {}
+    extra_columns = ''.join(f', {name}' for name in defaults)
+    extra_values = ''.join(f', {value}' for value in defaults.values())
+    owner_filter = ' AND t.user_id = %(user)s' if owned else ''
+    return f'''
+        INSERT INTO {through} ({owner_column}, {target_column}{extra_columns})
+        SELECT DISTINCT o.id, t.id{extra_values}
+        FROM {STAGE_TABLE} s
+        JOIN {owner_table} o
+          ON o."{owner_key}" = s."{owner_key}" AND o.user_id = %(user)s
+        CROSS JOIN LATERAL
+             unnest(string_to_array(s."{column}", '{LIST_SEPARATOR}')) n(name)
+        JOIN {target_table} t
+          ON t."{target_key}" = btrim(n.name){owner_filter}
+        ON CONFLICT ({owner_column}, {target_column}) DO NOTHING
+    '''
+
+
+class TagLoader(Loader):
+    columns = ('name',)
+    merge_sql = (
+        f'''
+        INSERT INTO core_tag (name, user_id)
+        SELECT DISTINCT btrim(name), %(user)s FROM {STAGE_TABLE}
+        WHERE btrim(name) <> ''
+        ON CONFLICT (name) DO NOTHING
+        ''',
+    )
+
+
+class CategoryLoader(Loader):
+    columns = ('name',)
+    merge_sql = (
+        f'''
+        INSERT INTO core_category (name, user_id)
+        SELECT DISTINCT btrim(name), %(user)s FROM {STAGE_TABLE}
+        WHERE btrim(name) <> ''
+        ON CONFLICT (name) DO NOTHING
+        ''',
+    )
+
+
+class ProductLoader(Loader):
+    columns = ('title', 'weight', 'price', 'link', 'tags', 'categories')
+    merge_sql = (
+        f'''
+        INSERT INTO core_product (user_id, title, weight, price, link)
+        SELECT DISTINCT ON (title) %(user)s, title, weight::numeric,
+               price::numeric, COALESCE(link, '')
+        FROM {STAGE_TABLE}
+        ORDER BY title, line DESC
+        ON CONFLICT (title) DO UPDATE SET
+            weight = EXCLUDED.weight,
+            price = EXCLUDED.price,
+            link = EXCLUDED.link
+        WHERE core_product.user_id = EXCLUDED.user_id
+        ''',
+        _resolve_names('core_tag', 'tags'),
+        _resolve_names('core_category', 'categories'),
+        _link_names('core_product_tags', 'core_product', 'product_id',
+                    'title', 'core_tag', 'name', 'tag_id', 'tags'),
+        _link_names('core_product_categories', 'core_product', 'product_id',
+                    'title', 'core_category', 'name', 'category_id',
+                    'categories'),
+        # New prices and weights carry into the orders holding them
+        totals_sql(
+            f'o.id IN (SELECT l.deliveryorder_id '
+            f'FROM core_deliveryorder_products l '
+            f'JOIN core_product p ON p.id = l.product_id '
+            f'WHERE p.user_id = %(user)s '
+            f'AND p.title IN (SELECT title FROM {STAGE_TABLE}))'
+        ),
+    )
+    skipped_sql = (
+        _owned_by_others('core_product', 'title'),
+    )
+
+
+class StockLoader(Loader):
+    columns = ('StockNo', 'Quantity', 'Location', 'products')
+    numbered = ('StockNo', 'stock')
+    # Quantity changes are booked in the movement ledger by the upsert
+    # statement itself: ``previous`` still sees the quantities before it,
+    # and the rows are locked first so no other writer changes them
+    # between that snapshot and the upsert.
+    merge_sql = (
+        f'''
+        SELECT 1 FROM core_stock
+        WHERE user_id = %(user)s
+          AND "StockNo" IN (SELECT "StockNo" FROM {STAGE_TABLE})
+        ORDER BY id
+        FOR UPDATE
+        ''',
+        f'''
+        WITH incoming AS (
+            SELECT DISTINCT ON ("StockNo") "StockNo",
+                   "Quantity"::integer AS "Quantity",
+                   COALESCE("Location", '') AS "Location"
+            FROM {STAGE_TABLE}
+            ORDER BY "StockNo", line DESC
+        ), previous AS (
+            SELECT s.id, s."Quantity"
+            FROM core_stock s JOIN incoming i USING ("StockNo")
+            WHERE s.user_id = %(user)s
+        ), upserted AS (
+            INSERT INTO core_stock (user_id, "StockNo", "Quantity",
+                                    "Location", reserved, version)
+            SELECT %(user)s, "StockNo", "Quantity", "Location", 0, 0
+            FROM incoming
+            ON CONFLICT ("StockNo") DO UPDATE SET
+                "Quantity" = EXCLUDED."Quantity",
+                "Location" = EXCLUDED."Location",
+                version = core_stock.version + 1
+            WHERE core_stock.user_id = EXCLUDED.user_id
+            RETURNING id, "StockNo", "Quantity"
+        )
+        INSERT INTO core_stockmovement (user_id, stock_id, stock_no, kind,
+                                        quantity, balance, reference,
+                                        created_at)
+        SELECT %(user)s, u.id, u."StockNo",
+               CASE WHEN p.id IS NULL THEN 'opening' ELSE 'adjustment' END,
+               u."Quantity" - COALESCE(p."Quantity", 0), u."Quantity",
+               'import_wms', clock_timestamp()
+        FROM upserted u LEFT JOIN previous p USING (id)
+        WHERE u."Quantity" <> COALESCE(p."Quantity", 0)
+        ''',
+        _link_names('core_stock_products', 'core_stock', 'stock_id',
+                    'StockNo', 'core_product', 'title', 'product_id',
+                    'products', owned=True),
+        stock_product_sql(
+            f's.user_id = %(user)s AND s."StockNo" IN '
+            f'(SELECT "StockNo" FROM {STAGE_TABLE})'
+        ),
+    )
+    skipped_sql = (
+        _owned_by_others('core_stock', 'StockNo'),
+        _unknown_names('core_product', 'title', 'products'),
+    )
+
+    def load(self, cursor, rows, first_line, user_id):
+        """Stage and merge rows, then re-evaluate low-stock alerts
+
+        Both the products the stock held before and those it holds now are
+        evaluated, as relinking moves stock from one to the other.
+        """
+        previous = set(Stock.objects.filter(
+            user_id=user_id,
+            StockNo__in={row.get('StockNo') for row in rows},
+            product__isnull=False
+        ).values_list('product_id', flat=True))
+        skipped = super().load(cursor, rows, first_line, user_id)
+        current = Stock.objects.filter(
+            user_id=user_id,
+            StockNo__in={row.get('StockNo') for row in rows},
+            product__isnull=False
+        ).values_list('product_id', flat=True)
+        evaluate_products(user_id, previous | set(current))
+
+        return skipped
+
+
+class DeliveryOrderLoader(Loader):
+    columns = ('deliveryNumber', 'sentFrom', 'sentTo', 'fullAddress',
+               'contactPerson', 'price', 'products')
+    numbered = ('deliveryNumber', 'deliveryorder')
+    merge_sql = (
+        f'''
+        INSERT INTO core_deliveryorder (user_id, "deliveryNumber",
+            "sentFrom", "sentTo", "fullAddress", "contactPerson", price,
+            total_price, total_weight, status, created_at, updated_at)
+        SELECT DISTINCT ON ("deliveryNumber") %(user)s, "deliveryNumber",
+               COALESCE("sentFrom", ''), COALESCE("sentTo", ''),
+               COALESCE("fullAddress", ''), COALESCE("contactPerson", ''),
+               price::numeric, 0, 0, 'draft', now(), now()
+        FROM {STAGE_TABLE}
+        ORDER BY "deliveryNumber", line DESC
+        ON CONFLICT ("deliveryNumber") DO UPDATE SET
+            "sentFrom" = EXCLUDED."sentFrom",
+            "sentTo" = EXCLUDED."sentTo",
+            "fullAddress" = EXCLUDED."fullAddress",
+            "contactPerson" = EXCLUDED."contactPerson",
+            price = EXCLUDED.price,
+            updated_at = EXCLUDED.updated_at
+        WHERE core_deliveryorder.user_id = EXCLUDED.user_id
+        ''',
+        _link_names('core_deliveryorder_products', 'core_deliveryorder',
+                    'deliveryorder_id', 'deliveryNumber', 'core_product',
+                    'title', 'product_id', 'products', {'quantity': 1},
+                    owned=True),
+        totals_sql(
+            f'o.user_id = %(user)s AND o."deliveryNumber" IN '
+            f'(SELECT "deliveryNumber" FROM {STAGE_TABLE})'
+        ),
+    )
+    skipped_sql = (
+        _owned_by_others('core_deliveryorder', 'deliveryNumber'),
+        _unknown_names('core_product', 'title', 'products'),
+    )
+
+
+LOADERS = {
+    'tag': TagLoader,
+    'category': CategoryLoader,
+    'product': ProductLoader,
+    'stock': StockLoader,
+    'deliveryorder': DeliveryOrderLoader,
+}
+
+
+def read_rows(path, input_format):
+    """Yield the rows of a CSV or newline-delimited JSON file as dicts"""
+    with open(path, newline='', encoding='utf-8') as source:
+        if input_format == 'csv':
+            yield from csv.DictReader(source)
+        else:
+            for line in source:
+                if line.strip():
+                    yield json.loads(line)
@@ -0,0 +1,518 @@
+from collections import Counter
+from datetime import timedelta
+
+from django.db import connection, transaction
+from django.db.models import (
+    Case, Count, F, IntegerField, Sum, Value, When
+)
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+
+from core.alerts import evaluate_stocks
+from core.models import (
+    InventoryCheckpoint, InventoryCheckpointLine, Stock, StockMovement,
+    StockReservation
+)
+from core.versions import bump_versions
+
+Kind = StockMovement.Kind
+
+# Checkpoints are taken this far in the past, so every movement stamped
+# before the checkpoint has long been committed when it is built.
+CHECKPOINT_LAG = timedelta(minutes=5)
+
+
+class StockAdjustmentError(Exception):
+    """A stock adjustment that cannot be applied"""
+
+    def __init__(self, stock_nos):
+        super().__init__(', '.join(map(str, stock_nos)))
+        self.stock_nos = stock_nos
+
+
+class UnknownStock(StockAdjustmentError):
+    """Some stock numbers do not exist for the user"""
+
+
+class InsufficientStock(StockAdjustmentError):
+    """Some adjustments would take a quantity below zero"""
+
+    def __init__(self, available):
+        super().__init__(sorted(available))
+        self.available = available
+
+
+class CountBelowReserved(StockAdjustmentError):
+    """Some counted quantities are less than what is reserved"""
+
+    def __init__(self, reserved):
+        super().__init__(sorted(reserved))
+        self.reserved = reserved
+
+
+def _lock(user, stock_nos):
+    """Lock the user's stock rows
+
+    Returns ``{StockNo: (id, Quantity, reserved)}``. Rows are locked in
+    primary key order, so concurrent writers queue up instead of
+    deadlocking.
+    """
+    rows = Stock.objects.select_for_update().filter(
+        user=user,
+        StockNo__in=stock_nos
+    ).order_by('pk').values_list('pk', 'StockNo', 'Quantity', 'reserved')
+    locked = {
+        stock_no: (pk, quantity, reserved)
+        for pk, stock_no, quantity, reserved in rows
+    }
+    unknown = sorted(set(stock_nos) - set(locked))
+    if unknown:
+        raise UnknownStock(unknown)
+
+    return locked
+
+
+def _consume_reservations(locked, movements):
+    """Take picks for a delivery order out of its reservations
+
+    Returns the quantity released per stock id.
+    """
+    picks = Counter()
+    for movement in movements:
+        if (movement['kind'] == Kind.PICK and movement['quantity'] < 0 and
+                movement.get('delivery_order_id')):
+            stock_id = locked[movement['StockNo']][0]
+            picks[movement['delivery_order_id'], stock_id] -= (
+                movement['quantity']
+            )
+    if not picks:
+        return Counter()
+
+    consumed = Counter()
+    emptied, reduced = [], []
+    for reservation in StockReservation.objects.select_for_update().filter(
+        delivery_order_id__in={order_id for order_id, _ in picks},
+        stock_id__in={stock_id for _, stock_id in picks}
+    ).order_by('pk'):
+        key = reservation.delivery_order_id, reservation.stock_id
+        taken = min(reservation.quantity, picks[key])
+        if not taken:
+            continue
+        picks[key] -= taken
+        consumed[reservation.stock_id] += taken
+        reservation.quantity -= taken
+        (reduced if reservation.quantity else emptied).append(reservation)
+    StockReservation.objects.filter(pk__in=[r.pk for r in emptied]).delete()
+    StockReservation.objects.bulk_update(reduced, ['quantity'])
+
+    return consumed
+
+
+def post_movements(user, movements):
+    """Append movements to the ledger and apply them to the balances
+
+    Each movement is a dict holding ``StockNo``, a signed ``quantity``,
+    its ``kind`` and optionally ``product_id``, ``delivery_order_id`` and
+    ``reference``. The ledger rows are bulk inserted and every balance is
+    updated by one UPDATE in the same transaction, all or nothing. Picks
+    for a delivery order use up its reservations first; anything else can
+    only take what is not reserved.
+    Returns the new quantity of each stock number, in input order.
+    """
+    with transaction.atomic():
+        locked = _lock(user, {movement['StockNo'] for movement in movements})
+        consumed = _consume_reservations(locked, movements)
+        balances = {}
+        short = {}
+        entries = []
+        for movement in movements:
+            stock_no = movement['StockNo']
+            stock_id, quantity, reserved = locked[stock_no]
+            # What is left reserved for others may not be taken either
+            floor = reserved - consumed[stock_id]
+            balance = balances.get(stock_no, quantity) + movement['quantity']
+            if balance < floor:
+                short[stock_no] = quantity - floor
+            balances[stock_no] = balance
+            entries.append(StockMovement(
+                user=user,
+                stock_id=stock_id,
+                stock_no=stock_no,
+                product_id=movement.get('product_id'),
+                delivery_order_id=movement.get('delivery_order_id'),
+                kind=movement['kind'],
+                quantity=movement['quantity'],
+                balance=balance,
+                reference=movement.get('reference', '')
+            ))
+        if short:
+            raise InsufficientStock(short)
+
+        StockMovement.objects.bulk_create(entries)
+        # The CHECK constraints back the tests above for any writer not
+        # going through the ledger.
+        stock_ids = {stock_no: locked[stock_no][0] for stock_no in balances}
+        changes = {
+            'Quantity': F('Quantity') + Case(
+                *[When(pk=stock_ids[stock_no],
+                       then=Value(balance - locked[stock_no][1]))
+                  for stock_no, balance in balances.items()],
+                output_field=IntegerField()
+            ),
+            'version': F('version') + 1,
+        }
+        if consumed:
+            changes['reserved'] = F('reserved') - Case(
+                *[When(pk=stock_id, then=Value(units))
+                  for stock_id, units in consumed.items()],
+                default=Value(0),
+                output_field=IntegerField()
+            )
+        Stock.objects.filter(pk__in=stock_ids.values()).update(**changes)
+        bump_versions('stock', [user.id])
+        evaluate_stocks(user.id, list(stock_ids.values()))
+
+    return balances
+
+
+def adjust_quantities(user, deltas, kind=Kind.ADJUSTMENT):
+    """Add ``{StockNo: delta}`` to the user's stock, all or nothing"""
+    return post_movements(user, [
+        {'StockNo': stock_no, 'quantity': delta, 'kind': kind}
+        for stock_no, delta in deltas.items()
+    ])
+
+
+def set_quantities(user, quantities, kind=Kind.ADJUSTMENT):
+    """Book the difference to ``{StockNo: quantity}`` as movements"""
+    with transaction.atomic():
+        locked = _lock(user, quantities)
+        deltas = {
+            stock_no: quantity - locked[stock_no][1]
+            for stock_no, quantity in quantities.items()
+            if quantity != locked[stock_no][1]
+        }
+        if not deltas:
+            return quantities
+
+        return {**quantities, **adjust_quantities(user, deltas, kind)}
+
+
+def reconcile_counts(user, counts, reference=''):
+    """Set the user's stock to the counted ``{StockNo: quantity}``
+
+    Variances against the current quantities come from one query joining
+    the counts to the locked stock rows. They are applied by one UPDATE
+    and booked as count movements by one INSERT, in the same transaction,
+    so a count file of any size costs the same three statements.
+    Raises UnknownStock or CountBelowReserved without changing anything.
+    Returns the variances as ``(StockNo, expected, counted)`` rows.
+    """
+    stock_nos = list(counts)
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(
+            f'''
+            SELECT s.id, s."StockNo", s."Quantity", s.reserved, c.counted
+            FROM unnest(%s::varchar[], %s::integer[]) AS c ("StockNo", counted)
+            JOIN {Stock._meta.db_table} s
+              ON s."StockNo" = c."StockNo" AND s.user_id = %s
+            ORDER BY s.id
+            FOR UPDATE OF s
+            ''',
+            [stock_nos, [counts[stock_no] for stock_no in stock_nos],
+             user.id]
+        )
+        rows = cursor.fetchall()
+        unknown = sorted(set(stock_nos) - {row[1] for row in rows})
+        if unknown:
+            raise UnknownStock(unknown)
+        below = {
+            stock_no: reserved
+            for _, stock_no, _, reserved, counted in rows if counted < reserved
+        }
+        if below:
+            raise CountBelowReserved(below)
+
+        variances = [row for row in rows if row[4] != row[2]]
+        if variances:
+            ids, numbers, expected, _, counted = zip(*variances)
+            cursor.execute(
+                f'''
+                UPDATE {Stock._meta.db_table} AS s
+                SET "Quantity" = v.counted, version = s.version + 1
+                FROM unnest(%s::integer[], %s::integer[]) AS v (id, counted)
+                WHERE s.id = v.id
+                ''',
+                [list(ids), list(counted)]
+            )
+            cursor.execute(
+                f'''
+                INSERT INTO {StockMovement._meta.db_table}
+                    (user_id, stock_id, stock_no, kind, quantity, balance,
+                     reference, created_at)
+                SELECT %s, v.id, v."StockNo", %s, v.counted - v.expected,
+                       v.counted, %s, %s
+                FROM unnest(%s::integer[], %s::varchar[], %s::integer[],
+                            %s::integer[])
+                    AS v (id, "StockNo", expected, counted)
+                ''',
+                [user.id, Kind.COUNT, reference, timezone.now(),
+                 list(ids), list(numbers), list(expected), list(counted)]
+            )
+            bump_versions('stock', [user.id])
+            evaluate_stocks(user.id, list(ids))
+
+    return sorted((stock_no, expected, counted)
+                  for _, stock_no, expected, _, counted in variances)
+
+
+def transfer_movements(source, destination, quantity, **details):
+    """Return the pair of movements moving quantity between two stocks"""
+    return [
+        {**details, 'StockNo': source, 'quantity': -quantity,
+         'kind': Kind.TRANSFER_OUT},
+        {**details, 'StockNo': destination, 'quantity': quantity,
+         'kind': Kind.TRANSFER_IN},
+    ]
+
+
+def open_balance(stock):
+    """Record the quantity of a newly created stock in the ledger"""
+    if stock.Quantity:
+        StockMovement.objects.create(
+            user_id=stock.user_id,
+            stock=stock,
+            stock_no=stock.StockNo,
+            kind=Kind.OPENING,
+            quantity=stock.Quantity,
+            balance=stock.Quantity
+        )
+
+
+def close_stock(stock):
+    """Book the quantity left in a stock about to be deleted as taken out
+
+    The ledger outlives the stock, so its history still replays to the
+    moment of deletion and to nothing after it.
+    """
+    with transaction.atomic():
+        quantity = Stock.objects.select_for_update().values_list(
+            'Quantity', flat=True
+        ).get(pk=stock.pk)
+        if quantity:
+            StockMovement.objects.create(
+                user_id=stock.user_id,
+                stock=stock,
+                stock_no=stock.StockNo,
+                kind=Kind.CLOSING,
+                quantity=-quantity,
+                balance=0
+            )
+
+
+def renumber_balance(stock, previous):
+    """Move the quantity of a renumbered stock to its new StockNo
+
+    Books it as closed on the previous number and opened on the new one,
+    so replays by StockNo follow the rename. The caller holds the lock on
+    the stock row.
+    """
+    if stock.Quantity:
+        StockMovement.objects.bulk_create([
+            StockMovement(user_id=stock.user_id, stock=stock,
+                          stock_no=previous, kind=Kind.CLOSING,
+                          quantity=-stock.Quantity, balance=0),
+            StockMovement(user_id=stock.user_id, stock=stock,
+                          stock_no=stock.StockNo, kind=Kind.OPENING,
+                          quantity=stock.Quantity, balance=stock.Quantity),
+        ])
+
+
+def parse_moment(value):
+    """Parse an ISO 8601 date or datetime, a bare date meaning its end
+
+    Naive values are read in the current time zone. Raises ValueError
+    if value is neither.
+    """
+    moment = parse_datetime(value)
+    if moment is None:
+        day = parse_date(value)
+        if day is None:
+            raise ValueError(f'Invalid date or datetime: {value!r}')
+        moment = parse_datetime(f'{day.isoformat()}T23:59:59.999999')
+    if timezone.is_naive(moment):
+        moment = timezone.make_aware(moment)
+
+    return moment
+
+
+def quantities_as_of(user, moment):
+    """Return ``{StockNo: quantity}`` of the user's stock at moment
+
+    Starts from the latest checkpoint taken at or before moment and
+    replays only the movements since, so the cost follows the activity
+    since that checkpoint rather than the length of the whole ledger.
+    Stocks holding nothing are left out. Stock deleted since moment is
+    included, its history being kept under its StockNo.
+    """
+    checkpoint = InventoryCheckpoint.objects.filter(
+        user=user,
+        taken_at__lte=moment
+    ).order_by('-taken_at').first()
+
+    movements = StockMovement.objects.filter(user=user, created_at__lte=moment)
+    quantities = {}
+    if checkpoint is not None:
+        movements = movements.filter(created_at__gt=checkpoint.taken_at)
+        quantities.update(
+            checkpoint.lines.values_list('stock_no', 'quantity')
+        )
+    for stock_no, delta in movements.order_by().values(
+        'stock_no'
+    ).annotate(
+        delta=Sum('quantity')
+    ).values_list('stock_no', 'delta'):
+        quantities[stock_no] = quantities.get(stock_no, 0) + delta
+
+    return {
+        stock_no: quantity
+        for stock_no, quantity in quantities.items() if quantity
+    }
+
+
+def _stock_ids(user, stock_nos):
+    """Return ``{StockNo: id}`` of the given stock numbers still existing"""
+    return dict(Stock.objects.filter(
+        user=user,
+        StockNo__in=list(stock_nos)
+    ).values_list('StockNo', 'pk'))
+
+
+def stock_as_of(user, moment):
+    """Return the StockNo and quantity of the user's stock at moment
+
+    Stock deleted since has no id.
+    """
+    quantities = quantities_as_of(user, moment)
+    ids = _stock_ids(user, quantities)
+
+    return [
+        {'id': ids.get(stock_no), 'StockNo': stock_no,
+         'Quantity': quantities[stock_no]}
+        for stock_no in sorted(quantities)
+    ]
+
+
+def check_checkpoint_moment(taken_at):
+    """Raise ValueError if taken_at is later than CHECKPOINT_LAG ago
+
+    Reads replay only the movements after a checkpoint, so one taken any
+    later would hide movements still to be stamped before it.
+    """
+    latest = timezone.now() - CHECKPOINT_LAG
+    if taken_at > latest:
+        raise ValueError(
+            f'Checkpoints must be taken at or before {latest.isoformat()}'
+        )
+
+
+def take_checkpoint(user, taken_at=None):
+    """Store the user's stock quantities at taken_at as a checkpoint
+
+    Defaults to CHECKPOINT_LAG ago, the latest moment allowed. Returns
+    the existing checkpoint if one was already taken at that moment.
+    """
+    if taken_at is None:
+        taken_at = timezone.now() - CHECKPOINT_LAG
+    check_checkpoint_moment(taken_at)
+    with transaction.atomic():
+        existing = InventoryCheckpoint.objects.filter(
+            user=user,
+            taken_at=taken_at
+        ).first()
+        if existing is not None:
+            return existing
+
+        # Replayed before the new checkpoint exists to replay from
+        quantities = quantities_as_of(user, taken_at)
+        ids = _stock_ids(user, quantities)
+        checkpoint = InventoryCheckpoint.objects.create(user=user,
+                                                        taken_at=taken_at)
+        InventoryCheckpointLine.objects.bulk_create([
+            InventoryCheckpointLine(checkpoint=checkpoint,
+                                    stock_id=ids.get(stock_no),
+                                    stock_no=stock_no,
+                                    quantity=quantity)
+            for stock_no, quantity in quantities.items()
+        ], batch_size=5000)
+
+    return checkpoint
+
+
+SUMMARY_GROUPS = ('location', 'product')
+
+
+def stock_product_sql(where):
+    """Return SQL pointing the stock matching where at a linked product
+
+    A stock keeps its product while it is still linked through
+    ``Stock.products`` and otherwise moves to the lowest product linked,
+    or none. Keeps ``Stock.product`` in step with the many-to-many until
+    it is dropped.
+    """
+    links = Stock.products.through._meta.db_table
+    return f'''
+        UPDATE {Stock._meta.db_table} AS s
+        SET product_id = (
+            SELECT min(l.product_id) FROM {links} AS l
+            WHERE l.stock_id = s.id
+        )
+        WHERE {where} AND (s.product_id IS NULL OR NOT EXISTS (
+            SELECT 1 FROM {links} AS l
+            WHERE l.stock_id = s.id AND l.product_id = s.product_id
+        ))
+        RETURNING s.id, s.product_id
+        '''
+
+
+def sync_stock_product(stock_ids):
+    """Bring Stock.product of the given stock in step with its links
+
+    Returns ``{stock_id: product_id}`` of the stock that changed.
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(stock_product_sql('s.id = ANY(%s)'), [list(stock_ids)])
+        return dict(cursor.fetchall())
+
+
+def stock_summary(user, group_by, locations=(), product_ids=()):
+    """Return the user's on-hand totals grouped by location and/or product
+
+    group_by holds one or both names of SUMMARY_GROUPS. Totals per product go
+    through ``Stock.product``, the (user, product, Location) index covering
+    the filters. Everything is summed by the database.
+    """
+    rows = Stock.objects.filter(user=user)
+    if 'product' in group_by:
+        rows = rows.filter(product__isnull=False)
+    if product_ids:
+        rows = rows.filter(product_id__in=product_ids)
+    if locations:
+        rows = rows.filter(Location__in=locations)
+
+    keys = []
+    if 'location' in group_by:
+        keys.append(('Location', 'Location'))
+    if 'product' in group_by:
+        keys += [('product', 'product_id'), ('title', 'product__title')]
+    lookups = [lookup for _, lookup in keys]
+    rows = rows.order_by().values_list(*lookups).annotate(
+        total=Sum('Quantity'),
+        stocks=Count('id')
+    ).order_by(*lookups)
+
+    return [
+        {**{key: value for (key, _), value in zip(keys, row)},
+         'Quantity': row[-2], 'stocks': row[-1]}
+        for row in rows
+    ]
@@ -0,0 +1,37 @@
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+
+from core.alerts import evaluate_products
+from core.models import Product
+
+
+class Command(BaseCommand):
+    """Django Command to evaluate every low-stock alert at once"""
+    help = ('Open and resolve the low-stock alerts of every product with '
+            'a reorder point. Stock writes keep alerts current, run this '
+            'once to backfill them or after changing stock outside the '
+            'application.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--user',
+            help='Email of the user to evaluate, defaults to every user '
+                 'with a product reorder point'
+        )
+
+    def handle(self, *args, **options):
+        users = get_user_model().objects.all()
+        if options['user']:
+            users = users.filter(email=options['user'])
+            if not users.exists():
+                raise CommandError(f'Unknown user {options["user"]}')
+        else:
+            users = users.filter(pk__in=Product.objects.filter(
+                reorder_point__isnull=False
+            ).values('user_id'))
+
+        for user in users.order_by('pk'):
+            opened, resolved = evaluate_products(user.id)
+            self.stdout.write(
+                f'{user.email}: {opened} alerts opened, {resolved} resolved'
+            )
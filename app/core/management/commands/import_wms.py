@@ -0,0 +1,107 @@
+import os
+import time
+from itertools import islice
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction, DatabaseError
+
+from core.importer import LOADERS, read_rows
+from core.models import ImportCheckpoint
+from core.versions import bump_versions
+
+
+class Command(BaseCommand):
+    """Django Command to bulk load WMS data with PostgreSQL COPY"""
+    help = ('Load tags, categories, products, stock or delivery orders '
+            'from a CSV or newline-delimited JSON file')
+
+    def add_arguments(self, parser):
+        parser.add_argument('kind', choices=sorted(LOADERS))
+        parser.add_argument('path')
+        parser.add_argument(
+            '--user',
+            required=True,
+            help='Email of the user owning the imported rows'
+        )
+        parser.add_argument(
+            '--input-format',
+            choices=('csv', 'ndjson'),
+            help='Defaults to ndjson for .ndjson/.jsonl files, else csv'
+        )
+        parser.add_argument('--batch-size', type=int, default=50000)
+        parser.add_argument(
+            '--resume',
+            action='store_true',
+            help='Skip the rows committed by a previous failed run'
+        )
+
+    def handle(self, *args, **options):
+        path = os.path.abspath(options['path'])
+        input_format = options['input_format'] or (
+            'ndjson' if path.endswith(('.ndjson', '.jsonl')) else 'csv'
+        )
+        batch_size = options['batch_size']
+        if batch_size <= 0:
+            raise CommandError('--batch-size must be positive')
+        try:
+            user = get_user_model().objects.get(email=options['user'])
+        except get_user_model().DoesNotExist:
+            raise CommandError(f'Unknown user {options["user"]}')
+        loader = LOADERS[options['kind']]()
+
+        checkpoint, _ = ImportCheckpoint.objects.get_or_create(
+            source=f'{options["kind"]}:{path}'
+        )
+        if not options['resume']:
+            checkpoint.rows_done = 0
+            checkpoint.save()
+        elif checkpoint.rows_done:
+            self.stdout.write(f'Resuming after row {checkpoint.rows_done}')
+
+        rows = islice(read_rows(path, input_format), checkpoint.rows_done,
+                      None)
+        started = time.monotonic()
+        loaded = 0
+        rows_skipped = 0
+        while True:
+            first = checkpoint.rows_done + 1
+            try:
+                batch = list(islice(rows, batch_size))
+                if not batch:
+                    break
+                with transaction.atomic(), connection.cursor() as cursor:
+                    skipped = loader.load(cursor, batch, first, user.id)
+                    checkpoint.rows_done += len(batch)
+                    checkpoint.save()
+                    bump_versions(options['kind'], [user.id])
+            except (DatabaseError, ValueError) as exc:
+                raise CommandError(
+                    f'Import failed at row {first} or later: '
+                    f'{str(exc).strip()}. Fix the input and rerun with '
+                    '--resume.'
+                )
+            loaded += len(batch)
+            for line, reason, _ in skipped:
+                self.stdout.write(self.style.WARNING(
+                    f'Row {line}: skipped {reason}'
+                ))
+            rows_skipped += len({
+                line for line, _, whole_row in skipped if whole_row
+            })
+            self.stdout.write(
+                f'{checkpoint.rows_done} rows committed '
+                f'({_rate(loaded, started):.0f} rows/s)'
+            )
+
+        checkpoint.delete()
+        self.stdout.write(self.style.SUCCESS(
+            f'Imported {loaded - rows_skipped} {options["kind"]} rows, '
+            f'skipped {rows_skipped}, in {time.monotonic() - started:.1f}s '
+            f'({_rate(loaded, started):.0f} rows/s)'
+        ))
+
+
+def _rate(rows, started):
+    """Return the rows per second loaded since started"""
+    return rows / max(time.monotonic() - started, 1e-6)
@@ -0,0 +1,37 @@
+import csv
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+
+from core.inventory import parse_moment, stock_as_of
+
+
+class Command(BaseCommand):
+    """Django Command to print a user's stock as of a past moment"""
+    help = ('Write the quantity of every stock held at a moment as CSV, '
+            'replayed from the nearest inventory checkpoint')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'at',
+            help='ISO 8601 date or datetime, a date meaning its end'
+        )
+        parser.add_argument(
+            '--user',
+            required=True,
+            help='Email of the user owning the stock'
+        )
+
+    def handle(self, *args, **options):
+        try:
+            moment = parse_moment(options['at'])
+            user = get_user_model().objects.get(email=options['user'])
+        except ValueError as exc:
+            raise CommandError(str(exc))
+        except get_user_model().DoesNotExist:
+            raise CommandError(f'Unknown user {options["user"]}')
+
+        writer = csv.writer(self.stdout, lineterminator='\n')
+        writer.writerow(('StockNo', 'Quantity'))
+        for row in stock_as_of(user, moment):
+            writer.writerow((row['StockNo'], row['Quantity']))
@@ -0,0 +1,52 @@
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+
+from core.inventory import (
+    CHECKPOINT_LAG, check_checkpoint_moment, parse_moment, take_checkpoint
+)
+from core.models import Stock
+
+
+class Command(BaseCommand):
+    """Django Command to checkpoint stock quantities for as-of reads"""
+    help = ('Store every stock quantity as of a moment, so point in time '
+            'reads only replay the ledger since then. Run periodically, '
+            'e.g. nightly from cron.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--user',
+            help='Email of the user to checkpoint, defaults to every user '
+                 'owning stock'
+        )
+        parser.add_argument(
+            '--at',
+            help='ISO 8601 moment of the checkpoint, no later than and '
+                 f'defaulting to {CHECKPOINT_LAG.seconds // 60} minutes ago'
+        )
+
+    def handle(self, *args, **options):
+        taken_at = None
+        if options['at']:
+            try:
+                taken_at = parse_moment(options['at'])
+                check_checkpoint_moment(taken_at)
+            except ValueError as exc:
+                raise CommandError(str(exc))
+
+        users = get_user_model().objects.all()
+        if options['user']:
+            users = users.filter(email=options['user'])
+            if not users.exists():
+                raise CommandError(f'Unknown user {options["user"]}')
+        else:
+            users = users.filter(
+                pk__in=Stock.objects.values('user_id')
+            )
+
+        for user in users.order_by('pk'):
+            checkpoint = take_checkpoint(user, taken_at)
+            self.stdout.write(
+                f'{user.email}: {checkpoint.lines.count()} stocks as of '
+                f'{checkpoint.taken_at.isoformat()}'
+            )
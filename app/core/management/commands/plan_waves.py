@@ -0,0 +1,61 @@
+from decimal import Decimal
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+
+from core.models import DeliveryOrder
+from core.waves import WavePlanningConflict, plan_waves
+
+
+class Command(BaseCommand):
+    """Django Command to group pending delivery orders into waves"""
+    help = ('Group the delivery orders not in a wave yet into waves by '
+            'destination and shared products, within the WMS_WAVES '
+            'capacity limits.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--user',
+            help='Email of the user to plan for, defaults to every user '
+                 'with pending delivery orders'
+        )
+        parser.add_argument(
+            '--destination',
+            action='append',
+            dest='destinations',
+            default=[],
+            help='Only plan orders sent to this destination, repeatable'
+        )
+        parser.add_argument('--max-lines', type=int,
+                            help='Product lines per wave')
+        parser.add_argument('--max-weight', type=Decimal,
+                            help='Total product weight per wave')
+        parser.add_argument('--max-orders', type=int,
+                            help='Delivery orders per wave')
+
+    def handle(self, *args, **options):
+        users = get_user_model().objects.all()
+        if options['user']:
+            users = users.filter(email=options['user'])
+            if not users.exists():
+                raise CommandError(f'Unknown user {options["user"]}')
+        else:
+            users = users.filter(pk__in=DeliveryOrder.objects.filter(
+                wave__isnull=True
+            ).values('user_id'))
+
+        for user in users.order_by('pk'):
+            try:
+                waves = plan_waves(
+                    user,
+                    options['destinations'],
+                    max_lines=options['max_lines'],
+                    max_weight=options['max_weight'],
+                    max_orders=options['max_orders']
+                )
+            except WavePlanningConflict as exc:
+                raise CommandError(f'{user.email}: {exc}')
+            orders = DeliveryOrder.objects.filter(wave__in=waves).count()
+            self.stdout.write(
+                f'{user.email}: {len(waves)} waves of {orders} orders'
+            )
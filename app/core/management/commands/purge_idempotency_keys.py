@@ -0,0 +1,38 @@
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.utils import timezone
+
+from core.models import IdempotencyKey
+
+
+class Command(BaseCommand):
+    """Django Command to delete the expired idempotency keys"""
+    help = ('Delete the idempotency keys past their TTL, a batch at a time '
+            'through the expiry index so the table is never locked long. '
+            'Run it periodically, e.g. hourly from cron.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=5000,
+                            help='Keys deleted per statement')
+
+    def handle(self, *args, **options):
+        table = IdempotencyKey._meta.db_table
+        now = timezone.now()
+        deleted = 0
+        with connection.cursor() as cursor:
+            while True:
+                cursor.execute(
+                    f'''
+                    DELETE FROM {table} WHERE id IN (
+                        SELECT id FROM {table}
+                        WHERE expires_at <= %s
+                        LIMIT %s
+                    )
+                    ''',
+                    [now, options['batch_size']]
+                )
+                deleted += cursor.rowcount
+                if cursor.rowcount < options['batch_size']:
+                    break
+
+        self.stdout.write(f'{deleted} expired idempotency keys deleted')
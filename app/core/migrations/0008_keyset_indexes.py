@@ -0,0 +1,25 @@
+# Generated by Django 3.1.7 on 2021-05-03 09:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0007_stock'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['user', 'id'], name='product_user_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='deliveryorder',
+            index=models.Index(fields=['user', 'id'], name='deliveryorder_user_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='stock',
+            index=models.Index(fields=['user', 'id'], name='stock_user_id_idx'),
+        ),
+    ]
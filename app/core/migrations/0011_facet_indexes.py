@@ -0,0 +1,26 @@
+# Generated by Django 3.1.7 on 2021-05-12 08:05
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0010_product_search'),
+    ]
+
+    operations = [
+        # Auto-created through tables cannot declare Meta.indexes, so the
+        # reverse (target, product) lookups used for facet counts and the
+        # assigned_only EXISTS check are indexed here.
+        migrations.RunSQL(
+            'CREATE INDEX core_product_tags_tag_product_idx '
+            'ON core_product_tags (tag_id, product_id)',
+            'DROP INDEX core_product_tags_tag_product_idx',
+        ),
+        migrations.RunSQL(
+            'CREATE INDEX core_product_categories_category_product_idx '
+            'ON core_product_categories (category_id, product_id)',
+            'DROP INDEX core_product_categories_category_product_idx',
+        ),
+    ]
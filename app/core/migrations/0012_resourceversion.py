@@ -0,0 +1,22 @@
+# Generated by Django 3.1.7 on 2021-05-17 13:27
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0011_facet_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ResourceVersion',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('key', models.CharField(max_length=255, unique=True)),
+                ('version', models.BigIntegerField(default=0)),
+                ('modified', models.DateTimeField()),
+            ],
+        ),
+    ]
@@ -0,0 +1,37 @@
+# Generated by Django 3.1.7 on 2021-05-18 09:52
+
+from django.db import migrations, models
+
+
+def check_negative_quantities(apps, schema_editor):
+    """Refuse to add the constraint while any stock quantity is negative
+
+    Lists the offending stock, so an operator can count or correct it
+    before running the migration again.
+    """
+    Stock = apps.get_model('core', 'Stock')
+    negative = Stock.objects.filter(Quantity__lt=0).order_by(
+        'StockNo'
+    ).values_list('StockNo', 'Quantity')
+    if negative:
+        raise RuntimeError(
+            'Stock quantities must not be negative, correct them first: ' +
+            ', '.join(f'{stock_no} ({quantity})'
+                      for stock_no, quantity in negative)
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0012_resourceversion'),
+    ]
+
+    operations = [
+        migrations.RunPython(check_negative_quantities,
+                             migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='stock',
+            constraint=models.CheckConstraint(check=models.Q(Quantity__gte=0), name='stock_quantity_non_negative'),
+        ),
+    ]
@@ -0,0 +1,53 @@
+# Generated by Django 3.1.7 on 2021-05-19 10:05
+
+from django.conf import settings
+import django.contrib.postgres.indexes
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0013_stock_quantity_non_negative'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StockMovement',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('opening', 'Opening'), ('receipt', 'Receipt'), ('pick', 'Pick'), ('adjustment', 'Adjustment'), ('transfer_in', 'Transfer In'), ('transfer_out', 'Transfer Out')], max_length=20)),
+                ('quantity', models.IntegerField()),
+                ('balance', models.IntegerField()),
+                ('reference', models.CharField(blank=True, max_length=255)),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('delivery_order', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='core.deliveryorder')),
+                ('product', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='core.product')),
+                ('stock', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='movements', to='core.stock')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='stockmovement',
+            index=models.Index(fields=['stock', 'created_at', 'id'], name='stockmovement_stock_time_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='stockmovement',
+            index=django.contrib.postgres.indexes.BrinIndex(fields=['created_at'], name='stockmovement_time_brin'),
+        ),
+        # Open the ledger with the quantity every existing stock holds
+        migrations.RunSQL(
+            sql='''
+                INSERT INTO core_stockmovement
+                    (user_id, stock_id, kind, quantity, balance, reference,
+                     created_at)
+                SELECT user_id, id, 'opening', "Quantity", "Quantity", '',
+                       now()
+                FROM core_stock
+                WHERE "Quantity" <> 0
+            ''',
+            reverse_sql=migrations.RunSQL.noop,
+        ),
+    ]
@@ -0,0 +1,44 @@
+# Generated by Django 3.1.7 on 2021-05-20 08:31
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0014_stockmovement'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='InventoryCheckpoint',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('taken_at', models.DateTimeField()),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='InventoryCheckpointLine',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('quantity', models.IntegerField()),
+                ('checkpoint', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='lines', to='core.inventorycheckpoint')),
+                ('stock', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='core.stock')),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='inventorycheckpointline',
+            constraint=models.UniqueConstraint(fields=('checkpoint', 'stock'), name='inventorycheckpointline_stock'),
+        ),
+        migrations.AddIndex(
+            model_name='stockmovement',
+            index=models.Index(fields=['user', 'created_at'], name='stockmovement_user_time_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='inventorycheckpoint',
+            constraint=models.UniqueConstraint(fields=('user', 'taken_at'), name='inventorycheckpoint_user_time'),
+        ),
+    ]
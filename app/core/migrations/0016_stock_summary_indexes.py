@@ -0,0 +1,23 @@
+# Generated by Django 3.1.7 on 2021-05-21 11:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0015_inventorycheckpoint'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='stock',
+            index=models.Index(fields=['user', 'Location'], name='stock_user_location_idx'),
+        ),
+        # Totals per product start from the product side of the link
+        migrations.RunSQL(
+            'CREATE INDEX core_stock_products_product_stock_idx '
+            'ON core_stock_products (product_id, stock_id)',
+            'DROP INDEX core_stock_products_product_stock_idx',
+        ),
+    ]
@@ -0,0 +1,57 @@
+# Generated by Django 3.1.7 on 2021-05-24 09:40
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0016_stock_summary_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StockReservation',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('quantity', models.PositiveIntegerField()),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='stock',
+            name='reserved',
+            field=models.IntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='stock',
+            name='version',
+            field=models.BigIntegerField(default=0, editable=False),
+        ),
+        migrations.AddConstraint(
+            model_name='stock',
+            constraint=models.CheckConstraint(check=models.Q(reserved__gte=0, reserved__lte=models.F('Quantity')), name='stock_reserved_within_quantity'),
+        ),
+        migrations.AddField(
+            model_name='stockreservation',
+            name='delivery_order',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='reservations', to='core.deliveryorder'),
+        ),
+        migrations.AddField(
+            model_name='stockreservation',
+            name='product',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='core.product'),
+        ),
+        migrations.AddField(
+            model_name='stockreservation',
+            name='stock',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='reservations', to='core.stock'),
+        ),
+        migrations.AddField(
+            model_name='stockreservation',
+            name='user',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL),
+        ),
+    ]
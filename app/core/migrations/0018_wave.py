@@ -0,0 +1,39 @@
+# Generated by Django 3.1.7 on 2021-05-25 10:14
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0017_stockreservation'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Wave',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('sentTo', models.CharField(max_length=255)),
+                ('lines', models.PositiveIntegerField()),
+                ('weight', models.DecimalField(decimal_places=3, max_digits=25)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='wave',
+            name='user',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddField(
+            model_name='deliveryorder',
+            name='wave',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='orders', to='core.wave'),
+        ),
+        migrations.AddIndex(
+            model_name='deliveryorder',
+            index=models.Index(condition=models.Q(wave__isnull=True), fields=['user', 'sentTo'], name='deliveryorder_unwaved_idx'),
+        ),
+    ]
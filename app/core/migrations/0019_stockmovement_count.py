@@ -0,0 +1,18 @@
+# Generated by Django 3.1.7 on 2021-05-26 08:31
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0018_wave'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='stockmovement',
+            name='kind',
+            field=models.CharField(choices=[('opening', 'Opening'), ('receipt', 'Receipt'), ('pick', 'Pick'), ('adjustment', 'Adjustment'), ('transfer_in', 'Transfer In'), ('transfer_out', 'Transfer Out'), ('count', 'Count')], max_length=20),
+        ),
+    ]
@@ -0,0 +1,54 @@
+# Generated by Django 3.1.7 on 2021-05-28 09:40
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+BATCH_SIZE = 1000
+
+
+def backfill_product(apps, schema_editor):
+    """Point every stock at the lowest product linked to it
+
+    Walks the table in primary key ranges, each committed on its own, so
+    only the rows of one batch are locked at a time and writers keep
+    going while the migration runs.
+    """
+    Stock = apps.get_model('core', 'Stock')
+    connection = schema_editor.connection
+    last = Stock.objects.order_by('-pk').values_list('pk', flat=True).first()
+    start = 0
+    while last is not None and start < last:
+        with connection.cursor() as cursor:
+            cursor.execute(
+                '''
+                UPDATE core_stock AS s
+                SET product_id = l.product_id
+                FROM (
+                    SELECT stock_id, min(product_id) AS product_id
+                    FROM core_stock_products
+                    WHERE stock_id > %s AND stock_id <= %s
+                    GROUP BY stock_id
+                ) AS l
+                WHERE s.id = l.stock_id AND s.product_id IS NULL
+                ''',
+                [start, start + BATCH_SIZE]
+            )
+        start += BATCH_SIZE
+
+
+class Migration(migrations.Migration):
+    # Every backfill batch commits by itself
+    atomic = False
+
+    dependencies = [
+        ('core', '0020_stockalert'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='stock',
+            name='product',
+            field=models.ForeignKey(blank=True, db_index=False, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='stocks', to='core.product'),
+        ),
+        migrations.RunPython(backfill_product, migrations.RunPython.noop),
+    ]
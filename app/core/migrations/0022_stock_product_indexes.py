@@ -0,0 +1,24 @@
+# Generated by Django 3.1.7 on 2021-05-28 09:42
+
+from django.contrib.postgres.operations import AddIndexConcurrently
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    # Built concurrently, so writes to stock are not blocked meanwhile
+    atomic = False
+
+    dependencies = [
+        ('core', '0021_stock_product'),
+    ]
+
+    operations = [
+        AddIndexConcurrently(
+            model_name='stock',
+            index=models.Index(fields=['user', 'product', 'Location'], name='stock_user_product_loc_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='stock',
+            index=models.Index(fields=['product'], name='stock_product_idx'),
+        ),
+    ]
@@ -0,0 +1,92 @@
+# Generated by Django 3.1.7 on 2021-05-29 10:15
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0022_stock_product_indexes'),
+    ]
+
+    operations = [
+        # The existing many-to-many table becomes the line model, only
+        # gaining the quantity column
+        migrations.SeparateDatabaseAndState(
+            database_operations=[
+                migrations.RunSQL(
+                    sql='''
+                        ALTER TABLE core_deliveryorder_products
+                        ADD COLUMN quantity integer NOT NULL DEFAULT 1
+                            CHECK (quantity >= 0);
+                        ALTER TABLE core_deliveryorder_products
+                        ALTER COLUMN quantity DROP DEFAULT;
+                    ''',
+                    reverse_sql='''
+                        ALTER TABLE core_deliveryorder_products
+                        DROP COLUMN quantity;
+                    ''',
+                ),
+            ],
+            state_operations=[
+                migrations.CreateModel(
+                    name='DeliveryOrderLine',
+                    fields=[
+                        ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                        ('quantity', models.PositiveIntegerField(default=1)),
+                        ('deliveryorder', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='lines', to='core.deliveryorder')),
+                        ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='order_lines', to='core.product')),
+                    ],
+                    options={
+                        'db_table': 'core_deliveryorder_products',
+                        'unique_together': {('deliveryorder', 'product')},
+                    },
+                ),
+                migrations.AlterField(
+                    model_name='deliveryorder',
+                    name='products',
+                    field=models.ManyToManyField(through='core.DeliveryOrderLine', to='core.Product'),
+                ),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='deliveryorderline',
+            constraint=models.CheckConstraint(check=models.Q(quantity__gte=1), name='deliveryorderline_quantity_positive'),
+        ),
+        migrations.AddField(
+            model_name='deliveryorder',
+            name='total_price',
+            field=models.DecimalField(decimal_places=3, default=0, editable=False, max_digits=25),
+        ),
+        migrations.AddField(
+            model_name='deliveryorder',
+            name='total_weight',
+            field=models.DecimalField(decimal_places=3, default=0, editable=False, max_digits=25),
+        ),
+        migrations.RunSQL(
+            sql='''
+                UPDATE core_deliveryorder AS o
+                SET total_price = t.total_price,
+                    total_weight = t.total_weight
+                FROM (
+                    SELECT l.deliveryorder_id,
+                           sum(l.quantity * p.price) AS total_price,
+                           sum(l.quantity * p.weight) AS total_weight
+                    FROM core_deliveryorder_products AS l
+                    JOIN core_product AS p ON p.id = l.product_id
+                    GROUP BY l.deliveryorder_id
+                ) AS t
+                WHERE o.id = t.deliveryorder_id
+            ''',
+            reverse_sql=migrations.RunSQL.noop,
+        ),
+        migrations.AddIndex(
+            model_name='deliveryorder',
+            index=models.Index(fields=['user', 'total_price', 'id'], name='deliveryorder_user_price_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='deliveryorder',
+            index=models.Index(fields=['user', 'total_weight', 'id'], name='deliveryorder_user_weight_idx'),
+        ),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 3.1.7 on 2021-05-30 09:20
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0023_deliveryorderline'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='deliveryorder',
+            name='status',
+            field=models.CharField(choices=[('draft', 'Draft'), ('allocated', 'Allocated'), ('picked', 'Picked'), ('shipped', 'Shipped'), ('cancelled', 'Cancelled')], default='draft', editable=False, max_length=20),
+        ),
+        migrations.AddField(
+            model_name='deliveryorder',
+            name='created_at',
+            field=models.DateTimeField(auto_now_add=True, default=django.utils.timezone.now),
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name='deliveryorder',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True),
+        ),
+    ]
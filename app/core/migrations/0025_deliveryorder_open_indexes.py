@@ -0,0 +1,24 @@
+# Generated by Django 3.1.7 on 2021-05-30 09:22
+
+from django.contrib.postgres.operations import AddIndexConcurrently
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    # Built concurrently, so writes to delivery orders are not blocked
+    atomic = False
+
+    dependencies = [
+        ('core', '0024_deliveryorder_status'),
+    ]
+
+    operations = [
+        AddIndexConcurrently(
+            model_name='deliveryorder',
+            index=models.Index(condition=models.Q(status__in=['draft', 'allocated', 'picked']), fields=['user', 'status', 'id'], name='deliveryorder_open_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='deliveryorder',
+            index=models.Index(condition=models.Q(status__in=['draft', 'allocated', 'picked']), fields=['user', 'created_at'], name='deliveryorder_open_age_idx'),
+        ),
+    ]
@@ -0,0 +1,22 @@
+# Generated by Django 3.1.7 on 2021-05-31 10:05
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0025_deliveryorder_open_indexes'),
+    ]
+
+    # Handed out in blocks of core.numbers.BLOCK_SIZE
+    operations = [
+        migrations.RunSQL(
+            'CREATE SEQUENCE core_deliveryorder_number_seq INCREMENT 100',
+            'DROP SEQUENCE core_deliveryorder_number_seq',
+        ),
+        migrations.RunSQL(
+            'CREATE SEQUENCE core_stock_number_seq INCREMENT 100',
+            'DROP SEQUENCE core_stock_number_seq',
+        ),
+    ]
@@ -0,0 +1,82 @@
+# Generated by Django 3.1.7 on 2021-06-02 10:15
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+BATCH_SIZE = 10000
+
+
+def backfill_stock_no(apps, schema_editor):
+    """Copy the StockNo of every ledger and checkpoint row's stock
+
+    Walks each table in primary key ranges, each committed on its own, so
+    only the rows of one batch are locked at a time.
+    """
+    connection = schema_editor.connection
+    for model_name in ('StockMovement', 'InventoryCheckpointLine'):
+        model = apps.get_model('core', model_name)
+        table = model._meta.db_table
+        last = model.objects.order_by('-pk').values_list(
+            'pk', flat=True
+        ).first()
+        start = 0
+        while last is not None and start < last:
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    f'''
+                    UPDATE {table} AS r
+                    SET stock_no = s."StockNo"
+                    FROM core_stock AS s
+                    WHERE s.id = r.stock_id AND r.id > %s AND r.id <= %s
+                    ''',
+                    [start, start + BATCH_SIZE]
+                )
+            start += BATCH_SIZE
+
+
+class Migration(migrations.Migration):
+    # Every backfill batch commits by itself
+    atomic = False
+
+    dependencies = [
+        ('core', '0027_idempotencykey'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='inventorycheckpointline',
+            name='stock_no',
+            field=models.CharField(default='', max_length=255),
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name='stockmovement',
+            name='stock_no',
+            field=models.CharField(default='', max_length=255),
+            preserve_default=False,
+        ),
+        migrations.RunPython(backfill_stock_no, migrations.RunPython.noop),
+        migrations.RemoveConstraint(
+            model_name='inventorycheckpointline',
+            name='inventorycheckpointline_stock',
+        ),
+        migrations.AddConstraint(
+            model_name='inventorycheckpointline',
+            constraint=models.UniqueConstraint(fields=('checkpoint', 'stock_no'), name='inventorycheckpointline_stock'),
+        ),
+        migrations.AlterField(
+            model_name='inventorycheckpointline',
+            name='stock',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='core.stock'),
+        ),
+        migrations.AlterField(
+            model_name='stockmovement',
+            name='kind',
+            field=models.CharField(choices=[('opening', 'Opening'), ('receipt', 'Receipt'), ('pick', 'Pick'), ('adjustment', 'Adjustment'), ('transfer_in', 'Transfer In'), ('transfer_out', 'Transfer Out'), ('count', 'Count'), ('closing', 'Closing')], max_length=20),
+        ),
+        migrations.AlterField(
+            model_name='stockmovement',
+            name='stock',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='movements', to='core.stock'),
+        ),
+    ]
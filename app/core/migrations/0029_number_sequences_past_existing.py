@@ -0,0 +1,37 @@
+# Generated by Django 3.1.7 on 2021-06-02 11:30
+
+from django.db import migrations
+
+from core.numbers import NUMBERED, SEQUENCES, number_pattern
+
+
+def advance_sequences(apps, schema_editor):
+    """Move each number sequence past the numbers rows already have
+
+    Numbers clients gave rows in the allocated format would otherwise be
+    handed out again.
+    """
+    with schema_editor.connection.cursor() as cursor:
+        for kind, (model_name, field) in NUMBERED.items():
+            table = apps.get_model('core', model_name)._meta.db_table
+            cursor.execute(
+                f'''
+                SELECT setval(%s, GREATEST(
+                    (SELECT max(substring("{field}" FROM %s)::bigint)
+                     FROM {table}),
+                    (SELECT last_value FROM {SEQUENCES[kind]})
+                ))
+                ''',
+                [SEQUENCES[kind], number_pattern(kind)]
+            )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0028_ledger_stock_no'),
+    ]
+
+    operations = [
+        migrations.RunPython(advance_sequences, migrations.RunPython.noop),
+    ]
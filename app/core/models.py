@@ -1,9 +1,13 @@
 import uuid
 import os
+from django.contrib.postgres.indexes import BrinIndex, GinIndex
+from django.contrib.postgres.search import SearchVectorField
 from django.db import models
 from django.contrib.auth.models import AbstractBaseUser, BaseUserManager
 from django.contrib.auth.models import PermissionsMixin
 from django.conf import settings
+from django.utils import timezone
+from rest_framework.utils.encoders import JSONEncoder
 
 
 def product_image_file_path(instance, filename):
@@ -82,9 +86,23 @@ class Product(models.Model):
     weight = models.DecimalField(max_digits=25, decimal_places=3)
     price = models.DecimalField(max_digits=25, decimal_places=3)
     link = models.CharField(max_length=255, blank=True)
+    # Raise a low-stock alert when the stock holding the product totals
+    # less than this, never when unset
+    reorder_point = models.PositiveIntegerField(null=True, blank=True)
     categories = models.ManyToManyField('Category')
     tags = models.ManyToManyField('Tag')
     image = models.ImageField(null=True, upload_to=product_image_file_path)
+    # Maintained from title and link by a database trigger
+    search_vector = SearchVectorField(null=True, editable=False)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', 'id'], name='product_user_id_idx'),
+            GinIndex(fields=['search_vector'],
+                     name='product_search_vector_idx'),
+            GinIndex(fields=['title'], name='product_title_trgm_idx',
+                     opclasses=['gin_trgm_ops']),
+        ]
 
     def __str__(self):
         return self.title
@@ -92,6 +110,17 @@ class Product(models.Model):
 
 class DeliveryOrder(models.Model):
     """Product Object"""
+
+    class Status(models.TextChoices):
+        DRAFT = 'draft'
+        ALLOCATED = 'allocated'
+        PICKED = 'picked'
+        SHIPPED = 'shipped'
+        CANCELLED = 'cancelled'
+
+    # Still being worked on the floor, the rest is history
+    OPEN_STATUSES = (Status.DRAFT, Status.ALLOCATED, Status.PICKED)
+
     user = models.ForeignKey(
         settings.AUTH_USER_MODEL,
         on_delete=models.CASCADE
@@ -103,12 +132,90 @@ class DeliveryOrder(models.Model):
     contactPerson = models.CharField(max_length=255, blank=True)
     fullAddress = models.CharField(max_length=255, blank=True)
     price = models.DecimalField(max_digits=25, decimal_places=3)
-    products = models.ManyToManyField('Product')
+    products = models.ManyToManyField('Product', through='DeliveryOrderLine')
+    # Sums over the lines of quantity times the product's price and
+    # weight, maintained by core.orders.refresh_totals
+    total_price = models.DecimalField(max_digits=25, decimal_places=3,
+                                      default=0, editable=False)
+    total_weight = models.DecimalField(max_digits=25, decimal_places=3,
+                                       default=0, editable=False)
+    wave = models.ForeignKey('Wave', on_delete=models.SET_NULL,
+                             null=True, blank=True,
+                             related_name='orders')
+    status = models.CharField(max_length=20, choices=Status.choices,
+                              default=Status.DRAFT, editable=False)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', 'id'],
+                         name='deliveryorder_user_id_idx'),
+            # Orders still waiting for a wave, read by every planning run
+            models.Index(fields=['user', 'sentTo'],
+                         name='deliveryorder_unwaved_idx',
+                         condition=models.Q(wave__isnull=True)),
+            models.Index(fields=['user', 'total_price', 'id'],
+                         name='deliveryorder_user_price_idx'),
+            models.Index(fields=['user', 'total_weight', 'id'],
+                         name='deliveryorder_user_weight_idx'),
+            # Open orders only, so they stay small as shipped and
+            # cancelled history grows
+            models.Index(fields=['user', 'status', 'id'],
+                         name='deliveryorder_open_idx',
+                         condition=models.Q(status__in=[
+                             'draft', 'allocated', 'picked'
+                         ])),
+            models.Index(fields=['user', 'created_at'],
+                         name='deliveryorder_open_age_idx',
+                         condition=models.Q(status__in=[
+                             'draft', 'allocated', 'picked'
+                         ])),
+        ]
 
     def __str__(self):
         return self.deliveryNumber
 
 
+class DeliveryOrderLine(models.Model):
+    """A product on a delivery order and how many units of it"""
+    deliveryorder = models.ForeignKey('DeliveryOrder',
+                                      on_delete=models.CASCADE,
+                                      related_name='lines')
+    product = models.ForeignKey('Product', on_delete=models.CASCADE,
+                                related_name='order_lines')
+    quantity = models.PositiveIntegerField(default=1)
+
+    class Meta:
+        # The table of the plain many-to-many it replaces
+        db_table = 'core_deliveryorder_products'
+        unique_together = ('deliveryorder', 'product')
+        constraints = [
+            models.CheckConstraint(
+                check=models.Q(quantity__gte=1),
+                name='deliveryorderline_quantity_positive'
+            ),
+        ]
+
+    def __str__(self):
+        return f'{self.quantity} x {self.product_id}'
+
+
+class Wave(models.Model):
+    """Delivery orders to one destination released to pickers together"""
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE
+    )
+    sentTo = models.CharField(max_length=255)
+    lines = models.PositiveIntegerField()
+    weight = models.DecimalField(max_digits=25, decimal_places=3)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f'{self.sentTo} #{self.pk}'
+
+
 class Stock(models.Model):
     """Product Object"""
     user = models.ForeignKey(
@@ -118,7 +225,247 @@ class Stock(models.Model):
     StockNo = models.CharField(unique=True, max_length=255)
     Quantity = models.IntegerField()
     Location = models.CharField(max_length=255, blank=True)
+    # The product held at this location. Replaces ``products``, which is
+    # kept in step until every reader has moved over
+    product = models.ForeignKey(
+        'Product',
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='stocks',
+        db_index=False
+    )
     products = models.ManyToManyField('Product')
+    # Held for delivery orders, available is Quantity - reserved
+    reserved = models.IntegerField(default=0, editable=False)
+    # Bumped by every write to Quantity or reserved, for conditional
+    # updates by optimistic writers
+    version = models.BigIntegerField(default=0, editable=False)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', 'id'], name='stock_user_id_idx'),
+            models.Index(fields=['user', 'Location'],
+                         name='stock_user_location_idx'),
+            models.Index(fields=['user', 'product', 'Location'],
+                         name='stock_user_product_loc_idx'),
+            models.Index(fields=['product'], name='stock_product_idx'),
+        ]
+        constraints = [
+            models.CheckConstraint(
+                check=models.Q(Quantity__gte=0),
+                name='stock_quantity_non_negative'
+            ),
+            models.CheckConstraint(
+                check=models.Q(reserved__gte=0,
+                               reserved__lte=models.F('Quantity')),
+                name='stock_reserved_within_quantity'
+            ),
+        ]
 
     def __str__(self):
         return self.StockNo
+
+
+class StockMovement(models.Model):
+    """Append-only ledger entry of a change to a stock quantity
+
+    ``Stock.Quantity`` is the materialized sum of a stock's movements and
+    ``balance`` the quantity right after this movement, so history is
+    read from this table alone. Entries carry the StockNo they were booked
+    on and outlive their stock, whose deletion is booked as a closing
+    movement.
+    """
+
+    class Kind(models.TextChoices):
+        OPENING = 'opening'
+        RECEIPT = 'receipt'
+        PICK = 'pick'
+        ADJUSTMENT = 'adjustment'
+        TRANSFER_IN = 'transfer_in'
+        TRANSFER_OUT = 'transfer_out'
+        COUNT = 'count'
+        CLOSING = 'closing'
+
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE
+    )
+    stock = models.ForeignKey('Stock', on_delete=models.SET_NULL,
+                              null=True, blank=True,
+                              related_name='movements')
+    stock_no = models.CharField(max_length=255)
+    product = models.ForeignKey('Product', on_delete=models.SET_NULL,
+                                null=True, blank=True,
+                                related_name='+')
+    delivery_order = models.ForeignKey('DeliveryOrder',
+                                       on_delete=models.SET_NULL,
+                                       null=True, blank=True,
+                                       related_name='+')
+    kind = models.CharField(max_length=20, choices=Kind.choices)
+    quantity = models.IntegerField()
+    balance = models.IntegerField()
+    reference = models.CharField(max_length=255, blank=True)
+    created_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['stock', 'created_at', 'id'],
+                         name='stockmovement_stock_time_idx'),
+            models.Index(fields=['user', 'created_at'],
+                         name='stockmovement_user_time_idx'),
+            # Rows are appended in time order, so a BRIN index serves
+            # time range scans over the whole ledger at a tiny size.
+            BrinIndex(fields=['created_at'],
+                      name='stockmovement_time_brin'),
+        ]
+
+    def __str__(self):
+        return f'{self.kind} {self.quantity:+d}'
+
+
+class StockReservation(models.Model):
+    """Quantity of a stock held for a delivery order"""
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE
+    )
+    delivery_order = models.ForeignKey('DeliveryOrder',
+                                       on_delete=models.CASCADE,
+                                       related_name='reservations')
+    stock = models.ForeignKey('Stock', on_delete=models.CASCADE,
+                              related_name='reservations')
+    product = models.ForeignKey('Product', on_delete=models.SET_NULL,
+                                null=True, blank=True,
+                                related_name='+')
+    quantity = models.PositiveIntegerField()
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f'{self.quantity} of {self.stock_id}'
+
+
+class StockAlert(models.Model):
+    """A product whose stock dropped below its reorder point
+
+    Resolved once the stock is back at or above the reorder point, so a
+    product has at most one open alert.
+    """
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE
+    )
+    product = models.ForeignKey('Product', on_delete=models.CASCADE,
+                                related_name='alerts')
+    reorder_point = models.PositiveIntegerField()
+    on_hand = models.IntegerField()
+    created_at = models.DateTimeField(default=timezone.now)
+    resolved_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', '-created_at', '-id'],
+                         name='stockalert_user_time_idx'),
+        ]
+        constraints = [
+            models.UniqueConstraint(fields=['product'],
+                                    condition=models.Q(
+                                        resolved_at__isnull=True
+                                    ),
+                                    name='stockalert_one_open'),
+        ]
+
+    def __str__(self):
+        return f'{self.product_id}: {self.on_hand} < {self.reorder_point}'
+
+
+class InventoryCheckpoint(models.Model):
+    """Quantities of a user's stock as of a moment, built from the ledger"""
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE
+    )
+    taken_at = models.DateTimeField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'taken_at'],
+                                    name='inventorycheckpoint_user_time'),
+        ]
+
+    def __str__(self):
+        return f'{self.user} @ {self.taken_at.isoformat()}'
+
+
+class InventoryCheckpointLine(models.Model):
+    """Quantity of one stock in an inventory checkpoint"""
+    checkpoint = models.ForeignKey('InventoryCheckpoint',
+                                   on_delete=models.CASCADE,
+                                   related_name='lines')
+    stock = models.ForeignKey('Stock', on_delete=models.SET_NULL,
+                              null=True, blank=True,
+                              related_name='+')
+    stock_no = models.CharField(max_length=255)
+    quantity = models.IntegerField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['checkpoint', 'stock_no'],
+                                    name='inventorycheckpointline_stock'),
+        ]
+
+    def __str__(self):
+        return f'{self.stock_no}: {self.quantity}'
+
+
+class ImportCheckpoint(models.Model):
+    """Rows already committed by a resumable import_wms run"""
+    source = models.TextField(unique=True)
+    rows_done = models.BigIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return self.source
+
+
+class ResourceVersion(models.Model):
+    """Change counter of a WMS resource, bumped after every write"""
+    key = models.CharField(unique=True, max_length=255)
+    version = models.BigIntegerField(default=0)
+    modified = models.DateTimeField()
+
+    def __str__(self):
+        return f'{self.key}@{self.version}'
+
+
+class IdempotencyKey(models.Model):
+    """The response of a write sent with an Idempotency-Key header
+
+    Replayed to retries of the same request until expires_at. The key
+    is written in the same transaction as the response, so no other
+    request sees it without one.
+    """
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE
+    )
+    key = models.CharField(max_length=255)
+    fingerprint = models.CharField(max_length=64)
+    status_code = models.PositiveSmallIntegerField(null=True, blank=True)
+    response = models.JSONField(null=True, blank=True,
+                                encoder=JSONEncoder)
+    created_at = models.DateTimeField(default=timezone.now)
+    expires_at = models.DateTimeField()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['expires_at'],
+                         name='idempotencykey_expires_idx'),
+        ]
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'key'],
+                                    name='idempotencykey_user_key'),
+        ]
+
+    def __str__(self):
+        return f'{self.user_id}: {self.key}'
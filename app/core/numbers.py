@@ -0,0 +1,100 @@
+import re
+import threading
+
+from django.apps import apps
+from django.conf import settings
+from django.db import connection
+
+# Every nextval hands out a block of this many numbers, which the process
+# then assigns without going back to the database. Must match the
+# INCREMENT of the sequences.
+BLOCK_SIZE = 100
+
+SEQUENCES = {
+    'deliveryorder': 'core_deliveryorder_number_seq',
+    'stock': 'core_stock_number_seq',
+}
+
+DEFAULTS = {
+    'deliveryorder': 'DO-{:08d}',
+    'stock': 'STK-{:08d}',
+}
+
+# The model and unique field each kind numbers
+NUMBERED = {
+    'deliveryorder': ('DeliveryOrder', 'deliveryNumber'),
+    'stock': ('Stock', 'StockNo'),
+}
+
+_lock = threading.Lock()
+_blocks = {}
+
+
+def number_format(kind):
+    """Return the format of the numbers of kind, from WMS_NUMBERS"""
+    return {**DEFAULTS, **getattr(settings, 'WMS_NUMBERS', {})}[kind]
+
+
+def number_pattern(kind):
+    """Return a regex matching the numbers of kind, capturing the digits"""
+    prefix, rest = number_format(kind).split('{', 1)
+    suffix = rest.split('}', 1)[1]
+
+    return rf'^{re.escape(prefix)}(\d+){re.escape(suffix)}$'
+
+
+def _take_blocks(kind, count):
+    """Return the first numbers of count new blocks, in one query"""
+    with connection.cursor() as cursor:
+        cursor.execute('SELECT nextval(%s) FROM generate_series(1, %s)',
+                       [SEQUENCES[kind], count])
+        return [start for start, in cursor.fetchall()]
+
+
+def _taken(kind, numbers):
+    """Return the numbers of kind a row already has"""
+    model_name, field = NUMBERED[kind]
+    model = apps.get_model('core', model_name)
+
+    return set(model.objects.filter(
+        **{f'{field}__in': numbers}
+    ).values_list(field, flat=True))
+
+
+def allocate(kind, count=1):
+    """Return count new unique numbers of kind, formatted
+
+    Numbers come from blocks of the kind's sequence kept per process, so
+    a bulk allocation takes the blocks it needs in a single query. Numbers
+    a client already gave a row are checked for in one more query and
+    skipped. Numbers are unique across processes but not gapless, nor
+    strictly increasing between them.
+    """
+    fmt = number_format(kind)
+    numbers = []
+    while len(numbers) < count:
+        fresh = [fmt.format(number)
+                 for number in _next_numbers(kind, count - len(numbers))]
+        taken = _taken(kind, fresh)
+        numbers += [number for number in fresh if number not in taken]
+
+    return numbers
+
+
+def _next_numbers(kind, count):
+    """Return count numbers from the blocks of kind held by the process"""
+    numbers = []
+    with _lock:
+        block = _blocks.get(kind, [])
+        while len(numbers) < count:
+            if not block:
+                missing = count - len(numbers)
+                starts = _take_blocks(kind, -(-missing // BLOCK_SIZE))
+                block = [n for start in starts
+                         for n in range(start, start + BLOCK_SIZE)]
+            taken = count - len(numbers)
+            numbers += block[:taken]
+            block = block[taken:]
+        _blocks[kind] = block
+
+    return numbers
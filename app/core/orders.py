@@ -0,0 +1,180 @@
+from django.db import connection, transaction
+from django.utils import timezone
+
+from core.inventory import post_movements
+from core.models import (
+    DeliveryOrder, DeliveryOrderLine, Product, StockMovement,
+    StockReservation
+)
+from core.reservations import release_orders
+from core.versions import bump_versions
+
+Status = DeliveryOrder.Status
+
+# The statuses an order may move to, each from the statuses listed.
+# Orders only become allocated by reserving stock for them.
+TRANSITIONS = {
+    Status.PICKED: (Status.ALLOCATED,),
+    Status.SHIPPED: (Status.PICKED,),
+    Status.CANCELLED: (Status.DRAFT, Status.ALLOCATED, Status.PICKED),
+}
+
+
+class InvalidTransition(Exception):
+    """Some delivery orders cannot move to the requested status"""
+
+    def __init__(self, status, invalid):
+        super().__init__(
+            f'Cannot move {len(invalid)} orders to {status}.'
+        )
+        self.status = status
+        self.invalid = invalid
+
+
+def totals_sql(where):
+    """Return SQL recomputing the totals of the orders matching where
+
+    where filters ``core_deliveryorder AS o``. Each order's lines are
+    summed against its products' price and weight in one aggregate and
+    only orders whose totals moved are written.
+    """
+    orders = DeliveryOrder._meta.db_table
+    lines = DeliveryOrderLine._meta.db_table
+    products = Product._meta.db_table
+    return f'''
+        UPDATE {orders} AS target
+        SET total_price = t.total_price, total_weight = t.total_weight
+        FROM (
+            SELECT o.id,
+                   COALESCE(sum(l.quantity * p.price), 0) AS total_price,
+                   COALESCE(sum(l.quantity * p.weight), 0) AS total_weight
+            FROM {orders} AS o
+            LEFT JOIN {lines} AS l ON l.deliveryorder_id = o.id
+            LEFT JOIN {products} AS p ON p.id = l.product_id
+            WHERE {where}
+            GROUP BY o.id
+        ) AS t
+        WHERE target.id = t.id
+          AND (target.total_price, target.total_weight)
+              IS DISTINCT FROM (t.total_price, t.total_weight)
+        RETURNING target.id, target.total_price, target.total_weight
+        '''
+
+
+def refresh_totals(order_ids):
+    """Recompute the total price and weight of the given delivery orders
+
+    Returns ``{order_id: (total_price, total_weight)}`` of the orders
+    whose totals changed.
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(totals_sql('o.id = ANY(%s)'), [list(order_ids)])
+        return {pk: (price, weight)
+                for pk, price, weight in cursor.fetchall()}
+
+
+def refresh_product_totals(product_ids):
+    """Recompute the totals of every order holding the given products"""
+    with connection.cursor() as cursor:
+        cursor.execute(totals_sql(
+            f'o.id IN (SELECT deliveryorder_id '
+            f'FROM {DeliveryOrderLine._meta.db_table} '
+            f'WHERE product_id = ANY(%s))'
+        ), [list(product_ids)])
+        return cursor.rowcount
+
+
+def set_lines(order, quantities):
+    """Replace the lines of a delivery order with ``{product: quantity}``
+
+    Lines are deleted, updated and added in bulk and the order totals
+    recomputed in the same transaction. Returns the new totals.
+    """
+    with transaction.atomic():
+        lines = DeliveryOrderLine.objects.filter(deliveryorder=order)
+        lines.exclude(product_id__in=list(quantities)).delete()
+        current = dict(lines.values_list('product_id', 'pk'))
+        DeliveryOrderLine.objects.bulk_update([
+            DeliveryOrderLine(pk=current[product_id], quantity=quantity)
+            for product_id, quantity in quantities.items()
+            if product_id in current
+        ], ['quantity'])
+        DeliveryOrderLine.objects.bulk_create([
+            DeliveryOrderLine(deliveryorder=order, product_id=product_id,
+                              quantity=quantity)
+            for product_id, quantity in quantities.items()
+            if product_id not in current
+        ])
+        changed = refresh_totals([order.pk])
+        if order.pk in changed:
+            order.total_price, order.total_weight = changed[order.pk]
+        bump_versions('deliveryorder', [order.user_id])
+
+    return order.total_price, order.total_weight
+
+
+def ship_reservations(user, order_ids):
+    """Pick the stock reserved for orders out of the ledger
+
+    Returns the quantity picked.
+    """
+    held = StockReservation.objects.filter(
+        delivery_order_id__in=list(order_ids)
+    ).order_by('pk').values_list('stock__StockNo', 'product_id',
+                                 'delivery_order_id', 'quantity')
+    movements = [
+        {'StockNo': stock_no, 'quantity': -quantity,
+         'kind': StockMovement.Kind.PICK, 'product_id': product_id,
+         'delivery_order_id': order_id}
+        for stock_no, product_id, order_id, quantity in held
+    ]
+    if movements:
+        post_movements(user, movements)
+
+    return -sum(movement['quantity'] for movement in movements)
+
+
+def transition(user, order_ids, status):
+    """Move the user's delivery orders to status in one statement
+
+    The orders are locked in primary key order and updated together,
+    all or none: raises InvalidTransition, holding the ``(id, status)``
+    of each order not in a status allowed to move, when any is not.
+    Cancelled orders give their reserved stock back and shipped orders
+    take it out of stock, as PICK movements using up the reservations.
+    Returns the number of orders moved.
+    """
+    order_ids = sorted(set(order_ids))
+    table = DeliveryOrder._meta.db_table
+    with transaction.atomic():
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'''
+                UPDATE {table} AS o
+                SET status = %s, updated_at = %s
+                FROM (
+                    SELECT id FROM {table}
+                    WHERE user_id = %s AND id = ANY(%s)
+                    ORDER BY id
+                    FOR UPDATE
+                ) AS locked
+                WHERE o.id = locked.id AND o.status = ANY(%s)
+                RETURNING o.id
+                ''',
+                [status, timezone.now(), user.id, order_ids,
+                 list(TRANSITIONS[status])]
+            )
+            moved = [pk for pk, in cursor.fetchall()]
+        if len(moved) != len(order_ids):
+            raise InvalidTransition(status, list(
+                DeliveryOrder.objects.filter(
+                    user=user, pk__in=set(order_ids) - set(moved)
+                ).order_by('pk').values_list('pk', 'status')
+            ))
+        if status == Status.CANCELLED:
+            release_orders(user.id, moved)
+        elif status == Status.SHIPPED:
+            ship_reservations(user, moved)
+        bump_versions('deliveryorder', [user.id])
+
+    return len(moved)
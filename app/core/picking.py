@@ -0,0 +1,246 @@
+import re
+from collections import Counter, defaultdict, namedtuple
+
+from django.db.models import F
+
+from core.models import (
+    DeliveryOrder, DeliveryOrderLine, Stock, StockReservation
+)
+
+# Location codes read aisle, bay and an optional level, e.g. ``A-01``,
+# ``B03-2`` or ``12-07``. Aisles may be letters (A..Z, AA..) or numbers.
+LOCATION_RE = re.compile(
+    r'^\s*([A-Za-z]+|\d+)[-./ ]?(\d+)(?:[-./ ](\d+))?\s*$'
+)
+
+# Walking between neighbouring aisles costs this many bays
+AISLE_PITCH = 2
+
+# 2-opt only tries to reverse runs of up to this many stops, a few times
+# over the route, which keeps it linear in the number of stops
+TWO_OPT_WINDOW = 25
+TWO_OPT_PASSES = 2
+
+Location = namedtuple('Location', ('aisle', 'bay', 'level'))
+
+
+def parse_location(code):
+    """Parse a location code into a Location, None when it is not one"""
+    match = LOCATION_RE.match(code or '')
+    if match is None:
+        return None
+    aisle, bay, level = match.groups()
+    if aisle.isdigit():
+        number = int(aisle)
+    else:
+        number = 0
+        for letter in aisle.upper():
+            number = number * 26 + ord(letter) - ord('A') + 1
+
+    return Location(number, int(bay), int(level or 0))
+
+
+def serpentine(locations):
+    """Order locations up the first aisle visited, down the next and so on
+
+    Aisles holding nothing to pick are skipped, so the direction only
+    alternates between aisles actually walked.
+    """
+    aisles = {aisle: rank for rank, aisle in enumerate(
+        sorted({location.aisle for location in locations})
+    )}
+
+    def key(location):
+        up = aisles[location.aisle] % 2 == 0
+        return (location.aisle, location.bay if up else -location.bay,
+                location.level)
+
+    return sorted(locations, key=key)
+
+
+def walking_distance(depth):
+    """Return the distance between two locations of a warehouse
+
+    Aisles are depth bays long with cross aisles at both ends, so leaving
+    an aisle goes out whichever end is shorter.
+    """
+    def distance(a, b):
+        if a.aisle == b.aisle:
+            return abs(a.bay - b.bay)
+
+        return (abs(a.aisle - b.aisle) * AISLE_PITCH +
+                min(a.bay + b.bay, 2 * (depth + 1) - a.bay - b.bay))
+
+    return distance
+
+
+def route_length(route, distance):
+    """Return the length of walking route in order"""
+    return sum(distance(a, b) for a, b in zip(route, route[1:]))
+
+
+def two_opt(route, distance, window=TWO_OPT_WINDOW, passes=TWO_OPT_PASSES):
+    """Shorten an open route by reversing runs of stops
+
+    The first stop is where the walk starts and is never moved.
+    """
+    route = list(route)
+    size = len(route)
+    for _ in range(passes):
+        improved = False
+        for i in range(1, size - 1):
+            for j in range(i + 1, min(size, i + window)):
+                before, first, last = route[i - 1], route[i], route[j]
+                gain = distance(before, first) - distance(before, last)
+                if j + 1 < size:
+                    after = route[j + 1]
+                    gain += distance(last, after) - distance(first, after)
+                if gain > 0:
+                    route[i:j + 1] = reversed(route[i:j + 1])
+                    improved = True
+        if not improved:
+            break
+
+    return route
+
+
+def plan_route(codes):
+    """Return location codes in walking order
+
+    Parseable codes are walked in serpentine aisle order from the front
+    of the first aisle, then improved with 2-opt. Codes that cannot be
+    parsed follow in alphabetical order.
+    """
+    parsed = {code: parse_location(code) for code in set(codes)}
+    unknown = sorted(code for code, location in parsed.items()
+                     if location is None)
+    stops = serpentine({location for location in parsed.values()
+                        if location is not None})
+    if not stops:
+        return unknown
+
+    depth = max(location.bay for location in stops)
+    start = Location(stops[0].aisle, 0, 0)
+    route = two_opt([start] + stops, walking_distance(depth))[1:]
+    codes_at = defaultdict(list)
+    for code, location in parsed.items():
+        if location is not None:
+            codes_at[location].append(code)
+
+    return [code for location in route
+            for code in sorted(codes_at[location])] + unknown
+
+
+def _demand(user, order_ids):
+    """Return ``[(order_id, product_id, stock_id, quantity)]`` to pick
+
+    Orders with reservations pick exactly what is reserved. The others
+    pick the quantity of each of their lines from the stocks with the
+    most available, orders earlier in order_ids first. Returns the
+    demand and the ``(order_id, product_id)`` pairs the stock cannot
+    fully cover.
+    """
+    demand = list(StockReservation.objects.filter(
+        delivery_order_id__in=order_ids
+    ).order_by('pk').values_list(
+        'delivery_order_id', 'product_id', 'stock_id', 'quantity'
+    ))
+    reserved = {order_id for order_id, _, _, _ in demand}
+    wanted = defaultdict(list)
+    for order_id, product_id, quantity in DeliveryOrderLine.objects.filter(
+        deliveryorder_id__in=[pk for pk in order_ids if pk not in reserved]
+    ).values_list('deliveryorder_id', 'product_id', 'quantity'):
+        wanted[order_id].append((product_id, quantity))
+
+    candidates = defaultdict(list)
+    available = {}
+    for stock_id, product_id, units in Stock.objects.filter(
+        user=user,
+        product_id__in={pk for lines in wanted.values()
+                        for pk, _ in lines},
+        Quantity__gt=F('reserved')
+    ).annotate(
+        available=F('Quantity') - F('reserved')
+    ).order_by('-available', 'pk').values_list(
+        'pk', 'product_id', 'available'
+    ):
+        available[stock_id] = units
+        candidates[product_id].append(stock_id)
+
+    short = []
+    for order_id in order_ids:
+        for product_id, quantity in sorted(wanted[order_id]):
+            for stock_id in candidates[product_id]:
+                taken = min(quantity, available[stock_id])
+                if taken:
+                    available[stock_id] -= taken
+                    quantity -= taken
+                    demand.append((order_id, product_id, stock_id, taken))
+                if not quantity:
+                    break
+            if quantity:
+                short.append((order_id, product_id))
+
+    return demand, short
+
+
+def pick_list(user, order_ids):
+    """Merge the demand of many delivery orders into one walk
+
+    Every order gets a slot numbered in order_ids order. Picks of the
+    same stock and product are merged and listed in walking order of
+    their locations, each saying how many units go to which slot.
+    """
+    orders = dict(DeliveryOrder.objects.filter(
+        user=user,
+        pk__in=order_ids
+    ).values_list('pk', 'deliveryNumber'))
+    order_ids = [pk for pk in dict.fromkeys(order_ids) if pk in orders]
+    slots = {order_id: slot for slot, order_id in enumerate(order_ids, 1)}
+    demand, short = _demand(user, order_ids)
+
+    merged = defaultdict(Counter)
+    for order_id, product_id, stock_id, quantity in demand:
+        merged[stock_id, product_id][order_id] += quantity
+    stocks = {
+        pk: (stock_no, location)
+        for pk, stock_no, location in Stock.objects.filter(
+            pk__in={stock_id for stock_id, _ in merged}
+        ).values_list('pk', 'StockNo', 'Location')
+    }
+    route = {code: position for position, code in enumerate(
+        plan_route(location for _, location in stocks.values())
+    )}
+    picks = sorted(merged, key=lambda key: (route[stocks[key[0]][1]],
+                                            stocks[key[0]][0],
+                                            key[1] or 0))
+
+    def sort_back(counts):
+        return [
+            {'slot': slots[order_id], 'delivery_order': order_id,
+             'deliveryNumber': orders[order_id], 'quantity': quantity}
+            for order_id, quantity in sorted(counts.items(),
+                                             key=lambda item: slots[item[0]])
+        ]
+
+    return {
+        'orders': [
+            {'slot': slots[order_id], 'delivery_order': order_id,
+             'deliveryNumber': orders[order_id]}
+            for order_id in order_ids
+        ],
+        'picks': [
+            {'sequence': sequence,
+             'stock': stock_id,
+             'StockNo': stocks[stock_id][0],
+             'Location': stocks[stock_id][1],
+             'product': product_id,
+             'quantity': sum(merged[stock_id, product_id].values()),
+             'sort': sort_back(merged[stock_id, product_id])}
+            for sequence, (stock_id, product_id) in enumerate(picks, 1)
+        ],
+        'short': [
+            {'delivery_order': order_id, 'product': product_id}
+            for order_id, product_id in short
+        ],
+    }
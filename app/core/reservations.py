@@ -0,0 +1,196 @@
+import random
+import time
+from collections import Counter
+
+from django.db import OperationalError, transaction
+from django.db.models import Case, F, IntegerField, Q, Value, When
+from django.utils import timezone
+
+from core.inventory import InsufficientStock
+from core.models import DeliveryOrder, Stock, StockReservation
+from core.versions import bump_versions
+
+# Attempts of a reservation, the last one locking the stock rows, and the
+# bounds of the randomized backoff between them, in seconds
+MAX_ATTEMPTS = 10
+BACKOFF_BASE = 0.002
+BACKOFF_CAP = 0.05
+
+DEADLOCK_DETECTED = '40P01'
+
+
+class ReservationConflict(Exception):
+    """Concurrent writers kept changing the stock being reserved"""
+
+
+class _StaleStock(Exception):
+    """A stock changed between reading and reserving it"""
+
+
+def _backoff(attempt):
+    """Sleep a random time growing with the attempt number"""
+    time.sleep(random.uniform(0, min(BACKOFF_CAP,
+                                     BACKOFF_BASE * 2 ** attempt)))
+
+
+def _allocate(user, items):
+    """Spread ``{product_id: quantity}`` over the stocks holding them
+
+    Returns ``([(stock_id, version, product_id, quantity)], short)``
+    where short maps the products that cannot be covered to what is
+    available of them. Stocks with the most available are used first,
+    so fewer rows are touched and concurrent orders spread out.
+    """
+    rows = Stock.objects.filter(
+        user=user,
+        product_id__in=list(items),
+        Quantity__gt=F('reserved')
+    ).annotate(
+        available=F('Quantity') - F('reserved')
+    ).order_by('-available', 'pk').values_list(
+        'pk', 'version', 'available', 'product_id'
+    )
+    available = {}
+    candidates = {product_id: [] for product_id in items}
+    for stock_id, version, units, product_id in rows:
+        available[stock_id] = units
+        candidates[product_id].append((stock_id, version))
+
+    allocations = []
+    short = {}
+    for product_id, quantity in items.items():
+        wanted = quantity
+        for stock_id, version in candidates[product_id]:
+            taken = min(wanted, available[stock_id])
+            if taken:
+                available[stock_id] -= taken
+                wanted -= taken
+                allocations.append((stock_id, version, product_id, taken))
+            if not wanted:
+                break
+        if wanted:
+            short[product_id] = quantity - wanted
+
+    return allocations, short
+
+
+def _apply(order, allocations):
+    """Reserve the allocations if none of their stocks changed since"""
+    reserved = Counter()
+    versions = {}
+    for stock_id, version, _, quantity in allocations:
+        reserved[stock_id] += quantity
+        versions[stock_id] = version
+    matched = Q()
+    for stock_id, version in versions.items():
+        matched |= Q(pk=stock_id, version=version)
+    updated = Stock.objects.filter(matched).update(
+        reserved=F('reserved') + Case(
+            *[When(pk=stock_id, then=Value(quantity))
+              for stock_id, quantity in reserved.items()],
+            output_field=IntegerField()
+        ),
+        version=F('version') + 1
+    )
+    if updated != len(versions):
+        raise _StaleStock()
+
+    return StockReservation.objects.bulk_create([
+        StockReservation(user_id=order.user_id,
+                         delivery_order=order,
+                         stock_id=stock_id,
+                         product_id=product_id,
+                         quantity=quantity)
+        for stock_id, _, product_id, quantity in allocations
+    ])
+
+
+def reserve(order, items):
+    """Reserve ``{product_id: quantity}`` of the user's stock for order
+
+    Stock is read without locks and reserved by one UPDATE conditional on
+    the versions read, so nothing is held locked between the two. When
+    another writer got there first the attempt is rolled back and retried
+    after a randomized backoff. The last attempt locks the stock rows in
+    primary key order first, so a busy order still gets through. A draft
+    order becomes allocated.
+    Raises InsufficientStock, keyed by
+    product id, when the stock cannot cover the order, and
+    ReservationConflict when even the locking attempt fails.
+    Returns the reservations made.
+    """
+    for attempt in range(MAX_ATTEMPTS):
+        try:
+            with transaction.atomic():
+                if attempt == MAX_ATTEMPTS - 1:
+                    list(Stock.objects.select_for_update().filter(
+                        user=order.user, product_id__in=list(items)
+                    ).order_by('pk').values_list('pk'))
+                allocations, short = _allocate(order.user, items)
+                if short:
+                    raise InsufficientStock(short)
+                reservations = _apply(order, allocations)
+                DeliveryOrder.objects.filter(
+                    pk=order.pk, status=DeliveryOrder.Status.DRAFT
+                ).update(status=DeliveryOrder.Status.ALLOCATED,
+                         updated_at=timezone.now())
+                bump_versions('stock', [order.user_id])
+                bump_versions('deliveryorder', [order.user_id])
+
+            return reservations
+        except _StaleStock:
+            pass
+        except OperationalError as exc:
+            if getattr(exc.__cause__, 'pgcode', None) != DEADLOCK_DETECTED:
+                raise
+        _backoff(attempt)
+
+    raise ReservationConflict(
+        f'Stock kept changing over {MAX_ATTEMPTS} attempts.'
+    )
+
+
+def release(order):
+    """Give the stock reserved for order back, returning the quantity
+
+    An allocated order holds no stock any more and is a draft again.
+    """
+    with transaction.atomic():
+        DeliveryOrder.objects.filter(
+            pk=order.pk, status=DeliveryOrder.Status.ALLOCATED
+        ).update(status=DeliveryOrder.Status.DRAFT,
+                 updated_at=timezone.now())
+
+        return release_orders(order.user_id, [order.pk])
+
+
+def release_orders(user_id, order_ids):
+    """Give the stock reserved for many orders back in one pass
+
+    Returns the quantity released.
+    """
+    with transaction.atomic():
+        held = StockReservation.objects.filter(
+            delivery_order_id__in=list(order_ids)
+        )
+        released = Counter()
+        for stock_id, quantity in held.select_for_update().order_by(
+            'pk'
+        ).values_list('stock_id', 'quantity'):
+            released[stock_id] += quantity
+        if not released:
+            return 0
+
+        held.delete()
+        Stock.objects.filter(pk__in=list(released)).update(
+            reserved=F('reserved') - Case(
+                *[When(pk=stock_id, then=Value(quantity))
+                  for stock_id, quantity in released.items()],
+                output_field=IntegerField()
+            ),
+            version=F('version') + 1
+        )
+        bump_versions('stock', [user_id])
+        bump_versions('deliveryorder', [user_id])
+
+    return sum(released.values())
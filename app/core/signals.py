@@ -0,0 +1,144 @@
+from django.db.models.signals import (
+    m2m_changed, post_delete, post_save, pre_delete
+)
+from django.dispatch import receiver
+
+from core.inventory import sync_stock_product
+from core.orders import refresh_product_totals, refresh_totals
+from core.models import Tag, Category, Product, DeliveryOrder, Stock, Wave
+from core.versions import bump_versions
+
+RESOURCES = {
+    Product: 'product',
+    Stock: 'stock',
+    DeliveryOrder: 'deliveryorder',
+    Tag: 'tag',
+    Category: 'category',
+    Wave: 'wave',
+}
+
+# Deleting a product also drops it from the orders and stock holding it
+CASCADES = {
+    Product: ('deliveryorder', 'stock', 'stockalert'),
+}
+
+# ... and from the shared tags and categories it was assigned to
+UNLINKED_ON_DELETE = {
+    Product: ('tag', 'category'),
+}
+
+# Shared resources whose assignment to products the link tables hold
+LINKED = {
+    Product.tags.through: 'tag',
+    Product.categories.through: 'category',
+}
+
+
+@receiver(post_save)
+@receiver(post_delete)
+def bump_on_write(sender, instance, signal, **kwargs):
+    """Bump the version of a resource when one of its objects changes"""
+    resource = RESOURCES.get(sender)
+    if resource is None:
+        return
+    bump_versions(resource, [instance.user_id])
+    for cascade in CASCADES.get(sender, ()):
+        bump_versions(cascade, [instance.user_id])
+    if signal is post_delete:
+        for linked in UNLINKED_ON_DELETE.get(sender, ()):
+            bump_versions(linked)
+
+
+@receiver(m2m_changed, sender=Product.tags.through)
+@receiver(m2m_changed, sender=Product.categories.through)
+@receiver(m2m_changed, sender=DeliveryOrder.products.through)
+@receiver(m2m_changed, sender=Stock.products.through)
+def bump_on_relation_change(sender, instance, action, reverse, model,
+                            pk_set, **kwargs):
+    """Bump the owning resource when its many-to-many links change"""
+    if sender in LINKED and action in ('post_add', 'post_remove',
+                                       'post_clear'):
+        bump_versions(LINKED[sender])
+    if not reverse:
+        if action in ('post_add', 'post_remove', 'post_clear'):
+            bump_versions(RESOURCES[type(instance)], [instance.user_id])
+        return
+
+    # Changed from the other side, e.g. tag.product_set.add(product):
+    # the owners are the objects in pk_set, or every linked owner when
+    # the relation is cleared.
+    if action in ('post_add', 'post_remove'):
+        owners = model.objects.filter(pk__in=pk_set)
+    elif action == 'pre_clear':
+        owners = model.objects.filter(pk__in=sender.objects.filter(
+            **{type(instance)._meta.model_name: instance}
+        ).values(model._meta.model_name))
+    else:
+        return
+    bump_versions(
+        RESOURCES[model],
+        set(owners.values_list('user_id', flat=True))
+    )
+
+
+@receiver(m2m_changed, sender=Stock.products.through)
+def sync_product_on_link_change(sender, instance, action, reverse, pk_set,
+                                **kwargs):
+    """Keep Stock.product in step with the stock's product links"""
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    if not reverse:
+        changed = sync_stock_product([instance.pk])
+        if instance.pk in changed:
+            instance.product_id = changed[instance.pk]
+    elif action == 'post_clear':
+        # Only the stock pointing at the product can have lost it
+        sync_stock_product(
+            instance.stocks.values_list('pk', flat=True)
+        )
+    else:
+        sync_stock_product(pk_set)
+
+
+@receiver(m2m_changed, sender=DeliveryOrder.products.through)
+def refresh_totals_on_line_change(sender, instance, action, reverse, model,
+                                  pk_set, **kwargs):
+    """Recompute order totals when products are added or removed"""
+    if not reverse:
+        if action in ('post_add', 'post_remove', 'post_clear'):
+            changed = refresh_totals([instance.pk])
+            if instance.pk in changed:
+                instance.total_price, instance.total_weight = (
+                    changed[instance.pk]
+                )
+    elif action == 'pre_clear':
+        instance._cleared_orders = list(
+            instance.order_lines.values_list('deliveryorder_id', flat=True)
+        )
+    elif action == 'post_clear':
+        refresh_totals(instance.__dict__.pop('_cleared_orders', ()))
+    elif action in ('post_add', 'post_remove'):
+        refresh_totals(pk_set)
+
+
+@receiver(post_save, sender=Product)
+def refresh_totals_on_product_save(sender, instance, created, **kwargs):
+    """Carry a product's price and weight into the orders holding it"""
+    if not created:
+        refresh_product_totals([instance.pk])
+
+
+@receiver(pre_delete, sender=Product)
+def remember_orders_on_product_delete(sender, instance, **kwargs):
+    """Note the orders a deleted product is removed from"""
+    instance._deleted_from_orders = list(
+        instance.order_lines.values_list('deliveryorder_id', flat=True)
+    )
+
+
+@receiver(post_delete, sender=Product)
+def refresh_totals_on_product_delete(sender, instance, **kwargs):
+    """Recompute the totals of the orders a deleted product was on"""
+    order_ids = instance.__dict__.pop('_deleted_from_orders', ())
+    if order_ids:
+        refresh_totals(order_ids)
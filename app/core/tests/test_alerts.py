@@ -0,0 +1,128 @@
+import threading
+
+from django.contrib.auth import get_user_model
+from django.db import connection, transaction
+from django.test import TestCase, TransactionTestCase
+
+from core import inventory
+from core.alerts import evaluate_products, evaluate_stocks
+from core.models import Product, Stock, StockAlert
+
+
+class StockAlertTests(TestCase):
+    """Test low-stock alerts kept current by stock writes"""
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(
+            'alerts@domain.com',
+            'testpass'
+        )
+        self.product = Product.objects.create(user=self.user, title='Pen',
+                                              weight=1, price=1,
+                                              reorder_point=10)
+        self.stocks = [
+            Stock.objects.create(user=self.user, StockNo=f'STK-{i}',
+                                 Quantity=8)
+            for i in range(2)
+        ]
+        for stock in self.stocks:
+            stock.products.add(self.product)
+
+    def test_opens_below_reorder_point(self):
+        """Test an alert opens once the total drops below the point"""
+        inventory.adjust_quantities(self.user, {'STK-0': -3})
+        self.assertFalse(StockAlert.objects.exists())
+        inventory.adjust_quantities(self.user, {'STK-1': -4})
+
+        alert = StockAlert.objects.get()
+        self.assertEqual((alert.on_hand, alert.reorder_point), (9, 10))
+        self.assertIsNone(alert.resolved_at)
+
+    def test_resolves_when_restocked(self):
+        """Test a receipt back over the point resolves the alert"""
+        inventory.adjust_quantities(self.user, {'STK-0': -8, 'STK-1': -5})
+
+        inventory.adjust_quantities(self.user, {'STK-1': 7})
+
+        alert = StockAlert.objects.get()
+        self.assertIsNotNone(alert.resolved_at)
+
+    def test_unrelated_write_reads_nothing(self):
+        """Test stock holding no product with a point costs one query"""
+        other = Stock.objects.create(user=self.user, StockNo='STK-X',
+                                     Quantity=1)
+
+        with self.assertNumQueries(1):
+            evaluate_stocks(self.user.id, [other.pk])
+
+    def test_evaluate_all(self):
+        """Test a full evaluation backfills alerts"""
+        Stock.objects.update(Quantity=1)
+
+        self.assertEqual(evaluate_products(self.user.id), (1, 0))
+        self.assertEqual(evaluate_products(self.user.id), (0, 0))
+
+    def test_clearing_point_resolves(self):
+        """Test an open alert resolves once its reorder point is cleared"""
+        inventory.adjust_quantities(self.user, {'STK-0': -8})
+        Product.objects.filter(pk=self.product.pk).update(reorder_point=None)
+
+        self.assertEqual(evaluate_products(self.user.id, [self.product.pk]),
+                         (0, 1))
+        self.assertIsNotNone(StockAlert.objects.get().resolved_at)
+        self.assertEqual(evaluate_products(self.user.id), (0, 0))
+
+    def test_evaluate_no_products(self):
+        """Test evaluating an empty list of products does nothing"""
+        with self.assertNumQueries(0):
+            self.assertEqual(evaluate_products(self.user.id, []), (0, 0))
+
+
+class StockAlertConcurrencyTests(TransactionTestCase):
+    """Test alerts of products written by concurrent transactions"""
+
+    def test_concurrent_drops_open_alert(self):
+        """Test two writers taking the total below the point raise it
+
+        Each writer alone leaves the total above the point, so the
+        second must sum after the first committed.
+        """
+        user = get_user_model().objects.create_user(
+            'race@domain.com',
+            'testpass'
+        )
+        product = Product.objects.create(user=user, title='Pen', weight=1,
+                                         price=1, reorder_point=10)
+        for stock_no in ('STK-0', 'STK-1'):
+            Stock.objects.create(user=user, StockNo=stock_no, Quantity=8,
+                                 product=product)
+        first_evaluated = threading.Event()
+        second_done = threading.Event()
+
+        def first():
+            try:
+                with transaction.atomic():
+                    inventory.adjust_quantities(user, {'STK-0': -3})
+                    first_evaluated.set()
+                    # Commit once the second writer is done or held up
+                    second_done.wait(1)
+            finally:
+                connection.close()
+
+        def second():
+            try:
+                first_evaluated.wait(5)
+                inventory.adjust_quantities(user, {'STK-1': -4})
+                second_done.set()
+            finally:
+                connection.close()
+
+        writers = [threading.Thread(target=first),
+                   threading.Thread(target=second)]
+        for writer in writers:
+            writer.start()
+        for writer in writers:
+            writer.join()
+
+        alert = StockAlert.objects.get()
+        self.assertEqual(alert.on_hand, 9)
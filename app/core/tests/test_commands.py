@@ -1,8 +1,20 @@
+import os
+import tempfile
+from datetime import timedelta
+from io import StringIO
 from unittest.mock import patch
 
+from django.contrib.auth import get_user_model
 from django.core.management import call_command
+from django.core.management.base import CommandError
 from django.db.utils import OperationalError
 from django.test import TestCase
+from django.utils import timezone
+
+from core.models import (
+    DeliveryOrder, IdempotencyKey, ImportCheckpoint, InventoryCheckpoint,
+    Product, Stock, StockAlert, StockMovement, Tag, Wave
+)
 
 
 class CommandTests(TestCase):
@@ -20,3 +32,333 @@ class CommandTests(TestCase):
             gi.side_effect = [OperationalError] * 5 + [True]
             call_command('wait_for_db')
             self.assertEqual(gi.call_count, 6)
+
+
+class ImportWmsCommandTests(TestCase):
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(
+            'importer@domain.com',
+            'testpass'
+        )
+
+    def write_file(self, content, suffix='.csv'):
+        """Write content to a temporary file removed after the test"""
+        handle, path = tempfile.mkstemp(suffix=suffix)
+        with os.fdopen(handle, 'w') as target:
+            target.write(content)
+        self.addCleanup(os.remove, path)
+
+        return path
+
+    def test_import_products_csv(self):
+        """Test importing products resolves tag and category names"""
+        path = self.write_file(
+            'title,weight,price,link,tags,categories\n'
+            'Book,1.5,10,,new;old,Stationery\n'
+            'Pen,0.1,2,,new,\n'
+            'Book,2,11,,,\n'
+        )
+        call_command('import_wms', 'product', path, user=self.user.email,
+                     stdout=StringIO())
+
+        book = Product.objects.get(title='Book')
+        self.assertEqual(book.price, 11)
+        self.assertEqual(
+            sorted(book.tags.values_list('name', flat=True)),
+            ['new', 'old']
+        )
+        self.assertEqual(book.categories.get().name, 'Stationery')
+        self.assertEqual(Tag.objects.count(), 2)
+        self.assertFalse(ImportCheckpoint.objects.exists())
+
+    def test_import_stock_ndjson_links_products(self):
+        """Test importing stock rows from NDJSON by product title"""
+        Product.objects.create(user=self.user, title='Book', weight=1,
+                               price=1)
+        path = self.write_file(
+            '{"StockNo": "STK-1", "Quantity": 5, "products": ["Book"]}\n',
+            suffix='.ndjson'
+        )
+        call_command('import_wms', 'stock', path, user=self.user.email,
+                     stdout=StringIO())
+
+        stock = Stock.objects.get(StockNo='STK-1')
+        self.assertEqual(stock.Quantity, 5)
+        self.assertEqual(stock.products.get().title, 'Book')
+        self.assertEqual(stock.product.title, 'Book')
+
+    def test_import_links_shared_tags_and_own_products(self):
+        """Test tags are shared but products of another user are not"""
+        other = get_user_model().objects.create_user(
+            'other@domain.com',
+            'testpass'
+        )
+        Product.objects.create(user=other, title='Ink', weight=1, price=1)
+        Tag.objects.create(user=other, name='shared')
+        path = self.write_file(
+            'title,weight,price,link,tags,categories\n'
+            'Pen,0.1,2,,shared,\n'
+        )
+        call_command('import_wms', 'product', path, user=self.user.email,
+                     stdout=StringIO())
+        path = self.write_file(
+            '{"StockNo": "STK-1", "Quantity": 5, "products": ["Ink"]}\n',
+            suffix='.ndjson'
+        )
+        out = StringIO()
+        call_command('import_wms', 'stock', path, user=self.user.email,
+                     stdout=out)
+
+        self.assertEqual(
+            list(Product.objects.get(title='Pen').tags.values_list(
+                'name', flat=True
+            )),
+            ['shared']
+        )
+        stock = Stock.objects.get(StockNo='STK-1')
+        self.assertFalse(stock.products.exists())
+        self.assertIn('Row 1: skipped unknown products Ink', out.getvalue())
+        self.assertIn('Imported 1 stock rows, skipped 0', out.getvalue())
+
+    def test_import_reports_rows_of_another_user(self):
+        """Test rows keyed like another user's are reported, not counted"""
+        other = get_user_model().objects.create_user(
+            'other@domain.com',
+            'testpass'
+        )
+        Product.objects.create(user=other, title='Ink', weight=1, price=1)
+        path = self.write_file(
+            'title,weight,price,link,tags,categories\n'
+            'Ink,5,5,,,\n'
+            'Pen,0.1,2,,,\n'
+        )
+        out = StringIO()
+
+        call_command('import_wms', 'product', path, user=self.user.email,
+                     stdout=out)
+
+        self.assertEqual(Product.objects.get(title='Ink').price, 1)
+        self.assertIn('Row 1: skipped title Ink belongs to another user',
+                      out.getvalue())
+        self.assertIn('Imported 1 product rows, skipped 1', out.getvalue())
+
+    def test_import_numbers_missing_keys(self):
+        """Test rows without a number are given one"""
+        path = self.write_file(
+            'deliveryNumber,sentFrom,sentTo,price\n'
+            'TRN-1,Batam,Medan,5\n'
+            ',Batam,Medan,5\n'
+            ',Batam,Jambi,5\n'
+        )
+        call_command('import_wms', 'deliveryorder', path,
+                     user=self.user.email, stdout=StringIO())
+
+        numbers = sorted(
+            DeliveryOrder.objects.values_list('deliveryNumber', flat=True)
+        )
+        self.assertEqual(len(numbers), 3)
+        self.assertEqual(numbers[2], 'TRN-1')
+        self.assertRegex(numbers[0], r'^DO-\d{8}$')
+        self.assertNotEqual(numbers[0], numbers[1])
+
+    def test_import_deliveryorders_totals(self):
+        """Test imported orders get totals kept current by product imports"""
+        Product.objects.create(user=self.user, title='Book', weight=2,
+                               price=10)
+        Product.objects.create(user=self.user, title='Pen', weight=1,
+                               price=3)
+        orders = self.write_file(
+            'deliveryNumber,sentFrom,sentTo,price,products\n'
+            'TRN-1,Batam,Medan,5,Book;Pen\n'
+        )
+        call_command('import_wms', 'deliveryorder', orders,
+                     user=self.user.email, stdout=StringIO())
+        order = DeliveryOrder.objects.get(deliveryNumber='TRN-1')
+        self.assertEqual((order.total_price, order.total_weight), (13, 3))
+
+        products = self.write_file('title,weight,price\nBook,4,20\n')
+        call_command('import_wms', 'product', products, user=self.user.email,
+                     stdout=StringIO())
+        order.refresh_from_db()
+        self.assertEqual((order.total_price, order.total_weight), (23, 5))
+
+    def test_import_stock_books_movements(self):
+        """Test imported quantities are opened and adjusted in the ledger"""
+        first = self.write_file('StockNo,Quantity,Location\n'
+                                'STK-1,5,A\n'
+                                'STK-2,0,A\n')
+        second = self.write_file('StockNo,Quantity,Location\n'
+                                 'STK-1,3,B\n'
+                                 'STK-2,0,B\n')
+        for path in (first, second):
+            call_command('import_wms', 'stock', path, user=self.user.email,
+                         stdout=StringIO())
+
+        self.assertEqual(
+            list(StockMovement.objects.order_by('id').values_list(
+                'stock__StockNo', 'kind', 'quantity', 'balance'
+            )),
+            [('STK-1', 'opening', 5, 5), ('STK-1', 'adjustment', -2, 3)]
+        )
+
+    def test_import_resumes_after_failure(self):
+        """Test a failed batch can be resumed from the checkpoint"""
+        path = self.write_file(
+            'StockNo,Quantity,Location\n'
+            'STK-1,1,A\n'
+            'STK-2,oops,A\n'
+        )
+        with self.assertRaises(CommandError):
+            call_command('import_wms', 'stock', path, user=self.user.email,
+                         batch_size=1, stdout=StringIO())
+        self.assertEqual(Stock.objects.count(), 1)
+        self.assertEqual(ImportCheckpoint.objects.get().rows_done, 1)
+
+        with open(path, 'w') as target:
+            target.write('StockNo,Quantity,Location\n'
+                         'STK-1,99,A\n'
+                         'STK-2,2,A\n')
+        call_command('import_wms', 'stock', path, user=self.user.email,
+                     batch_size=1, resume=True, stdout=StringIO())
+
+        self.assertEqual(Stock.objects.get(StockNo='STK-1').Quantity, 1)
+        self.assertEqual(Stock.objects.get(StockNo='STK-2').Quantity, 2)
+
+
+class InventoryCommandTests(TestCase):
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(
+            'inventory@domain.com',
+            'testpass'
+        )
+        self.stock = Stock.objects.create(user=self.user, StockNo='STK-1',
+                                          Quantity=0)
+        for day, quantity in ((1, 8), (3, -3)):
+            StockMovement.objects.create(
+                user=self.user,
+                stock=self.stock,
+                stock_no=self.stock.StockNo,
+                kind=StockMovement.Kind.ADJUSTMENT,
+                quantity=quantity,
+                balance=0,
+                created_at=f'2021-05-0{day}T12:00:00Z'
+            )
+
+    def test_inventory_checkpoint(self):
+        """Test checkpointing every user owning stock"""
+        out = StringIO()
+
+        call_command('inventory_checkpoint', at='2021-05-02', stdout=out)
+
+        checkpoint = InventoryCheckpoint.objects.get()
+        self.assertEqual(checkpoint.user, self.user)
+        self.assertEqual(checkpoint.lines.get().quantity, 8)
+        self.assertIn('1 stocks', out.getvalue())
+
+    def test_inventory_checkpoint_rejects_recent_moment(self):
+        """Test a checkpoint cannot be taken today or later"""
+        today = timezone.localdate().isoformat()
+        with self.assertRaises(CommandError):
+            call_command('inventory_checkpoint', at=today, stdout=StringIO())
+
+        self.assertFalse(InventoryCheckpoint.objects.exists())
+
+    def test_inventory_as_of(self):
+        """Test printing the stock at a moment as CSV"""
+        call_command('inventory_checkpoint', at='2021-05-02',
+                     user=self.user.email, stdout=StringIO())
+        out = StringIO()
+
+        call_command('inventory_as_of', '2021-05-04', user=self.user.email,
+                     stdout=out)
+
+        self.assertEqual(out.getvalue(), 'StockNo,Quantity\nSTK-1,5\n')
+
+    def test_inventory_as_of_rejects_bad_moment(self):
+        """Test an unparsable moment is a command error"""
+        with self.assertRaises(CommandError):
+            call_command('inventory_as_of', 'soon', user=self.user.email,
+                         stdout=StringIO())
+
+
+class PlanWavesCommandTests(TestCase):
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(
+            'waves@domain.com',
+            'testpass'
+        )
+        product = Product.objects.create(user=self.user, title='Crate',
+                                         weight=600, price=1)
+        for number in ('TRN-1', 'TRN-2'):
+            DeliveryOrder.objects.create(
+                user=self.user, deliveryNumber=number, sentFrom='Batam',
+                sentTo='Medan', price=1
+            ).products.add(product)
+
+    def test_plan_waves(self):
+        """Test pending orders of every user are planned"""
+        out = StringIO()
+
+        call_command('plan_waves', stdout=out)
+
+        self.assertEqual(Wave.objects.count(), 2)
+        self.assertIn('2 waves of 2 orders', out.getvalue())
+
+    def test_plan_waves_limits(self):
+        """Test the capacity limits can be given on the command line"""
+        call_command('plan_waves', user=self.user.email, max_weight=2000,
+                     stdout=StringIO())
+
+        self.assertEqual(Wave.objects.get().orders.count(), 2)
+
+    def test_plan_waves_unknown_user(self):
+        """Test planning for an unknown user fails"""
+        with self.assertRaises(CommandError):
+            call_command('plan_waves', user='nobody@domain.com')
+
+
+class EvaluateStockAlertsCommandTests(TestCase):
+
+    def test_evaluate_stock_alerts(self):
+        """Test alerts are backfilled for every user with a point"""
+        user = get_user_model().objects.create_user(
+            'alerts@domain.com',
+            'testpass'
+        )
+        Product.objects.create(user=user, title='Pen', weight=1, price=1,
+                               reorder_point=5)
+        out = StringIO()
+
+        call_command('evaluate_stock_alerts', stdout=out)
+
+        self.assertEqual(StockAlert.objects.get().on_hand, 0)
+        self.assertIn('1 alerts opened', out.getvalue())
+
+
+class PurgeIdempotencyKeysCommandTests(TestCase):
+
+    def test_purge_idempotency_keys(self):
+        """Test only the expired keys are deleted, in batches"""
+        user = get_user_model().objects.create_user(
+            'retry@domain.com',
+            'testpass'
+        )
+        now = timezone.now()
+        IdempotencyKey.objects.bulk_create([
+            IdempotencyKey(user=user, key=f'key-{i}', fingerprint='f',
+                           status_code=201, response={},
+                           expires_at=now + timedelta(days=i - 3))
+            for i in range(5)
+        ])
+        out = StringIO()
+
+        call_command('purge_idempotency_keys', batch_size=2, stdout=out)
+
+        self.assertEqual(
+            sorted(IdempotencyKey.objects.values_list('key', flat=True)),
+            ['key-4']
+        )
+        self.assertIn('4 expired idempotency keys deleted', out.getvalue())
@@ -0,0 +1,314 @@
+import os
+import time
+import unittest
+from datetime import timedelta
+from importlib import import_module
+from unittest import mock
+
+from django.apps import apps
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.test import TestCase
+from django.utils import timezone
+
+from core import inventory
+from core.models import (
+    InventoryCheckpoint, InventoryCheckpointLine, Product, Stock,
+    StockMovement
+)
+
+START = timezone.now() - timedelta(days=30)
+
+
+def record_history(user, stocks, days, per_day=1, start=START):
+    """Bulk insert daily receipts of one unit for every stock"""
+    movements = []
+    for day in range(days):
+        for repeat in range(per_day):
+            for stock in stocks:
+                movements.append(StockMovement(
+                    user=user,
+                    stock=stock,
+                    stock_no=stock.StockNo,
+                    kind=StockMovement.Kind.RECEIPT,
+                    quantity=1,
+                    balance=0,
+                    created_at=start + timedelta(days=day,
+                                                 seconds=repeat)
+                ))
+    StockMovement.objects.bulk_create(movements, batch_size=5000)
+
+
+class InventoryAsOfTests(TestCase):
+    """Test point in time quantities replayed from checkpoints"""
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(
+            'asof@domain.com',
+            'testpass'
+        )
+        self.stocks = Stock.objects.bulk_create([
+            Stock(user=self.user, StockNo=f'STK-{i}', Quantity=0)
+            for i in range(3)
+        ])
+        record_history(self.user, self.stocks, days=10)
+
+    def test_replays_whole_ledger_without_checkpoint(self):
+        """Test quantities are summed from the ledger start"""
+        quantities = inventory.quantities_as_of(
+            self.user, START + timedelta(days=4, hours=1)
+        )
+
+        self.assertEqual(quantities,
+                         {stock.StockNo: 5 for stock in self.stocks})
+
+    def test_checkpoint_matches_replay(self):
+        """Test as-of reads agree before and after a checkpoint"""
+        moment = START + timedelta(days=7, hours=1)
+        expected = inventory.quantities_as_of(self.user, moment)
+
+        inventory.take_checkpoint(self.user, START + timedelta(days=5))
+
+        self.assertEqual(inventory.quantities_as_of(self.user, moment),
+                         expected)
+        self.assertEqual(
+            inventory.quantities_as_of(self.user,
+                                       START + timedelta(days=2, hours=1)),
+            {stock.StockNo: 3 for stock in self.stocks}
+        )
+
+    def test_checkpoint_replays_from_previous(self):
+        """Test a checkpoint builds on the one before it"""
+        first = inventory.take_checkpoint(self.user,
+                                          START + timedelta(days=3))
+        StockMovement.objects.filter(
+            created_at__lte=first.taken_at
+        ).delete()
+
+        second = inventory.take_checkpoint(self.user,
+                                           START + timedelta(days=6))
+
+        self.assertEqual(
+            sorted(second.lines.values_list('quantity', flat=True)),
+            [7, 7, 7]
+        )
+
+    def test_checkpoint_is_idempotent(self):
+        """Test checkpointing the same moment twice keeps one"""
+        moment = START + timedelta(days=5)
+
+        inventory.take_checkpoint(self.user, moment)
+        inventory.take_checkpoint(self.user, moment)
+
+        self.assertEqual(InventoryCheckpoint.objects.count(), 1)
+
+    def test_checkpoint_not_after_lag(self):
+        """Test a checkpoint later than the lag is refused"""
+        with self.assertRaises(ValueError):
+            inventory.take_checkpoint(self.user, timezone.now())
+
+        self.assertFalse(InventoryCheckpoint.objects.exists())
+
+    def test_checkpoint_outlives_stock(self):
+        """Test a checkpoint still replays stock deleted after it"""
+        checkpoint = inventory.take_checkpoint(self.user,
+                                               START + timedelta(days=5))
+        self.stocks[0].delete()
+
+        self.assertEqual(checkpoint.lines.get(stock_no='STK-0').quantity, 6)
+        self.assertEqual(
+            inventory.stock_as_of(self.user, START + timedelta(days=6)),
+            [{'id': None, 'StockNo': 'STK-0', 'Quantity': 7},
+             {'id': self.stocks[1].id, 'StockNo': 'STK-1', 'Quantity': 7},
+             {'id': self.stocks[2].id, 'StockNo': 'STK-2', 'Quantity': 7}]
+        )
+
+    def test_empty_stock_is_left_out(self):
+        """Test stocks holding nothing at the moment are not listed"""
+        StockMovement.objects.create(
+            user=self.user,
+            stock=self.stocks[0],
+            stock_no='STK-0',
+            kind=StockMovement.Kind.PICK,
+            quantity=-10,
+            balance=0,
+            created_at=START + timedelta(days=11)
+        )
+
+        rows = inventory.stock_as_of(self.user, START + timedelta(days=12))
+
+        self.assertEqual([row['StockNo'] for row in rows],
+                         ['STK-1', 'STK-2'])
+
+    def test_parse_moment(self):
+        """Test dates mean their end and naive times the local zone"""
+        moment = inventory.parse_moment('2021-05-31')
+
+        self.assertTrue(timezone.is_aware(moment))
+        self.assertEqual((moment.day, moment.hour, moment.minute),
+                         (31, 23, 59))
+        with self.assertRaises(ValueError):
+            inventory.parse_moment('end of may')
+
+
+class StockProductTests(TestCase):
+    """Test Stock.product following the products linked to a stock"""
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(
+            'link@domain.com',
+            'testpass'
+        )
+        self.pen, self.ink = (
+            Product.objects.create(user=self.user, title=title, weight=1,
+                                   price=1)
+            for title in ('Pen', 'Ink')
+        )
+        self.stock = Stock.objects.create(user=self.user, StockNo='STK-1',
+                                          Quantity=1)
+
+    def test_follows_links(self):
+        """Test the product stays while linked and moves on once not"""
+        self.stock.products.set([self.ink, self.pen])
+        self.assertEqual(self.stock.product, self.pen)
+
+        self.stock.products.remove(self.pen)
+        self.assertEqual(self.stock.product, self.ink)
+        self.stock.products.add(self.pen)
+        self.stock.refresh_from_db()
+        self.assertEqual(self.stock.product, self.ink)
+
+        self.ink.stock_set.clear()
+        self.stock.refresh_from_db()
+        self.assertEqual(self.stock.product, self.pen)
+
+    def test_backfill_migration(self):
+        """Test the migration backfills stock linked before it"""
+        backfill = import_module('core.migrations.0021_stock_product')
+        stocks = Stock.objects.bulk_create([
+            Stock(user=self.user, StockNo=f'STK-B{i}', Quantity=1)
+            for i in range(5)
+        ])
+        Stock.products.through.objects.bulk_create([
+            Stock.products.through(stock_id=stock.id, product_id=product.id)
+            for stock in stocks[:4] for product in (self.ink, self.pen)
+        ])
+
+        with mock.patch.object(backfill, 'BATCH_SIZE', 2):
+            backfill.backfill_product(
+                apps, mock.Mock(connection=connection)
+            )
+
+        self.assertEqual(
+            list(Stock.objects.filter(pk__in=[stock.pk for stock in stocks])
+                 .order_by('pk').values_list('product_id', flat=True)),
+            [self.pen.id] * 4 + [None]
+        )
+
+
+class StockQuantityMigrationTests(TestCase):
+    """Test the migration adding the non-negative quantity constraint"""
+
+    def test_refuses_negative_quantities(self):
+        """Test stock below zero stops the migration and is listed"""
+        migration = import_module(
+            'core.migrations.0013_stock_quantity_non_negative'
+        )
+        user = get_user_model().objects.create_user(
+            'clamp@domain.com',
+            'testpass'
+        )
+        with connection.cursor() as cursor:
+            # As before the migration, dropped with the test transaction
+            cursor.execute(
+                'ALTER TABLE core_stock '
+                'DROP CONSTRAINT stock_quantity_non_negative, '
+                'DROP CONSTRAINT stock_reserved_within_quantity'
+            )
+        Stock.objects.bulk_create([
+            Stock(user=user, StockNo=f'STK-{quantity}', Quantity=quantity)
+            for quantity in (-4, 0, 6)
+        ])
+
+        with self.assertRaisesRegex(RuntimeError, r'STK--4 \(-4\)$'):
+            migration.check_negative_quantities(apps, None)
+
+        self.assertEqual(
+            sorted(Stock.objects.values_list('StockNo', 'Quantity')),
+            [('STK--4', -4), ('STK-0', 0), ('STK-6', 6)]
+        )
+
+
+class LedgerStockNoMigrationTests(TestCase):
+    """Test the migration keying the ledger by StockNo"""
+
+    def test_backfills_stock_no(self):
+        """Test ledger and checkpoint rows get the StockNo of their stock"""
+        migration = import_module('core.migrations.0028_ledger_stock_no')
+        user = get_user_model().objects.create_user(
+            'backfill@domain.com',
+            'testpass'
+        )
+        stocks = Stock.objects.bulk_create([
+            Stock(user=user, StockNo=f'STK-{i}', Quantity=0)
+            for i in range(2)
+        ])
+        record_history(user, stocks, days=2)
+        inventory.take_checkpoint(user, START + timedelta(days=1))
+        for model in (StockMovement, InventoryCheckpointLine):
+            model.objects.filter(stock=stocks[0]).update(stock_no='')
+
+        migration.backfill_stock_no(apps, mock.Mock(connection=connection))
+
+        for model in (StockMovement, InventoryCheckpointLine):
+            self.assertEqual(
+                set(model.objects.values_list('stock__StockNo',
+                                              'stock_no')),
+                {('STK-0', 'STK-0'), ('STK-1', 'STK-1')}
+            )
+
+
+@unittest.skipUnless(os.environ.get('WMS_BENCHMARK'),
+                     'set WMS_BENCHMARK=1 to run benchmarks')
+class InventoryAsOfBenchmark(TestCase):
+    """Compare as-of reads after a checkpoint on short and long ledgers"""
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(
+            'bench@domain.com',
+            'testpass'
+        )
+        self.stocks = Stock.objects.bulk_create([
+            Stock(user=self.user, StockNo=f'STK-{i}', Quantity=0)
+            for i in range(100)
+        ])
+
+    def best_time(self, moment, repeat=5):
+        """Return the best wall time of repeated as-of reads"""
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE core_stockmovement')
+        timings = []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            inventory.quantities_as_of(self.user, moment)
+            timings.append(time.perf_counter() - started)
+
+        return min(timings)
+
+    def test_cost_is_bounded_by_activity_since_checkpoint(self):
+        """Test 10x the history costs about the same after a checkpoint"""
+        record_history(self.user, self.stocks, days=10, per_day=10)
+        checkpoint = START + timedelta(days=9)
+        inventory.take_checkpoint(self.user, checkpoint)
+        short = self.best_time(checkpoint + timedelta(hours=12))
+
+        # Ten times the history before the same checkpoint
+        record_history(self.user, self.stocks, days=9, per_day=90)
+        long = self.best_time(checkpoint + timedelta(hours=12))
+        full_replay = self.best_time(checkpoint - timedelta(seconds=1))
+
+        print(f'\nas-of after checkpoint: {short:.4f}s, {long:.4f}s with '
+              f'10x the history, {full_replay:.4f}s replaying all '
+              f'{StockMovement.objects.count()} movements')
+        self.assertLess(long, short * 2)
+        self.assertLess(long * 5, full_replay)
@@ -0,0 +1,79 @@
+from importlib import import_module
+from unittest import mock
+
+from django.apps import apps
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+
+from core import numbers
+from core.models import DeliveryOrder, Stock
+
+
+class AllocateTests(TestCase):
+    """Test numbering from the database sequences"""
+
+    def setUp(self):
+        numbers._blocks.clear()
+        self.addCleanup(numbers._blocks.clear)
+
+    def test_allocate_formats_numbers(self):
+        """Test numbers are formatted with the kind's default format"""
+        first, second = numbers.allocate('deliveryorder', 2)
+
+        self.assertRegex(first, r'^DO-\d{8}$')
+        self.assertEqual(int(second[3:]), int(first[3:]) + 1)
+
+    @override_settings(WMS_NUMBERS={'stock': 'BIN/{}'})
+    def test_allocate_configured_format(self):
+        """Test the format comes from the WMS_NUMBERS setting"""
+        self.assertRegex(numbers.allocate('stock')[0], r'^BIN/\d+$')
+
+    def test_bulk_allocation_one_query(self):
+        """Test many numbers take their blocks and are checked in 2 queries"""
+        with CaptureQueriesContext(connection) as queries:
+            bulk = numbers.allocate('stock', 250)
+        with CaptureQueriesContext(connection) as cached:
+            rest = numbers.allocate('stock', 50)
+
+        self.assertEqual(len(queries), 2)
+        self.assertEqual(len(cached), 1)
+        self.assertEqual(len(set(bulk + rest)), 300)
+
+    def test_blocks_do_not_overlap(self):
+        """Test numbers stay unique when another process took a block"""
+        first = numbers.allocate('deliveryorder', 150)
+        numbers._blocks.clear()
+        second = numbers.allocate('deliveryorder', 150)
+
+        self.assertFalse(set(first) & set(second))
+
+    def test_allocate_skips_taken_numbers(self):
+        """Test a number a client already gave a row is not handed out"""
+        user = get_user_model().objects.create_user('numbers@domain.com',
+                                                    'testpass')
+        first = numbers.allocate('deliveryorder')[0]
+        taken = f'DO-{int(first[3:]) + 1:08d}'
+        DeliveryOrder.objects.create(user=user, deliveryNumber=taken,
+                                     sentFrom='Batam', sentTo='Medan',
+                                     price=1)
+
+        self.assertEqual(numbers.allocate('deliveryorder'),
+                         [f'DO-{int(first[3:]) + 2:08d}'])
+
+    def test_migration_advances_past_existing(self):
+        """Test the sequences are moved past the numbers rows hold"""
+        migration = import_module(
+            'core.migrations.0029_number_sequences_past_existing'
+        )
+        user = get_user_model().objects.create_user('numbers@domain.com',
+                                                    'testpass')
+        highest = int(numbers.allocate('stock')[0][4:]) + 5000
+        Stock.objects.create(user=user, StockNo=f'STK-{highest:08d}',
+                             Quantity=0)
+        numbers._blocks.clear()
+
+        migration.advance_sequences(apps, mock.Mock(connection=connection))
+
+        self.assertGreater(int(numbers.allocate('stock')[0][4:]), highest)
@@ -0,0 +1,62 @@
+from decimal import Decimal
+
+from django.contrib.auth import get_user_model
+from django.test import TestCase
+
+from core.models import DeliveryOrder, Product
+from core.orders import refresh_totals, set_lines
+
+
+class OrderTotalsTests(TestCase):
+    """Test delivery order totals kept in step with lines and products"""
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(
+            'orders@domain.com',
+            'testpass'
+        )
+        self.crate = Product.objects.create(user=self.user, title='Crate',
+                                            weight=Decimal('7.5'), price=10)
+        self.strap = Product.objects.create(user=self.user, title='Strap',
+                                            weight=Decimal('0.2'), price=3)
+        self.order = DeliveryOrder.objects.create(
+            user=self.user, deliveryNumber='TRN-1', sentFrom='Batam',
+            sentTo='Palembang', price=1
+        )
+
+    def totals(self):
+        """Return the stored totals of the sample order"""
+        self.order.refresh_from_db()
+
+        return self.order.total_price, self.order.total_weight
+
+    def test_set_lines(self):
+        """Test quantities multiply into the totals"""
+        self.assertEqual(set_lines(self.order, {self.crate.id: 2,
+                                                self.strap.id: 4}),
+                         (Decimal('32'), Decimal('15.8')))
+        self.assertEqual(set_lines(self.order, {self.strap.id: 1}),
+                         (Decimal('3'), Decimal('0.2')))
+        self.assertEqual(self.totals(), (Decimal('3'), Decimal('0.2')))
+
+    def test_linked_from_product_side(self):
+        """Test adding and clearing through the product updates orders"""
+        self.crate.deliveryorder_set.add(self.order)
+        self.assertEqual(self.totals(), (Decimal('10'), Decimal('7.5')))
+
+        self.crate.deliveryorder_set.clear()
+        self.assertEqual(self.totals(), (Decimal('0'), Decimal('0')))
+
+    def test_product_deleted(self):
+        """Test deleting a product takes it out of the totals"""
+        self.order.products.add(self.crate, self.strap)
+
+        self.crate.delete()
+
+        self.assertEqual(self.totals(), (Decimal('3'), Decimal('0.2')))
+
+    def test_refresh_writes_only_changes(self):
+        """Test orders whose totals are current are left untouched"""
+        self.order.products.add(self.crate)
+
+        self.assertEqual(refresh_totals([self.order.pk]), {})
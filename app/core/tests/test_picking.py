@@ -0,0 +1,213 @@
+import os
+import random
+import time
+import unittest
+
+from django.contrib.auth import get_user_model
+from django.test import TestCase
+
+from core import picking
+from core.models import (
+    DeliveryOrder, DeliveryOrderLine, Product, Stock, StockReservation
+)
+
+
+def sample_order(user, number, products=()):
+    """Create and return a delivery order holding products"""
+    order = DeliveryOrder.objects.create(
+        user=user,
+        deliveryNumber=number,
+        sentFrom='Batam',
+        sentTo='Palembang',
+        fullAddress='Jln M.Thamrin No.17 Blok C',
+        contactPerson='08213241234',
+        price=72.000
+    )
+    order.products.set(products)
+
+    return order
+
+
+class RouteTests(TestCase):
+    """Test parsing locations and ordering the walk between them"""
+
+    def test_parse_location(self):
+        """Test aisle, bay and level are read from location codes"""
+        self.assertEqual(picking.parse_location('A-01'), (1, 1, 0))
+        self.assertEqual(picking.parse_location('ab03-2'), (28, 3, 2))
+        self.assertEqual(picking.parse_location('12.07'), (12, 7, 0))
+        self.assertIsNone(picking.parse_location('Dock'))
+        self.assertIsNone(picking.parse_location(''))
+
+    def test_serpentine(self):
+        """Test aisles are walked up and down in turn"""
+        codes = ['C-01', 'A-05', 'E-09', 'A-01', 'C-02', 'C-08']
+
+        route = picking.serpentine(
+            [picking.parse_location(code) for code in codes]
+        )
+
+        self.assertEqual(
+            route,
+            [picking.parse_location(code) for code in
+             ['A-01', 'A-05', 'C-08', 'C-02', 'C-01', 'E-09']]
+        )
+
+    def test_two_opt_shortens_route(self):
+        """Test 2-opt never lengthens the serpentine walk"""
+        rng = random.Random(7)
+        stops = picking.serpentine({
+            picking.Location(rng.randint(1, 10), rng.randint(1, 40), 0)
+            for _ in range(200)
+        })
+        distance = picking.walking_distance(40)
+        start = [picking.Location(stops[0].aisle, 0, 0)]
+
+        improved = picking.two_opt(start + stops, distance)
+
+        self.assertEqual(sorted(improved), sorted(start + stops))
+        self.assertEqual(improved[0], start[0])
+        self.assertLessEqual(picking.route_length(improved, distance),
+                             picking.route_length(start + stops, distance))
+
+    def test_unparsed_locations_come_last(self):
+        """Test codes that are not locations are visited at the end"""
+        route = picking.plan_route(['Dock', 'B-01', '', 'A-01'])
+
+        self.assertEqual(route, ['A-01', 'B-01', '', 'Dock'])
+
+
+class PickListTests(TestCase):
+    """Test merging delivery orders into one pick list"""
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(
+            'picker@domain.com',
+            'testpass'
+        )
+        self.bolt = Product.objects.create(user=self.user, title='Bolt',
+                                           weight=1, price=1)
+        self.nut = Product.objects.create(user=self.user, title='Nut',
+                                          weight=1, price=1)
+        self.bolts = Stock.objects.create(user=self.user, StockNo='STK-B',
+                                          Quantity=10, Location='B-04')
+        self.bolts.products.add(self.bolt)
+        self.nuts = Stock.objects.create(user=self.user, StockNo='STK-N',
+                                         Quantity=10, Location='A-02')
+        self.nuts.products.add(self.nut)
+
+    def test_merges_orders_in_walking_order(self):
+        """Test demand is merged per stock and sorted back per order"""
+        first = sample_order(self.user, 'TRN-1', [self.bolt, self.nut])
+        second = sample_order(self.user, 'TRN-2', [self.bolt])
+
+        result = picking.pick_list(self.user, [first.id, second.id])
+
+        self.assertEqual([pick['StockNo'] for pick in result['picks']],
+                         ['STK-N', 'STK-B'])
+        bolts = result['picks'][1]
+        self.assertEqual(bolts['quantity'], 2)
+        self.assertEqual(
+            [(row['slot'], row['quantity']) for row in bolts['sort']],
+            [(1, 1), (2, 1)]
+        )
+        self.assertEqual(result['short'], [])
+
+    def test_picks_line_quantities(self):
+        """Test a line beyond one stock is picked from the next"""
+        spare = Stock.objects.create(user=self.user, StockNo='STK-B2',
+                                     Quantity=5, Location='C-01')
+        spare.products.add(self.bolt)
+        order = sample_order(self.user, 'TRN-1')
+        DeliveryOrderLine.objects.create(deliveryorder=order,
+                                         product=self.bolt, quantity=12)
+
+        result = picking.pick_list(self.user, [order.id])
+
+        self.assertEqual(
+            sorted((pick['StockNo'], pick['quantity'])
+                   for pick in result['picks']),
+            [('STK-B', 10), ('STK-B2', 2)]
+        )
+        self.assertEqual(result['short'], [])
+
+    def test_reserved_orders_pick_their_reservations(self):
+        """Test an order with reservations picks exactly those"""
+        order = sample_order(self.user, 'TRN-1', [self.bolt, self.nut])
+        StockReservation.objects.create(user=self.user,
+                                        delivery_order=order,
+                                        stock=self.bolts,
+                                        product=self.bolt,
+                                        quantity=4)
+
+        result = picking.pick_list(self.user, [order.id])
+
+        self.assertEqual(
+            [(pick['StockNo'], pick['quantity']) for pick in result['picks']],
+            [('STK-B', 4)]
+        )
+
+    def test_reports_short_products(self):
+        """Test products no stock holds are reported short"""
+        washer = Product.objects.create(user=self.user, title='Washer',
+                                        weight=1, price=1)
+        order = sample_order(self.user, 'TRN-1', [washer])
+
+        result = picking.pick_list(self.user, [order.id])
+
+        self.assertEqual(result['picks'], [])
+        self.assertEqual(result['short'],
+                         [{'delivery_order': order.id,
+                           'product': washer.id}])
+
+
+@unittest.skipUnless(os.environ.get('WMS_BENCHMARK'),
+                     'set WMS_BENCHMARK=1 to run benchmarks')
+class PickListBenchmark(TestCase):
+    """Time a pick list over 1,000 delivery orders"""
+
+    def test_thousand_orders(self):
+        """Test 1,000 orders over 2,000 locations plan well under 1s"""
+        user = get_user_model().objects.create_user(
+            'bench@domain.com',
+            'testpass'
+        )
+        products = Product.objects.bulk_create([
+            Product(user=user, title=f'Product {i}', weight=1, price=1)
+            for i in range(2000)
+        ])
+        stocks = Stock.objects.bulk_create([
+            Stock(user=user, StockNo=f'STK-{i}', Quantity=1000,
+                  Location=f'{i // 50 + 1}-{i % 50 + 1:02d}',
+                  product=product)
+            for i, product in enumerate(products)
+        ])
+        Stock.products.through.objects.bulk_create([
+            Stock.products.through(stock_id=stock.id, product_id=product.id)
+            for stock, product in zip(stocks, products)
+        ])
+        orders = DeliveryOrder.objects.bulk_create([
+            DeliveryOrder(user=user, deliveryNumber=f'TRN-{i}',
+                          sentFrom='Batam', sentTo='Palembang',
+                          fullAddress='Jln', contactPerson='0821',
+                          price=1)
+            for i in range(1000)
+        ])
+        rng = random.Random(1)
+        DeliveryOrder.products.through.objects.bulk_create([
+            DeliveryOrder.products.through(deliveryorder_id=order.id,
+                                           product_id=product.id)
+            for order in orders
+            for product in rng.sample(products, 5)
+        ])
+
+        started = time.perf_counter()
+        result = picking.pick_list(user, [order.id for order in orders])
+        elapsed = time.perf_counter() - started
+
+        print(f'\npick list of 1000 orders, {len(result["picks"])} picks '
+              f'in {elapsed:.3f}s')
+        self.assertEqual(
+            sum(pick['quantity'] for pick in result['picks']), 5000
+        )
+        self.assertLess(elapsed, 0.5)
@@ -0,0 +1,180 @@
+import os
+import random
+import time
+import unittest
+from decimal import Decimal
+
+from django.contrib.auth import get_user_model
+from django.db.models import Q
+from django.test import TestCase
+
+from core import waves
+from core.orders import refresh_totals
+from core.models import DeliveryOrder, Product, Wave
+
+
+def pending(order_id, sent_to='Palembang', lines=1, weight=1, products=()):
+    """Return a pending order to pack"""
+    return waves.PendingOrder(order_id, sent_to, lines, Decimal(weight),
+                              list(products))
+
+
+def wave_ids(packed):
+    """Return the order ids of each packed wave"""
+    return [sorted(order.id for order in wave) for wave in packed]
+
+
+class PackTests(TestCase):
+    """Test packing pending orders into waves"""
+
+    def test_splits_by_destination(self):
+        """Test a wave only holds orders to one destination"""
+        packed = waves.pack([pending(1, 'Batam'), pending(2, 'Medan'),
+                             pending(3, 'Batam')],
+                            max_lines=10, max_weight=100, max_orders=10)
+
+        self.assertEqual(wave_ids(packed), [[1, 3], [2]])
+
+    def test_respects_capacity(self):
+        """Test waves close once lines, weight or orders run out"""
+        orders = [pending(i, lines=3, weight=4) for i in range(1, 7)]
+
+        self.assertEqual(
+            wave_ids(waves.pack(orders, max_lines=6, max_weight=100,
+                                max_orders=10)),
+            [[1, 2], [3, 4], [5, 6]]
+        )
+        self.assertEqual(
+            len(waves.pack(orders, max_lines=100, max_weight=12,
+                           max_orders=10)),
+            2
+        )
+        self.assertEqual(
+            len(waves.pack(orders, max_lines=100, max_weight=100,
+                           max_orders=4)),
+            2
+        )
+
+    def test_groups_shared_products(self):
+        """Test orders picking the same products share a wave"""
+        orders = [pending(1, products=[10]), pending(2, products=[20]),
+                  pending(3, products=[10]), pending(4, products=[20])]
+
+        packed = waves.pack(orders, max_lines=2, max_weight=100,
+                            max_orders=10)
+
+        self.assertEqual(wave_ids(packed), [[1, 3], [2, 4]])
+
+    def test_oversized_order_gets_own_wave(self):
+        """Test an order over the limits alone is not dropped"""
+        packed = waves.pack([pending(1, lines=50), pending(2)],
+                            max_lines=10, max_weight=100, max_orders=10)
+
+        self.assertEqual(sorted(wave_ids(packed)), [[1], [2]])
+
+
+class PlanWavesTests(TestCase):
+    """Test planning waves from the database"""
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(
+            'waves@domain.com',
+            'testpass'
+        )
+        self.product = Product.objects.create(user=self.user, title='Crate',
+                                              weight=Decimal('7.5'), price=1)
+
+    def order(self, number, sent_to='Palembang'):
+        """Create and return an order holding the sample product"""
+        order = DeliveryOrder.objects.create(
+            user=self.user, deliveryNumber=number, sentFrom='Batam',
+            sentTo=sent_to, price=1
+        )
+        order.products.add(self.product)
+
+        return order
+
+    def test_plan_waves(self):
+        """Test pending orders are assigned and totals recorded"""
+        first = self.order('TRN-1')
+        self.order('TRN-2')
+        self.order('TRN-3', sent_to='Medan')
+
+        planned = waves.plan_waves(self.user, max_orders=5)
+
+        self.assertEqual(
+            sorted((wave.sentTo, wave.lines, wave.weight)
+                   for wave in planned),
+            [('Medan', 1, Decimal('7.5')), ('Palembang', 2, Decimal('15'))]
+        )
+        first.refresh_from_db()
+        self.assertIsNotNone(first.wave)
+        self.assertEqual(waves.plan_waves(self.user), [])
+
+    def test_closed_orders_not_planned(self):
+        """Test picked, shipped and cancelled orders stay out of waves"""
+        for number, status in (('TRN-1', 'picked'), ('TRN-2', 'shipped'),
+                               ('TRN-3', 'cancelled')):
+            DeliveryOrder.objects.filter(
+                pk=self.order(number).pk
+            ).update(status=status)
+
+        self.assertEqual(waves.plan_waves(self.user), [])
+
+    def test_plan_waves_for_destinations(self):
+        """Test planning can be limited to some destinations"""
+        self.order('TRN-1')
+        self.order('TRN-2', sent_to='Medan')
+
+        planned = waves.plan_waves(self.user, destinations=['Medan'])
+
+        self.assertEqual([wave.sentTo for wave in planned], ['Medan'])
+        self.assertEqual(
+            DeliveryOrder.objects.filter(wave__isnull=True).count(), 1
+        )
+
+
+@unittest.skipUnless(os.environ.get('WMS_BENCHMARK'),
+                     'set WMS_BENCHMARK=1 to run benchmarks')
+class PlanWavesBenchmark(TestCase):
+    """Time planning waves over 100,000 open delivery orders"""
+
+    def test_hundred_thousand_orders(self):
+        """Test 100k orders are planned within the limits in seconds"""
+        user = get_user_model().objects.create_user(
+            'bench@domain.com',
+            'testpass'
+        )
+        products = Product.objects.bulk_create([
+            Product(user=user, title=f'Product {i}',
+                    weight=Decimal(i % 40 + 1), price=1)
+            for i in range(500)
+        ])
+        rng = random.Random(1)
+        destinations = [f'City {i}' for i in range(50)]
+        orders = DeliveryOrder.objects.bulk_create([
+            DeliveryOrder(user=user, deliveryNumber=f'TRN-{i}',
+                          sentFrom='Batam', sentTo=rng.choice(destinations),
+                          price=1)
+            for i in range(100000)
+        ], batch_size=5000)
+        DeliveryOrder.products.through.objects.bulk_create([
+            DeliveryOrder.products.through(deliveryorder_id=order.id,
+                                           product_id=product.id)
+            for order in orders
+            for product in rng.sample(products, rng.randint(1, 5))
+        ], batch_size=10000)
+        refresh_totals([order.id for order in orders])
+
+        started = time.perf_counter()
+        planned = waves.plan_waves(user)
+        elapsed = time.perf_counter() - started
+
+        print(f'\n{len(planned)} waves of 100000 orders in {elapsed:.2f}s')
+        self.assertFalse(
+            DeliveryOrder.objects.filter(wave__isnull=True).exists()
+        )
+        self.assertFalse(
+            Wave.objects.filter(Q(weight__gt=1000) | Q(lines__gt=200)).exists()
+        )
+        self.assertLess(elapsed, 15)
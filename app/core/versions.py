@@ -0,0 +1,56 @@
+from django.db import connection, transaction
+from django.utils import timezone
+
+from core.models import ResourceVersion
+
+# Resources owned by a user only keep a per-user version, so a write by
+# one tenant neither invalidates nor contends with any other tenant.
+# Shared resources, tags and categories, keep a single version.
+USER_RESOURCES = ('product', 'stock', 'deliveryorder', 'wave',
+                  'stockalert')
+
+
+def resource_keys(resource, user_ids=()):
+    """Return the version keys a write to resource has to bump"""
+    if resource in USER_RESOURCES:
+        return {f'{resource}:{user_id}' for user_id in user_ids}
+
+    return {resource}
+
+
+def bump_versions(resource, user_ids=()):
+    """Bump the versions of resource once the current transaction commits
+
+    Bumping after commit means a reader can never cache the old data
+    under the new version, and the version rows are not held locked for
+    the length of the writing transaction.
+    """
+    keys = sorted(resource_keys(resource, user_ids))
+    transaction.on_commit(lambda: _bump(keys))
+
+
+def _bump(keys):
+    """Increment the versions of keys in a single upsert"""
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'''
+            INSERT INTO {ResourceVersion._meta.db_table}
+                (key, version, modified)
+            SELECT key, 1, %s FROM unnest(%s::varchar[]) AS key
+            ON CONFLICT (key) DO UPDATE SET
+                version = {ResourceVersion._meta.db_table}.version + 1,
+                modified = EXCLUDED.modified
+            ''',
+            [timezone.now(), keys]
+        )
+
+
+def get_versions(keys):
+    """Return ``{key: (version, modified)}`` for keys, unknown keys at 0"""
+    versions = {key: (0, None) for key in keys}
+    for key, version, modified in ResourceVersion.objects.filter(
+        key__in=keys
+    ).values_list('key', 'version', 'modified'):
+        versions[key] = (version, modified)
+
+    return versions
@@ -0,0 +1,150 @@
+from collections import Counter, namedtuple
+from decimal import Decimal
+
+from django.conf import settings
+from django.contrib.postgres.aggregates import ArrayAgg
+from django.db import connection, transaction
+from django.db.models import Count
+
+from core.models import DeliveryOrder, Wave
+from core.versions import bump_versions
+
+DEFAULTS = {
+    'MAX_LINES': 200,
+    'MAX_WEIGHT': 1000,
+    'MAX_ORDERS': 50,
+}
+
+PendingOrder = namedtuple('PendingOrder',
+                          ('id', 'sentTo', 'lines', 'weight', 'products'))
+
+
+class WavePlanningConflict(Exception):
+    """Another planning run assigned some of the orders first"""
+
+
+def wave_limits(**overrides):
+    """Return the wave capacity limits, overrides taking precedence"""
+    limits = {**DEFAULTS, **getattr(settings, 'WMS_WAVES', {})}
+    limits.update(
+        (name.upper(), value) for name, value in overrides.items()
+        if value is not None
+    )
+
+    return limits
+
+
+def pending_orders(user, destinations=()):
+    """Return the user's draft and allocated orders not in a wave yet
+
+    Line counts and product ids are aggregated by the database in a
+    single query, weights come from the maintained order totals.
+    """
+    orders = DeliveryOrder.objects.filter(
+        user=user,
+        wave__isnull=True,
+        status__in=(DeliveryOrder.Status.DRAFT,
+                    DeliveryOrder.Status.ALLOCATED)
+    )
+    if destinations:
+        orders = orders.filter(sentTo__in=destinations)
+
+    return [
+        PendingOrder(pk, sent_to, lines, weight or Decimal(0),
+                     [product for product in products if product])
+        for pk, sent_to, lines, weight, products in orders.order_by().annotate(
+            line_count=Count('products'),
+            product_ids=ArrayAgg('products')
+        ).values_list('pk', 'sentTo', 'line_count', 'total_weight',
+                      'product_ids')
+    ]
+
+
+def pack(orders, max_lines, max_weight, max_orders):
+    """Group orders into waves with next-fit packing
+
+    Orders are sorted by destination, then by their most widely shared
+    product so orders picking the same products land next to each other,
+    heaviest first. Each order joins the open wave when it fits and
+    opens a new one otherwise, so packing is linear after the sort. An
+    order over the limits on its own gets a wave to itself.
+    Returns a list of waves, each a list of orders.
+    """
+    popularity = Counter(
+        product for order in orders for product in order.products
+    )
+
+    def affinity(order):
+        anchor = max(order.products,
+                     key=lambda product: (popularity[product], -product),
+                     default=0)
+        return order.sentTo, -popularity[anchor], anchor, -order.weight
+
+    waves = []
+    lines = weight = 0
+    for order in sorted(orders, key=affinity):
+        current = waves[-1] if waves else None
+        if (current is None or current[0].sentTo != order.sentTo or
+                len(current) >= max_orders or
+                lines + order.lines > max_lines or
+                weight + order.weight > max_weight):
+            current = []
+            waves.append(current)
+            lines = weight = 0
+        current.append(order)
+        lines += order.lines
+        weight += order.weight
+
+    return waves
+
+
+def plan_waves(user, destinations=(), **limits):
+    """Group the user's pending delivery orders into new waves
+
+    limits may override ``max_lines``, ``max_weight`` and ``max_orders``
+    of the WMS_WAVES setting. Raises WavePlanningConflict when a
+    concurrent run assigned some of the same orders first.
+    Returns the waves created.
+    """
+    limits = wave_limits(**limits)
+    with transaction.atomic():
+        waves = pack(pending_orders(user, destinations),
+                     limits['MAX_LINES'],
+                     Decimal(limits['MAX_WEIGHT']),
+                     limits['MAX_ORDERS'])
+        if not waves:
+            return []
+
+        created = Wave.objects.bulk_create([
+            Wave(user=user,
+                 sentTo=orders[0].sentTo,
+                 lines=sum(order.lines for order in orders),
+                 weight=sum(order.weight for order in orders))
+            for orders in waves
+        ], batch_size=5000)
+        # In primary key order, so the update walks the table once
+        assignments = sorted(
+            (order.id, wave.pk)
+            for wave, orders in zip(created, waves) for order in orders
+        )
+        order_ids = [order_id for order_id, _ in assignments]
+        wave_ids = [wave_id for _, wave_id in assignments]
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'''
+                UPDATE {DeliveryOrder._meta.db_table} AS o
+                SET wave_id = w.wave_id
+                FROM unnest(%s::integer[], %s::integer[])
+                    AS w (order_id, wave_id)
+                WHERE o.id = w.order_id AND o.wave_id IS NULL
+                ''',
+                [order_ids, wave_ids]
+            )
+            if cursor.rowcount != len(order_ids):
+                raise WavePlanningConflict(
+                    'Some orders were planned by another run, try again.'
+                )
+        bump_versions('wave', [user.id])
+        bump_versions('deliveryorder', [user.id])
+
+    return created